@@ -229,7 +229,7 @@ resource "aws_lambda_function" "stream_poller_lambda" {
       MaxPollingWaitTime           = 60
       NeptuneStreamEndpoint        = "https://${var.neptune_reader_endpoint}:${var.neptune_port}/gremlin/stream"
       StreamRecordsBatchSize       = 100
-      StreamRecordsHandler         = "neptune_to_es.neptune_gremlin_es_handler.ElasticSearchGremlinHandler"
+      StreamRecordsHandler         = var.stream_records_handler
     }
   }
 
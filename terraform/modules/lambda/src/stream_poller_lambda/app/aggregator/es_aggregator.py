@@ -143,6 +143,9 @@ class ElasticSearchAggregator(Aggregator):
             record_data = record[DATA_STR]
             operation_type = record[OPERATION_STR]
 
+            # Keeping Stream position with record data. Actions use it to skip changes older than the document.
+            record_data[EVENT_ID_STR] = record[EVENT_ID_STR]
+
             # For Gremlin Usecase Operation_type will be combination of both Operation (ADD or REMOVE)
             # and Type (e, ep, vl, vp). Type is only present in Gremlin Stream Record
             if TYPE_STR in record_data:
@@ -42,6 +42,7 @@ LAST_TXN_TIMESTAMP_STR = 'lastTrxTimestamp'
 DATA_STR = 'data'
 ELEMENTS_STR = 'elements'
 ES_TYPE_STR = 'es_type'
+ES_VALUE_STR = 'es_value'
 LAST_EVENT_ID = 'lastEventId'
 TOTAL_RECORDS = 'totalRecords'
 STATEMENT_STR = 'stmt'
@@ -94,6 +95,27 @@ def split_list(ref_list, chunk_size):
     return [ref_list[i:i + chunk_size] for i in range(0, len(ref_list), chunk_size)]
 
 
+def iter_chunks(iterable, chunk_size):
+
+    """
+    Lazily split a given iterable to multiple sub-lists of given chunk size. Unlike split_list, only
+    one chunk is held in memory at a time.
+
+    :param iterable: Reference iterable to be Split
+    :param chunk_size: Maximum size for sub-list
+    :return: Python Generator object yielding sub-lists
+    """
+
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def get_wait_time(max_wait_time, last_wait_time=0):
 
     """
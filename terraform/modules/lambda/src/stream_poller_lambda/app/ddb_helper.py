@@ -23,6 +23,7 @@ from botocore.exceptions import ClientError
 import logging
 from commons import current_milli_time
 from config_provider import config_provider
+from log_helper import Payload, log_event
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -57,7 +58,8 @@ class DDBLeaseManager(object):
         try:
             self.table.put_item(Item=item_dict,
                                 ConditionExpression='attribute_not_exists(leaseKey)')
-            logger.debug("Successfully Created Lease Entry - {}".format(str(item_dict)))
+            log_event(logger, logging.DEBUG, "lease_created", "Successfully Created Lease Entry",
+                      lease=Payload(item_dict))
         except ClientError as e:
             if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
                 logger.error("Failed to put item in to {0} : error{1}".format(self.table, e))
@@ -95,8 +97,8 @@ class DDBLeaseManager(object):
                                            ':NOBODY': 'nobody'
                                            },
                 ReturnValues="ALL_NEW")
-            logger.debug("Successfully Taken Lease for leaseKey - {}, leaseOwner - {}. Lease - {}"
-                         .format(str(item_dict['leaseKey']), str(item_dict['leaseOwner']), str(response["Attributes"])))
+            log_event(logger, logging.DEBUG, "lease_taken", "Successfully Taken Lease", lease_key=item_dict['leaseKey'],
+                      lease_owner=item_dict['leaseOwner'], lease=Payload(response["Attributes"]))
             return response["Attributes"]
         except ClientError as e:
             if e.response['Error']['Code'] == "ConditionalCheckFailedException":
@@ -127,7 +129,8 @@ class DDBLeaseManager(object):
                                            ':lastUpdateTimeVal': current_milli_time()
                                            },
                 ReturnValues="ALL_NEW")
-            logger.debug("Successfully Updated Lease - {}".format(str(response["Attributes"])))
+            log_event(logger, logging.DEBUG, "lease_updated", "Successfully Updated Lease",
+                      lease=Payload(response["Attributes"]))
             return response["Attributes"]
         except ClientError as e:
             if e.response['Error']['Code'] == "ConditionalCheckFailedException":
@@ -154,7 +157,8 @@ class DDBLeaseManager(object):
                                            ':leaseOwnerVal': item_dict['leaseOwner']
                                            },
                 ReturnValues="ALL_NEW")
-            logger.debug("Successfully Evicted Lease - {}".format(str(response["Attributes"])))
+            log_event(logger, logging.DEBUG, "lease_evicted", "Successfully Evicted Lease",
+                      lease=Payload(response["Attributes"]))
             return response["Attributes"]
         except ClientError as e:
             if e.response['Error']['Code'] == "ConditionalCheckFailedException":
@@ -162,6 +166,25 @@ class DDBLeaseManager(object):
             else:
                 raise
 
+    def get_state(self, state_key):
+
+        """
+        Returns state item for a given key Ex: progress of a maintenance task. State items are stored in lease
+        table next to lease items, but are not leases.
+        """
+
+        response = self.table.get_item(Key={'leaseKey': state_key}, ConsistentRead=True)
+        return response.get('Item')
+
+    def put_state(self, item_dict=None):
+
+        """
+        Creates or replaces a state item. State is only written by lease owner, so no conditional check is needed.
+        """
+
+        self.table.put_item(Item=item_dict)
+        log_event(logger, logging.DEBUG, "state_saved", "Successfully Saved State", state=Payload(item_dict))
+
     def delete_all_items_in_lease_table(self):
 
         """
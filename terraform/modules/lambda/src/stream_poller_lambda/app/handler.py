@@ -28,16 +28,18 @@ class HandlerResponse:
     """
     Model for Storing Handler Response.
 
-    This Class has three attributes:
+    This Class has four attributes:
     last_op_num - Op_num for last stream record processed
     last_commit_num - Commit number for last stream record processed
     records_processed - Number of Stream Records Processed
+    records_dropped - Dict of drop reason to number of Stream Records dropped instead of being replicated
     """
 
-    def __init__(self, last_op_num, last_commit_num, records_processed):
+    def __init__(self, last_op_num, last_commit_num, records_processed, records_dropped=None):
         self.last_op_num = last_op_num
         self.last_commit_num = last_commit_num
         self.records_processed = records_processed
+        self.records_dropped = records_dropped or {}
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -58,3 +60,16 @@ class AbstractHandler:
         :return: Returns Python Generator object wrapped around HandlerResponse using yield statement
         """
         pass
+
+    def run_maintenance(self, lease, state_store, read_records, execution_end_time):
+
+        """
+        Hook to run maintenance tasks Ex: reindex, while lease is held & before Stream records are polled.
+        Default implementation does nothing.
+
+        :param lease: Lease object with checkpoint of last processed Stream record
+        :param state_store: Store to persist maintenance state across Lambda invocations i.e. DDBLeaseManager
+        :param read_records: Function to read Stream records after a given (limit, commit_num, op_num)
+        :param execution_end_time: Time in milliseconds by which maintenance should return
+        """
+        pass
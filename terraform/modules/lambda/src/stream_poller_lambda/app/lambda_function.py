@@ -67,10 +67,11 @@ def lambda_handler(event, context):
     This is invoked when Lambda is called.
     This lambda function do below steps sequentially:
     1. Take Lease
-    2. Poll for records from Stream until no records or 90% of Lambda Execution time is reached
-    3. Stream records are passed to appropriate handlers. If no records are found lambda exists &
+    2. Run handler maintenance tasks Ex: reindex
+    3. Poll for records from Stream until no records or 90% of Lambda Execution time is reached
+    4. Stream records are passed to appropriate handlers. If no records are found lambda exists &
      pass wait_time to state machine
-    4. Metrics are published to Cloud watch
+    5. Metrics are published to Cloud watch
     """
 
     lease = get_or_create_lease()
@@ -82,6 +83,8 @@ def lambda_handler(event, context):
     execution_end_time = current_milli_time() + int(round(0.9 * config_provider.max_polling_interval * 1000))
     wait_time = event['iterator']['wait_time']
     try:
+        stream_records_processor.run_maintenance(lease, lease_manager, execution_end_time)
+
         while current_milli_time() < execution_end_time:
             # case when no more records are present in stream
             if not stream_records_processor.process_with_metrics(lease, lease_manager, metrics_publisher_client):
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import collections
+import reprlib
+
+from config_provider import config_provider
+
+# Repetitive events Ex: dropped records, are logged on first occurrence & then once every LogSampleRate occurrences
+LOG_SAMPLE_RATE = max(int(config_provider.get_handler_additional_param('LogSampleRate', 100)), 1)
+
+# Maximum number of characters of payloads Ex: bulk actions, stream records, written to logs
+LOG_PAYLOAD_MAX_LENGTH = int(config_provider.get_handler_additional_param('LogPayloadMaxLength', 2000))
+
+# Payloads are summarised by reprlib, so that large payloads aren't fully converted to string before being truncated
+__payload_repr__ = reprlib.Repr()
+__payload_repr__.maxlevel = 6
+__payload_repr__.maxlist = __payload_repr__.maxtuple = __payload_repr__.maxset = 20
+__payload_repr__.maxdict = 50
+__payload_repr__.maxstring = __payload_repr__.maxother = 500
+
+
+class Payload:
+
+    """
+    Payload written to logs, converted to string only if log message is emitted. Nested collections & long strings
+    are elided & the result is truncated to LogPayloadMaxLength characters.
+    """
+
+    def __init__(self, value, max_length=LOG_PAYLOAD_MAX_LENGTH):
+        self.value = value
+        self.max_length = max_length
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else __payload_repr__.repr(self.value)
+        if len(text) > self.max_length:
+            return "{}...({} characters truncated)".format(text[:self.max_length], len(text) - self.max_length)
+        return text
+
+
+class StructuredMessage:
+
+    """
+    Log message with event name & key value fields, rendered only if log message is emitted.
+    Ex: Dropping Record - event=record_dropped, reason=excluded_property, record={...}
+    """
+
+    def __init__(self, message, event, **fields):
+        self.message = message
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        fields = ", ".join("{}={}".format(key, value) for key, value in self.fields.items())
+        return "{} - event={}{}".format(self.message, self.event, ", " + fields if fields else "")
+
+
+def log_event(logger, level, event, message, **fields):
+
+    """
+    Logs a structured message if logger is enabled for level. Field values are only converted to string when the
+    message is emitted; wrap large values in Payload to cap their size.
+
+    :param logger: Logger
+    :param level: Logging level Ex: logging.DEBUG
+    :param event: Event name Ex: bulk_completed
+    :param message: Human readable message
+    :param fields: Key value fields of event
+    """
+
+    if logger.isEnabledFor(level):
+        logger.log(level, StructuredMessage(message, event, **fields))
+
+
+class LogSampler:
+
+    """
+    Logs repetitive events Ex: a dropped record, on first occurrence & then once every sample_rate occurrences of
+    the same event, with count of occurrences so far. Nothing is counted or formatted if logger is not enabled for
+    level.
+    """
+
+    def __init__(self, sample_rate=LOG_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.occurrences = collections.Counter()
+
+    def log(self, logger, level, event, message, **fields):
+
+        """
+        Logs a structured message for a sampled occurrence of event, if logger is enabled for level.
+
+        :param logger: Logger
+        :param level: Logging level Ex: logging.DEBUG
+        :param event: Event name, occurrences are sampled per event Ex: record_dropped.excluded_property
+        :param message: Human readable message
+        :param fields: Key value fields of event
+        """
+
+        if not logger.isEnabledFor(level):
+            return
+        self.occurrences[event] += 1
+        occurrences = self.occurrences[event]
+        if (occurrences - 1) % self.sample_rate == 0:
+            logger.log(level, StructuredMessage(message, event, occurrences=occurrences, **fields))
@@ -32,15 +32,17 @@ class MetricsPublisher:
     """
     Generate and publish Cloud Watch metrics for Neptune Stream Poller.
     Metrics are data about the performance of systems which in turn help in detailed monitoring.
-    For Stream Poller, system is publishing data for two key metrics:
+    For Stream Poller, system is publishing data for three key metrics:
 
     Number of Records Processed - This metric capture how many records from Neptune Stream are
                                   successfully processed per unit of time. This Metric can
                                   be used to analyse Throughput.
     Lag Time for Stream Poller - This metric capture by how many milliseconds Stream poller is lagging  behind
                                  the latest commit on Neptune Source Instance.
+    Number of Records Dropped - This metric capture how many records from Neptune Stream are dropped instead of
+                                being replicated, per drop reason Ex: excluded_property.
 
-    Both the Metrics are Published to AWS Cloud Watch using Metrics Publisher Class.
+    All the Metrics are Published to AWS Cloud Watch using Metrics Publisher Class.
     """
 
     def __init__(self):
@@ -92,6 +94,18 @@ class MetricsPublisher:
         return self.__generate_metrics__(str(config_provider.application_name) + ' - Stream Records Processed',
                                          'Neptune Stream', config_provider.neptune_stream_endpoint, 'Count', int(count))
 
+    def generate_records_dropped_metrics(self, reason, count):
+
+        """
+        Generates metrics for number of stream records dropped instead of being replicated, for a drop reason
+        :param reason: Reason records are dropped for Ex: excluded_property
+        :param count: Count of number of records dropped
+        :return: Cloud watch Metrics object
+        """
+
+        return self.__generate_metrics__(str(config_provider.application_name) + ' - Stream Records Dropped',
+                                         'Drop Reason', reason, 'Count', int(count))
+
     def generate_stream_lag_metrics(self, time_in_millis):
 
         """
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+
+import os
+import abc
+import six
+import json
+import logging
+import importlib
+
+from config_provider import config_provider
+from log_helper import log_event
+from neptune_to_es import es_helper
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Json file with fraud rules. Relative path is resolved against Lambda app directory. Empty disables alerts.
+# Ex: {"rules": [{"id": "high_amount", "description": "...", "query": {...}}]}
+ALERT_RULES_FILE = config_provider.get_handler_additional_param('AlertRulesFile', '')
+
+# Sink alerts are published to, as class name with module
+ALERT_SINK = config_provider.get_handler_additional_param('AlertSink',
+                                                          'neptune_to_es.alert_percolator.LoggingAlertSink')
+
+# Index storing rules as percolator queries. Named within Neptune index pattern, so that mapping updates for new
+# predicates are applied to it as well.
+ALERT_RULES_INDEX = es_helper.INDEX + "_alert_rules"
+
+# Field storing percolator query of a rule
+QUERY_FIELD = "query"
+
+
+@six.add_metaclass(abc.ABCMeta)
+class AbstractAlertSink:
+
+    """
+    Sink fraud alerts raised while replicating Stream records are published to.
+    """
+
+    @abc.abstractmethod
+    def publish(self, alerts):
+
+        """
+        Publishes alerts.
+
+        :param alerts: List of alerts. Each alert has rule_id, description, document_id & document
+        """
+        pass
+
+
+class LoggingAlertSink(AbstractAlertSink):
+
+    """
+    Writes alerts to Lambda log.
+    """
+
+    def publish(self, alerts):
+        for alert in alerts:
+            logger.warning("Fraud alert - rule: {}, document: {}, entity: {}".format(
+                alert["rule_id"], alert["document_id"],
+                alert["document"].get(es_helper.ElasticSearchDocumentFields.ENTITY_ID.value)))
+
+
+def __get_sink_instance__(sink_name):
+
+    """
+    Get Sink instance given a sink name with module
+
+    :param sink_name: the sink class name with module.
+    :return: Sink instance
+    """
+
+    parts = sink_name.rsplit('.', 1)
+    return getattr(importlib.import_module(parts[0]), parts[1])()
+
+
+def load_alert_rules(rules_file=ALERT_RULES_FILE):
+
+    """
+    Loads fraud rules. Relative file path is resolved against Lambda app directory.
+
+    :param rules_file: Json file with rules
+    :return: List of rules. Empty if no rules file is configured.
+    """
+
+    if not rules_file:
+        return []
+    if not os.path.isabs(rules_file):
+        rules_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), rules_file)
+
+    with open(rules_file) as rules:
+        return json.load(rules).get("rules", [])
+
+
+class AlertPercolator:
+
+    """
+    Raises fraud alerts as documents change. Rules are registered as percolator queries & documents changed by
+    each bulk request are percolated against them, so detection latency follows replication latency & cost
+    scales with number of changes instead of index size.
+
+    Changed documents are fetched by id after bulk request, as scripted updates don't return updated documents.
+    Each change of a matching document raises an alert again, deduplication is left to sink.
+    """
+
+    def __init__(self, rules=None, sink=None):
+        self.rules = load_alert_rules() if rules is None else rules
+        self.sink = sink or (__get_sink_instance__(ALERT_SINK) if self.rules else None)
+
+    def register_rules(self, es_client, mappings):
+
+        """
+        Creates rules index if not present & registers configured rules. Rules no longer configured are removed.
+
+        :param es_client: Elastic Search Client
+        :param mappings: Default index mappings. Rules index needs mappings of fields rules query.
+        """
+
+        if not self.rules:
+            return
+
+        if not es_client.indices.exists(index=ALERT_RULES_INDEX):
+            rules_mappings = es_helper.merge_live_index_mappings(es_client, mappings)
+            rules_mappings["properties"].update({
+                QUERY_FIELD: {"type": "percolator"},
+                "rule_id": {"type": "keyword"},
+                "description": {"type": "text"}
+            })
+            es_client.indices.create(index=ALERT_RULES_INDEX, body={
+                "settings": {"number_of_shards": 1, "number_of_replicas": es_helper.NO_OF_REPLICA},
+                "mappings": rules_mappings
+            })
+            logger.info("Created alert rules index - {}".format(ALERT_RULES_INDEX))
+
+        for rule in self.rules:
+            es_client.index(index=ALERT_RULES_INDEX, doc_type="_doc", id=rule["id"], body={
+                QUERY_FIELD: rule["query"],
+                "rule_id": rule["id"],
+                "description": rule.get("description", "")
+            })
+        es_client.delete_by_query(index=ALERT_RULES_INDEX, conflicts="proceed", refresh=True, body={
+            "query": {"bool": {"must_not": {"ids": {"values": [rule["id"] for rule in self.rules]}}}}
+        })
+
+    def percolate(self, es_client, actions):
+
+        """
+        Percolates documents changed by executed actions against rules & publishes matches to sink.
+
+        :param es_client: Elastic Search Client
+        :param actions: Executed Elastic Search Bulk API actions
+        """
+
+        if not self.rules:
+            return
+
+        # Documents written through alias are read from write index, as alias can point to multiple indices
+        write_index = None
+        documents = {}
+        for action in actions:
+            if not action["_index"].startswith(es_helper.INDEX) or action["_index"] == ALERT_RULES_INDEX \
+                    or action["_op_type"] == "delete":
+                continue
+            if action["_index"] == es_helper.INDEX:
+                write_index = write_index or es_helper.get_aliased_index(es_client)
+            document = {"_index": write_index if action["_index"] == es_helper.INDEX else action["_index"],
+                        "_id": action["_id"]}
+            if action.get("routing"):
+                document["routing"] = action["routing"]
+            # Same id can be present in separate indices Ex: routed indices
+            documents[(document["_index"], action["_id"])] = document
+        if not documents:
+            return
+
+        changed = [doc for doc in es_client.mget(body={"docs": list(documents.values())})["docs"]
+                   if doc.get("found")]
+        if not changed:
+            return
+
+        response = es_client.search(index=ALERT_RULES_INDEX, body={
+            "query": {
+                "percolate": {
+                    "field": QUERY_FIELD,
+                    "documents": [doc["_source"] for doc in changed]
+                }
+            },
+            "_source": ["rule_id", "description"],
+            "size": len(self.rules)
+        })
+
+        alerts = []
+        for hit in response["hits"]["hits"]:
+            for slot in hit.get("fields", {}).get("_percolator_document_slot", [0]):
+                alerts.append({
+                    "rule_id": hit["_source"]["rule_id"],
+                    "description": hit["_source"].get("description", ""),
+                    "document_id": changed[slot]["_id"],
+                    "document": changed[slot]["_source"]
+                })
+
+        if alerts:
+            log_event(logger, logging.INFO, "alerts_raised", "Percolated changed documents",
+                      documents=len(changed), alerts=len(alerts))
+            self.sink.publish(alerts)
@@ -20,13 +20,34 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import re
+import math
+import time
 import datetime
-from dateutil.parser import parse
+import numpy as np
 from decimal import Decimal
-from neptune_to_es.es_helper import DataType, is_str_represents_valid_integer_value
+from neptune_to_es.es_helper import DataType, is_str_represents_valid_integer_value, get_date_time_from_millis, \
+    parse_date
 
 lang_regex = re.compile(r"^[a-zA-Z]{1,8}(-[a-zA-Z0-9]{1,8})*$")
 
+# Values of string ES datatypes
+STRING_DATATYPES = {DataType.STRING.value, DataType.TEXT.value, DataType.KEYWORD.value}
+
+# Lower case string values coerced to boolean true
+TRUE_STRINGS = {'true', '"true"', '1', '1.0'}
+
+# Range of epoch milliseconds converted to dates as NumPy arrays i.e. years 1 to 9999 supported by datetime. First
+# day of year 1 is left out, as datetime.fromtimestamp rejects it.
+MIN_EPOCH_MILLIS = -62135510400000
+MAX_EPOCH_MILLIS = 253402300799999
+
+# Integers up to this magnitude are exact as float64. Larger longs are converted per element.
+MAX_EXACT_FLOAT_INTEGER = 2 ** 53
+
+# Epoch milliseconds are converted to local time per element, so NumPy conversion which is in UTC is only used when
+# local time is UTC, as it is in Lambda.
+LOCAL_TIME_IS_UTC = time.timezone == 0 and not time.daylight
+
 
 def validate(value, es_datatype):
     """
@@ -38,7 +59,7 @@ def validate(value, es_datatype):
     """
     if value is None:
         return False
-    elif es_datatype == DataType.STRING.value or es_datatype == DataType.TEXT.value:
+    elif es_datatype in {DataType.STRING.value, DataType.TEXT.value, DataType.KEYWORD.value}:
         return True
     elif es_datatype not in es_type_to_validator:
         return False
@@ -129,6 +150,7 @@ def validate_double(value):
     1) if value is of type bool - invalid
     2) if value is of type date/datetime - invalid
     3) if float conversion of value result in TypeError or ValueError - invalid
+    4) if value is NaN or Infinity - invalid
 
     Ex:
     123 - valid
@@ -148,14 +170,11 @@ def validate_double(value):
         return False
 
     try:
-        if float(value) or float(value) == 0.0:
-            # for float(0.0) this code path is not reached, as 0.0 is false in python
-            return True
+        # NaN & Infinity can't be indexed
+        return math.isfinite(float(value))
     except (TypeError, ValueError):
         return False
 
-    return False
-
 
 def validate_long(value):
     """
@@ -237,7 +256,7 @@ def validate_date(value):
             # integer can be converted to epoch time
             if type(value) == int or (isinstance(value, str) and is_str_represents_valid_integer_value(value)):
                 return True
-            parse(str(value), False)
+            parse_date(str(value))
             return True
         except ValueError:
             return False
@@ -249,3 +268,201 @@ es_type_to_validator = {
      'long': validate_long,
      'geo_point': validate_geopoint
 }
+
+
+class InvalidValue:
+
+    """
+    Result of coercing a value which can't be stored with ES datatype.
+
+    This Class has one attribute:
+    reason - Reason value is dropped for
+    """
+
+    def __init__(self, reason):
+        self.reason = reason
+
+
+def __exact_integer__(value, number):
+
+    """
+    Converts integral value to int. Integers, Decimals & integer strings are converted exactly, as float isn't exact
+    above 2^53.
+
+    :param value: Integral predicate value
+    :param number: Value as float
+    :return: Integer
+    """
+
+    if isinstance(value, (int, Decimal)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return int(number)
+
+
+def coerce(value, es_datatype, epoch_date=False):
+
+    """
+    Validates a predicate value against an ES datatype & converts it to ES format in a single pass, so that value is
+    parsed once. Result is same as validate followed by convert_to_es_value.
+
+    :param value: Predicate value
+    :param es_datatype: ES datatype value is coerced to
+    :param epoch_date: True if value is a Gremlin date in epoch milliseconds. It is validated as ISO string.
+    :return: Value in ES format, InvalidValue if value can't be stored with ES datatype
+    """
+
+    if value is None:
+        return InvalidValue("value is null")
+    if es_datatype in STRING_DATATYPES:
+        return str(value)
+    if epoch_date and es_datatype != DataType.DATE.value:
+        return InvalidValue("date can't be stored as {}".format(es_datatype))
+
+    if es_datatype == DataType.DOUBLE.value:
+        if type(value) == bool or isinstance(value, datetime.date):
+            return InvalidValue("{} isn't a number".format(type(value).__name__))
+        try:
+            number = float(value)
+        except (TypeError, ValueError, OverflowError):
+            return InvalidValue("value isn't a number")
+        # NaN & Infinity can't be indexed
+        return number if math.isfinite(number) else InvalidValue("number isn't finite")
+
+    if es_datatype == DataType.LONG.value:
+        if type(value) == bool or isinstance(value, datetime.date):
+            return InvalidValue("{} isn't a number".format(type(value).__name__))
+        try:
+            if isinstance(value, Decimal) and value % 1 != 0:
+                return InvalidValue("number isn't an integer")
+            number = float(value)
+        except (TypeError, ValueError, ArithmeticError):
+            return InvalidValue("value isn't a number")
+        if isinstance(value, (float, str)) and not number.is_integer():
+            return InvalidValue("number isn't an integer")
+        try:
+            integer = __exact_integer__(value, number)
+        except (ValueError, OverflowError):
+            return InvalidValue("number isn't finite")
+        return integer if integer.bit_length() <= 63 else InvalidValue("number is out of long range")
+
+    if es_datatype == DataType.DATE.value:
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        if type(value) == float:
+            return InvalidValue("float isn't a date")
+        # Integers & other values representing an integer are epoch milliseconds
+        try:
+            epoch_millis = float(value) if type(value) != bool and float(value).is_integer() else None
+        except (TypeError, ValueError, OverflowError):
+            epoch_millis = None
+        if epoch_millis is None or not isinstance(value, (int, str)):
+            try:
+                date_value = parse_date(str(value))
+            except (ValueError, OverflowError):
+                return InvalidValue("value isn't a date")
+            if epoch_millis is None:
+                return date_value.isoformat("T", "milliseconds")
+        try:
+            return get_date_time_from_millis(value if type(value) == int else epoch_millis)
+        except (ValueError, OverflowError, OSError):
+            return InvalidValue("epoch time is out of date range")
+
+    if es_datatype == DataType.BOOLEAN.value:
+        if not validate_boolean(value):
+            return InvalidValue("value isn't a boolean")
+        return value if type(value) == bool else str(value).lower() in TRUE_STRINGS
+
+    if es_datatype == DataType.GEO_POINT.value:
+        return value if isinstance(value, str) and validate_geopoint(value) else InvalidValue("value isn't a geo point")
+
+    return InvalidValue("datatype {} isn't supported".format(es_datatype))
+
+
+def __convert_numbers__(numbers, es_datatype):
+
+    """
+    Validates & converts numbers to ES datatype as a NumPy array.
+
+    :param numbers: NumPy float array
+    :param es_datatype: ES datatype Ex: double, long, date (epoch milliseconds)
+    :return: Tuple of (NumPy boolean array of numbers converted, List of converted values). Numbers not converted are
+             to be coerced per element.
+    """
+
+    finite = np.isfinite(numbers)
+    if es_datatype == DataType.DOUBLE.value:
+        return finite, numbers.tolist()
+
+    integral = finite & (np.floor(np.where(finite, numbers, 0.0)) == numbers)
+    if es_datatype == DataType.LONG.value:
+        # Strings of larger integers may have been rounded when read as float
+        converted = integral & (np.abs(np.where(integral, numbers, 0.0)) < MAX_EXACT_FLOAT_INTEGER)
+        return converted, np.where(converted, numbers, 0.0).astype(np.int64).tolist()
+
+    converted = integral & (numbers >= MIN_EPOCH_MILLIS) & (numbers <= MAX_EPOCH_MILLIS)
+    dates = np.where(converted, numbers, 0.0).astype(np.int64).astype("datetime64[ms]")
+    return converted, np.datetime_as_string(dates, unit="ms").tolist()
+
+
+def coerce_batch(values, es_datatype, epoch_dates=False):
+
+    """
+    Coerces a batch of predicate values with same ES datatype to ES format. Numeric values & strings of double, long
+    & epoch date values are handled together as NumPy arrays, except integers of long values which are kept as is.
+    Remaining values Ex: outliers, are coerced per element, with same result.
+
+    :param values: List of predicate values
+    :param es_datatype: ES datatype values are coerced to
+    :param epoch_dates: True if values are Gremlin dates in epoch milliseconds. Those are validated as ISO strings.
+    :return: List of values in ES format. InvalidValue for values which can't be stored with ES datatype.
+    """
+
+    coerced_values = [None] * len(values)
+    pending_positions = range(len(values))
+
+    if epoch_dates:
+        vectorised = es_datatype == DataType.DATE.value and LOCAL_TIME_IS_UTC
+    else:
+        vectorised = es_datatype in {DataType.DOUBLE.value, DataType.LONG.value}
+    if vectorised:
+        pending_positions = []
+        numeric_positions, string_positions = [], []
+        for position, value in enumerate(values):
+            if type(value) == int and es_datatype == DataType.LONG.value:
+                # Integers are longs already, float isn't exact above 2^53
+                if value.bit_length() <= 63:
+                    coerced_values[position] = value
+                else:
+                    pending_positions.append(position)
+            elif type(value) == int or (type(value) == float and es_datatype != DataType.DATE.value):
+                # Floats are never dates
+                numeric_positions.append(position)
+            elif type(value) == str and es_datatype != DataType.DATE.value:
+                string_positions.append(position)
+            else:
+                pending_positions.append(position)
+
+        for positions in [numeric_positions, string_positions]:
+            if not positions:
+                continue
+            try:
+                numbers = np.asarray([values[position] for position in positions], dtype=np.float64)
+            except (TypeError, ValueError, OverflowError):
+                pending_positions.extend(positions)
+                continue
+            converted, converted_numbers = __convert_numbers__(numbers, es_datatype)
+            for position, is_converted, converted_number in zip(positions, converted.tolist(), converted_numbers):
+                if is_converted:
+                    coerced_values[position] = converted_number
+                else:
+                    pending_positions.append(position)
+
+    for position in pending_positions:
+        coerced_values[position] = coerce(values[position], es_datatype, epoch_dates)
+
+    return coerced_values
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+
+import json
+import logging
+import requests
+from enum import Enum
+from urllib.parse import urlparse
+from elasticsearch.helpers import bulk
+
+from commons import *
+import neptune_sigv4_signer
+from config_provider import config_provider
+from neptune_to_es import es_helper
+from neptune_to_es.es_helper import ElasticSearchDocumentFields, DocumentType
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Backfill of from_id / to_id for edge documents indexed before they were stored. Enabled by default.
+EDGE_ENDPOINT_BACKFILL = config_provider.get_handler_additional_param('EdgeEndpointBackfill', 'true') != 'false'
+
+# Number of edge documents backfilled per Neptune query & bulk request
+EDGE_BACKFILL_BATCH_SIZE = int(config_provider.get_handler_additional_param('EdgeBackfillBatchSize', 500))
+
+# Suffix of lease table key storing backfill progress for application
+EDGE_BACKFILL_STATE_KEY_SUFFIX = "_edge_backfill"
+
+# Time in milliseconds kept free for a backfill batch before execution end time
+EDGE_BACKFILL_BATCH_TIME = 10000
+
+# Neptune Gremlin query returning end vertex ids of edges. Results are requested as GraphSON 1.0, so that maps are
+# returned as plain Json objects.
+EDGE_ENDPOINTS_QUERY = 'g.E({}).project("id","from","to").by(T.id).by(outV().id()).by(inV().id())'
+GRAPHSON_V1_MIME_TYPE = "application/vnd.gremlin-v1.0+json"
+
+
+class EdgeBackfillStatus(Enum):
+
+    """
+    Status of edge endpoint backfill stored in lease table.
+    """
+
+    # Edge documents without from_id are being backfilled in entity id order
+    RUNNING = "running"
+
+    # All edge documents were visited
+    COMPLETED = "completed"
+
+
+def __groovy_string__(value):
+
+    """
+    Generates Groovy string literal for a value. "$" is escaped to avoid string interpolation & single quote is
+    escaped as signed query string replaces it.
+
+    :param value: String value
+    :return: Groovy string literal
+    """
+
+    return json.dumps(value).replace("$", "\\$").replace("'", "\\u0027")
+
+
+def query_edge_endpoints(edge_ids):
+
+    """
+    Queries from & to vertex ids of edges from Neptune. Gremlin endpoint is derived from Stream endpoint.
+
+    :param edge_ids: List of edge ids
+    :return: Dict of edge id to (from vertex id, to vertex id). Edges not present in Neptune are left out.
+    """
+
+    endpoint = config_provider.neptune_stream_endpoint.rsplit("/stream", 1)[0]
+    payload = {"gremlin": EDGE_ENDPOINTS_QUERY.format(",".join(__groovy_string__(edge_id) for edge_id in edge_ids))}
+    headers = {"Accept": GRAPHSON_V1_MIME_TYPE}
+
+    # Adding Authentication headers for IAM Auth Enabled Cluster
+    if config_provider.iam_auth_enabled_on_source_stream:
+        headers.update(neptune_sigv4_signer.get_signed_header(urlparse(endpoint).netloc, 'GET', 'gremlin', payload))
+
+    # Query string is encoded the same way it is signed
+    with requests.get(endpoint + "?" + neptune_sigv4_signer.urlencode_payload(payload), headers=headers) as response:
+        if response.status_code != 200:
+            raise Exception("Error Occurred while querying edges from Neptune. - {}".format(response.text))
+        return {str(edge["id"]): (str(edge["from"]), str(edge["to"])) for edge in response.json()["result"]["data"]}
+
+
+class EdgeEndpointBackfill:
+
+    """
+    Adds from_id / to_id to edge documents indexed before end vertex ids were stored, so that adjacency lookups
+    Ex: edges going out from a vertex can be served from Elastic Search alone. New edges get them from Stream
+    records.
+
+    Edge documents without from_id are visited in entity id order in batches. End vertex ids of a batch are queried
+    from Neptune with a single Gremlin query & written with a partial document update. Edges no longer present in
+    Neptune are left as is & are removed by their Stream records.
+
+    Backfill only runs once index alias points to index of configured index version, as documents written to an
+    index being built by reindex are not copied. Progress is stored in lease table, so that backfill can resume
+    in next Lambda invocation.
+    """
+
+    def __init__(self, es_client, state_store, query_endpoints=query_edge_endpoints):
+        self.es_client = es_client
+        self.state_store = state_store
+        self.query_endpoints = query_endpoints
+        self.state_key = config_provider.application_name + EDGE_BACKFILL_STATE_KEY_SUFFIX
+
+    def run(self, execution_end_time):
+
+        """
+        Starts or resumes backfill.
+
+        :param execution_end_time: Time in milliseconds by which backfill should return
+        """
+
+        if not EDGE_ENDPOINT_BACKFILL:
+            return
+
+        state = self.state_store.get_state(self.state_key)
+        if state and state["status"] == EdgeBackfillStatus.COMPLETED.value:
+            return
+
+        if es_helper.get_index_version(es_helper.get_aliased_index(self.es_client, use_cache=False)) \
+                < es_helper.INDEX_VERSION:
+            logger.info("Edge endpoint backfill is waiting for reindex to complete")
+            return
+
+        state = state or {"leaseKey": self.state_key, "lastEntityId": ""}
+        while execution_end_time - current_milli_time() > EDGE_BACKFILL_BATCH_TIME:
+            if not self.__backfill_batch__(state):
+                self.__save_state__(state, EdgeBackfillStatus.COMPLETED)
+                logger.info("Completed edge endpoint backfill")
+                return
+            self.__save_state__(state, EdgeBackfillStatus.RUNNING)
+
+    def __save_state__(self, state, status):
+
+        """
+        Saves backfill progress in lease table.
+
+        :param state: Backfill state item
+        :param status: EdgeBackfillStatus
+        """
+
+        state["status"] = status.value
+        state["lastUpdateTime"] = current_milli_time()
+        self.state_store.put_state(state)
+
+    def __backfill_batch__(self, state):
+
+        """
+        Backfills next batch of edge documents after last visited entity id.
+
+        :param state: Backfill state item
+        :return: False if no edge documents are left to backfill
+        """
+
+        body = {
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"term": {ElasticSearchDocumentFields.DOCUMENT_TYPE.value: DocumentType.EDGE.value}}
+                    ],
+                    "must_not": [
+                        {"exists": {"field": ElasticSearchDocumentFields.FROM_ID.value}}
+                    ]
+                }
+            },
+            "_source": [ElasticSearchDocumentFields.ENTITY_ID.value],
+            "sort": [{ElasticSearchDocumentFields.ENTITY_ID.value + ".keyword": {"order": "asc"}}],
+            "size": EDGE_BACKFILL_BATCH_SIZE
+        }
+        if state["lastEntityId"]:
+            body["search_after"] = [state["lastEntityId"]]
+
+        hits = self.es_client.search(index=es_helper.INDEX, body=body)["hits"]["hits"]
+        if not hits or hits[-1]["sort"][0] is None:
+            return False
+
+        edge_endpoints = self.query_endpoints([hit["_source"][ElasticSearchDocumentFields.ENTITY_ID.value]
+                                               for hit in hits])
+        actions = []
+        for hit in hits:
+            endpoints = edge_endpoints.get(hit["_source"][ElasticSearchDocumentFields.ENTITY_ID.value])
+            if endpoints:
+                action = {
+                    "_op_type": "update",
+                    "_type": "_doc",
+                    "_index": hit["_index"],
+                    "_id": hit["_id"],
+                    "doc": {
+                        ElasticSearchDocumentFields.FROM_ID.value: endpoints[0],
+                        ElasticSearchDocumentFields.TO_ID.value: endpoints[1]
+                    }
+                }
+                if hit.get("_routing"):
+                    action["routing"] = hit["_routing"]
+                actions.append(action)
+
+        if actions:
+            # Documents deleted by Stream records in the meantime are ignored
+            success, errors = bulk(self.es_client, actions, raise_on_error=False)
+            logger.info("Backfilled end vertex ids of {} edge documents. Skipped: {}"
+                        .format(success, len(hits) - success))
+
+        state["lastEntityId"] = hits[-1]["sort"][0]
+        return True
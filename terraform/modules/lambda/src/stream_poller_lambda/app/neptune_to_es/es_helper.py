@@ -24,16 +24,24 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 Helper File to help setup Elastic Search Cluster
 """
 
+import os
+import re
+import copy
+import json
 import logging
 import hashlib
 import datetime
+import functools
 from dateutil.parser import parse, ParserError
 from datetime import datetime as dt
 
 from packaging import version
+from cachetools import TTLCache
+from elasticsearch.exceptions import RequestError
 from commons import *
 from enum import Enum
 from config_provider import config_provider, set_config_provider
+from log_helper import Payload, log_event
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -45,13 +53,52 @@ NO_OF_REPLICA = int(config_provider.get_handler_additional_param('NumberOfReplic
 GEO_LOCATION_FIELDS = config_provider.get_handler_additional_param('GeoLocationFields', '')
 DATATYPES_TO_EXCLUDE = config_provider.get_handler_additional_param('DatatypesToExclude', '')
 PROPERTIES_TO_EXCLUDE = config_provider.get_handler_additional_param('PropertiesToExclude', '')
+MAPPING_CACHE_TTL = int(config_provider.get_handler_additional_param('MappingCacheTTL', 300))
+INDEX_SCHEMA_FILE = config_provider.get_handler_additional_param('IndexSchemaFile', 'index_schema.json')
+PROPERTY_INDEX_PROFILES = config_provider.get_handler_additional_param('PropertyIndexProfiles', '')
+INDEX_VERSION = int(config_provider.get_handler_additional_param('IndexVersion', 1))
+# Shard routing strategy of documents. With from_vertex, vertices are routed by vertex id & edges by from vertex id.
+EDGE_ROUTING = config_provider.get_handler_additional_param('EdgeRouting', 'none')
+FROM_VERTEX_ROUTING = "from_vertex"
+# Json file with feature vector spec of vertices. Relative path is resolved against Lambda app directory. k-NN is
+# enabled on indices created while it is set.
+FEATURE_VECTOR_FILE = config_provider.get_handler_additional_param('FeatureVectorFile', '')
 OPEN_SEARCH_DISTRIBUTION = "opensearch"
 
 # Elastic Search Model Literals
+# Documents are read & written through INDEX alias, which points to a versioned concrete index Ex: amazon_neptune_v1.
+# Mapping updates are applied using index pattern, so that an index being built by reindex gets them too.
 INDEX = "amazon_neptune"
+MAPPING_INDEX_PATTERN = INDEX + "*"
+VERSIONED_INDEX_PATTERN = re.compile(r"^" + INDEX + r"_v(\d+)$")
 VERTEX_ID_Prefix = "v://"
 EDGE_ID_PREFIX = "e://"
 
+# Index mappings cache with TTL. Cache is shared by all Stream batches & warm Lambda invocations
+# of the process instead of reading mappings from cluster state for every batch.
+_index_mapping_cache = TTLCache(maxsize=1, ttl=MAPPING_CACHE_TTL)   # TTL is in Seconds
+
+# Concrete write index behind INDEX alias, cached like mappings. Alias only moves on reindex swap.
+_aliased_index_cache = TTLCache(maxsize=1, ttl=MAPPING_CACHE_TTL)   # TTL is in Seconds
+
+# ISO-8601 extended format dates & date times parsed without dateutil
+# Ex: 2003-09-25, 2003-09-25T10:49:41.123Z, 2003-09-25 10:49+05:30
+ISO_DATE_PATTERN = re.compile(r"^(\d{4})-(\d{2})-(\d{2})"
+                              r"(?:[T ](\d{2})(?::(\d{2})(?::(\d{2})(?:[.,](\d+))?)?)?"
+                              r"(Z|[+-]\d{2}(?::?\d{2})?)?)?$")
+
+# Number of parsed date strings memoised. Repeated values Ex: dates without time are parsed once.
+DATE_CACHE_SIZE = 10000
+
+# Flag to make sure geo location fields mapping is checked only once per process.
+_geo_location_mapping_added = False
+
+# Flag to make sure flattened predicates mapping is checked only once per process.
+_flattened_predicates_mapping_added = False
+
+# Index profiles configured for properties. Parsed once per process.
+_property_index_profiles = None
+
 # Lists of valid types for SPARQL and Gremlin
 VALID_SPARQL_TYPES = {"string", "boolean", "float", "double", "datetime", "byte", "int", "long", "short",
                       "date", "decimal", "integer", "nonnegativeinteger", "nonpositiveinteger", "negativeinteger",
@@ -105,6 +152,7 @@ class DataType(Enum):
     BOOLEAN = "boolean"
     DATE = "date"
     TEXT = "text"
+    KEYWORD = "keyword"
     DECIMAL = "decimal"
     INTEGER = "int"
 
@@ -143,6 +191,29 @@ datatypeMapping = {
 }
 
 
+class IndexProfile(Enum):
+
+    """
+    Index options which can be set per property using PropertyIndexProfiles config value.
+    Ex: card4:keyword,TransactionDT:no_index,TransactionDT:no_doc_values,deviceInfo:ignore_above=64
+    """
+
+    # String values are mapped as keyword only & are not analyzed
+    KEYWORD = "keyword"
+
+    # String values are mapped as text only, without keyword sub field
+    TEXT = "text"
+
+    # Values are not indexed & can't be searched
+    NO_INDEX = "no_index"
+
+    # Doc values are not stored. Values can't be sorted or aggregated on.
+    NO_DOC_VALUES = "no_doc_values"
+
+    # Maximum length of string values indexed as keyword
+    IGNORE_ABOVE = "ignore_above"
+
+
 class DocumentType(Enum):
 
     """
@@ -179,6 +250,42 @@ class ElasticSearchDocumentFields(Enum):
     # Nested Field for storing predicates corresponding to Graph vertex / Edge.
     PREDICATES = "predicates"
 
+    # Stream position (commit_num, op_num) of the last change applied to the document. Used to drop
+    # changes which are older than what document already reflects.
+    STREAM_POSITION = "stream_position"
+
+    # Nested Field storing predicates as typed key/value entries when flattened document layout is used.
+    # Ex: {"key": "amount", "datatype": "Double", "double_value": 10.5}
+    FLATTENED_PREDICATES = "flattened_predicates"
+
+    # Specific to Gremlin edge documents. Id of the vertex edge goes out from. Also used for routing edge documents
+    # to shard of their from vertex.
+    FROM_ID = "from_id"
+
+    # Specific to Gremlin edge documents. Id of the vertex edge goes in to.
+    TO_ID = "to_id"
+
+    # Specific to Gremlin vertex documents. Summary of edges per direction (out/ in) & edge label, with ids of
+    # edges, ids of vertices on other end & degree. Ex: {"out": {"uses": {"edges": ["e1"], "neighbours": ["d1"],
+    # "degree": 1}}}
+    ADJACENCY = "adjacency"
+
+    # Specific to Gremlin vertex documents. Id & size of ring i.e. connected component over ring edge labels
+    # vertex belongs to.
+    RING_ID = "ring_id"
+    RING_SIZE = "ring_size"
+
+    # Specific to Gremlin vertex documents. Sum of weights of fraud rules vertex matches & ids of those rules.
+    FRAUD_SCORE = "fraud_score"
+    FRAUD_RULES = "fraud_rules"
+
+    # Specific to Gremlin vertex documents. knn_vector of normalised numeric & one-hot encoded categorical properties.
+    FEATURE_VECTOR = "feature_vector"
+
+    # Specific to Gremlin vertex documents. Canonical keywords derived from selected properties per property
+    # Ex: {"deviceInfo": {"value": ["samsung sm-g892a build/nrd90m"], "vendor": ["samsung"], "model": ["sm-g892a"]}}
+    FINGERPRINTS = "fingerprints"
+
     """
     Predicate Value Nested Object Fields
     """
@@ -201,7 +308,46 @@ class ElasticSearchDocumentFields(Enum):
 # Default Index Mapping. Dynamic Templates make sure datatype, graph, language fields present in
 # nested object for predicate are not analyzed.
 MAPPINGS = {
+    "properties": {
+        "from_id": {
+            "type": "keyword"
+        },
+        "to_id": {
+            "type": "keyword"
+        },
+        "ring_id": {
+            "type": "keyword"
+        },
+        "ring_size": {
+            "type": "long"
+        },
+        "fraud_score": {
+            "type": "float"
+        },
+        "fraud_rules": {
+            "type": "keyword"
+        },
+        "stream_position": {
+            "properties": {
+                "commit_num": {
+                    "type": "long"
+                },
+                "op_num": {
+                    "type": "long"
+                }
+            }
+        }
+    },
     "dynamic_templates": [
+        {
+            "adjacency": {
+                "path_match": "adjacency.*",
+                "match_mapping_type": "string",
+                "mapping": {
+                    "type": "keyword"
+                }
+            }
+        },
         {
             "datatype": {
                 "path_match": "predicates.*.datatype",
@@ -246,6 +392,55 @@ MAPPINGS = {
     ]
 }
 
+# Value field of a flattened predicate entry for each ES datatype. Values are stored in the field matching their
+# type, so that one fixed mapping can hold any number of distinct properties.
+FLATTENED_VALUE_FIELDS = {
+    DataType.STRING.value: "string_value",
+    DataType.LONG.value: "long_value",
+    DataType.DOUBLE.value: "double_value",
+    DataType.DATE.value: "date_value",
+    DataType.BOOLEAN.value: "boolean_value",
+    DataType.GEO_POINT.value: "geo_point_value"
+}
+
+# Fixed mapping for flattened predicates. Mapping size doesn't grow with number of distinct properties in graph
+# and no put_mapping is needed for new properties.
+FLATTENED_PREDICATES_MAPPING = {
+    "type": "nested",
+    "properties": {
+        "key": {
+            "type": "keyword"
+        },
+        "datatype": {
+            "type": "keyword"
+        },
+        "string_value": {
+            "type": "text",
+            "fields": {
+                "keyword": {
+                    "type": "keyword",
+                    "ignore_above": 256
+                }
+            }
+        },
+        "long_value": {
+            "type": "long"
+        },
+        "double_value": {
+            "type": "double"
+        },
+        "date_value": {
+            "type": "date"
+        },
+        "boolean_value": {
+            "type": "boolean"
+        },
+        "geo_point_value": {
+            "type": "geo_point"
+        }
+    }
+}
+
 def is_valid_float_value(str):
     """
     Checks if string contains valid float value
@@ -265,7 +460,51 @@ def get_date_time_from_millis(time_in_millis):
     :return: Date time String in ISO format
     """
 
-    return dt.fromtimestamp(time_in_millis / 1000.0).isoformat("T", "milliseconds")
+    # Milliseconds are split off before conversion, as division isn't exact for large values
+    seconds, millis = divmod(time_in_millis, 1000)
+    return dt.fromtimestamp(seconds).replace(microsecond=int(millis) * 1000).isoformat("T", "milliseconds")
+
+
+def __parse_iso_date__(match):
+
+    """
+    Builds datetime from ISO-8601 date pattern match.
+
+    :param match: ISO_DATE_PATTERN match
+    :return: datetime, timezone aware if match has a timezone
+    """
+
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    tzinfo = None
+    if zone == "Z":
+        tzinfo = datetime.timezone.utc
+    elif zone:
+        offset = datetime.timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]) if len(zone) > 3 else 0)
+        tzinfo = datetime.timezone(-offset if zone[0] == "-" else offset)
+    return dt(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+              int(fraction[:6].ljust(6, "0")) if fraction else 0, tzinfo)
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(date_str):
+
+    """
+    Parses a date string. ISO-8601 dates & date times are parsed with a precompiled pattern. Other formats
+    Ex: "Sep-25-2003", fall back to dateutil, which is much slower. Parsed dates are memoised.
+
+    :param date_str: Date string
+    :return: datetime
+    :raises ValueError: if string isn't a date
+    """
+
+    match = ISO_DATE_PATTERN.match(date_str)
+    if match:
+        try:
+            return __parse_iso_date__(match)
+        except ValueError:
+            # Out of range fields Ex: 2003-02-30 are left to dateutil
+            pass
+    return parse(date_str)
 
 
 def __index_settings__():
@@ -276,10 +515,14 @@ def __index_settings__():
     :return: Index Settings
     """
 
-    return {
+    settings = {
         "number_of_shards": NO_OF_SHARDS,
         "number_of_replicas": NO_OF_REPLICA
     }
+    if FEATURE_VECTOR_FILE:
+        # Approximate k-NN search on knn_vector fields needs k-NN enabled at index creation
+        settings["knn"] = True
+    return settings
 
 
 def add_geo_location_mapping(es_client, es_index_mapping_cache):
@@ -295,6 +538,53 @@ def add_geo_location_mapping(es_client, es_index_mapping_cache):
             es_index_mapping_cache = add_mapping_to_es(es_client, es_index_mapping_cache, gp_property, "geo_point")
 
 
+def ensure_geo_location_mapping(es_client):
+
+    """
+    Add geo location fields custom mapping for index once per process. Geo location fields are configured
+    with deployment so there is no need to check them for every Stream batch.
+
+    :param es_client: Elastic Search Client
+    """
+
+    global _geo_location_mapping_added
+    if not _geo_location_mapping_added:
+        add_geo_location_mapping(es_client, get_index_mapping(es_client))
+        _geo_location_mapping_added = True
+
+
+def get_index_mapping(es_client):
+
+    """
+    Returns mappings for Neptune index from cache. Mappings are fetched from Elastic Search only if
+    not present in cache or cached value has expired. Cached value is kept up to date by add_mapping_to_es.
+
+    :param es_client: Elastic Search Client
+    :return: Dict of index mappings
+    """
+
+    index_mapping = _index_mapping_cache.get(INDEX)
+    if index_mapping is None:
+        # Response is keyed by concrete index names alias points to. Mappings of write index are
+        # keyed by alias in cache.
+        mappings = es_client.indices.get_mapping(index=INDEX)
+        write_index = get_aliased_index(es_client) if len(mappings) > 1 else next(iter(mappings), None)
+        index_mapping = {INDEX: mappings[write_index]} if write_index else mappings
+        _index_mapping_cache[INDEX] = index_mapping
+    return index_mapping
+
+
+def invalidate_index_mapping():
+
+    """
+    Drops cached mappings & write index for Neptune index. Should be called when cached mappings are found to be
+    out of sync with Elastic Search Ex: put_mapping failing with illegal_argument_exception, or alias is moved.
+    """
+
+    _index_mapping_cache.clear()
+    _aliased_index_cache.clear()
+
+
 def get_geopoint_properties():
 
     """
@@ -388,23 +678,302 @@ def validate_es_version(es_client):
             str(es_version)))
 
 
-def create_index(es_client, index_name):
+def load_index_schema():
+
+    """
+    Loads index schema compiled from Neptune bulk load CSV headers by schema_compiler. Relative file path is resolved
+    against Lambda app directory.
+
+    :return: Dict of predicate key to Neptune datatype. Empty if schema file is not present.
+    """
+
+    schema_file = INDEX_SCHEMA_FILE
+    if not schema_file:
+        return {}
+    if not os.path.isabs(schema_file):
+        schema_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), schema_file)
+    if not os.path.isfile(schema_file):
+        logger.info("Index schema file - {} not found. Mappings will be created on the fly".format(schema_file))
+        return {}
+
+    with open(schema_file) as schema:
+        return json.load(schema).get(ElasticSearchDocumentFields.PREDICATES.value, {})
+
+
+def get_index_mappings():
 
     """
-    Creates Elastic Search Index with specific Mappings & Settings if not already present
+    Generates index mappings with explicit mappings for predicates declared in index schema, so that types aren't
+    discovered one field at a time while replicating Stream records. Excluded properties & datatypes are skipped and
+    geo location fields are mapped to geo_point.
+
+    :return: Dict of index mappings
+    """
+
+    excluded_properties = get_excluded_properties()
+    excluded_types = get_excluded_datatypes("gremlin")
+    geo_location_fields = set(get_geopoint_properties())
+
+    predicate_mappings = {}
+    for key, datatype in load_index_schema().items():
+        if key in excluded_properties or datatype in excluded_types:
+            continue
+        if key in geo_location_fields:
+            datatype = DataType.GEO_POINT.value
+        predicate_mappings[key] = get_local_mapping_for_predicate(datatype, key)
+
+    mappings = copy.deepcopy(MAPPINGS)
+    if predicate_mappings:
+        mappings["properties"][ElasticSearchDocumentFields.PREDICATES.value] = {"properties": predicate_mappings}
+    return add_routing_meta(mappings)
+
+
+def get_flattened_index_mappings():
+
+    """
+    Generates index mappings for flattened document layout. Predicates are stored as typed key/value entries with a
+    fixed mapping, so index schema compiled from CSV headers is not applied.
+
+    :return: Dict of index mappings
+    """
+
+    mappings = copy.deepcopy(MAPPINGS)
+    mappings["properties"][ElasticSearchDocumentFields.FLATTENED_PREDICATES.value] = \
+        copy.deepcopy(FLATTENED_PREDICATES_MAPPING)
+    return add_routing_meta(mappings)
+
+
+def add_routing_meta(mappings):
+
+    """
+    Records shard routing strategy in index mappings metadata. Routing of a document can't change once it is
+    indexed, so routing is only applied to indices created with it.
+
+    :param mappings: Dict of index mappings
+    :return: Dict of index mappings
+    """
+
+    if EDGE_ROUTING == FROM_VERTEX_ROUTING:
+        mappings.setdefault("_meta", {})["routing"] = FROM_VERTEX_ROUTING
+    return mappings
+
+
+def is_routed_by_from_vertex(es_client):
+
+    """
+    Checks if documents of write index are routed by from vertex id.
+
+    :param es_client: Elastic Search Client
+    :return: True if write index was created with from_vertex routing
+    """
+
+    index_mappings = get_index_mapping(es_client)[INDEX]["mappings"]
+    return index_mappings.get("_meta", {}).get("routing") == FROM_VERTEX_ROUTING
+
+
+def ensure_flattened_predicates_mapping(es_client):
+
+    """
+    Add flattened predicates mapping to index once per process. Needed when index was created before flattened
+    document layout was selected, as dynamic mapping would map entries as plain objects instead of nested ones.
+
+    :param es_client: Elastic Search Client
+    """
+
+    global _flattened_predicates_mapping_added
+    if not _flattened_predicates_mapping_added:
+        es_client.indices.put_mapping(index=MAPPING_INDEX_PATTERN,
+                                      doc_type='_doc',
+                                      include_type_name=True,
+                                      body={
+                                          "properties": {
+                                              ElasticSearchDocumentFields.FLATTENED_PREDICATES.value:
+                                                  FLATTENED_PREDICATES_MAPPING
+                                          }
+                                      })
+        _flattened_predicates_mapping_added = True
+
+
+def get_flattened_value_field(es_type):
+
+    """
+    Returns value field of a flattened predicate entry used for given ES datatype.
+
+    :param es_type: ES datatype string
+    :return: Value field name
+    """
+
+    return FLATTENED_VALUE_FIELDS.get(es_type, FLATTENED_VALUE_FIELDS[DataType.STRING.value])
+
+
+def get_flattened_predicate_query(key, value_query=None):
+
+    """
+    Generates query matching documents having a flattened predicate entry with given key. Key & value conditions
+    are wrapped in a nested query, so that both of them are matched against the same entry.
+
+    :param key: Predicate key
+    :param value_query: Optional query on value fields of the entry
+    :return: Elastic Search query Dict
+    """
+
+    field = ElasticSearchDocumentFields.FLATTENED_PREDICATES.value
+    must = [{"term": {"{}.key".format(field): key}}]
+    if value_query:
+        must.append(value_query)
+
+    return {
+        "nested": {
+            "path": field,
+            "query": {
+                "bool": {
+                    "must": must
+                }
+            }
+        }
+    }
+
+
+def get_flattened_term_query(key, value, es_type=DataType.STRING.value):
+
+    """
+    Generates query matching documents where flattened predicate with given key has given value.
+    String values are matched exactly using keyword sub field.
+
+    :param key: Predicate key
+    :param value: Predicate value
+    :param es_type: ES datatype of value
+    :return: Elastic Search query Dict
+    """
+
+    value_field = "{}.{}".format(ElasticSearchDocumentFields.FLATTENED_PREDICATES.value,
+                                 get_flattened_value_field(es_type))
+    if es_type == DataType.STRING.value:
+        value_field += ".keyword"
+
+    return get_flattened_predicate_query(key, {"term": {value_field: value}})
+
+
+def get_flattened_range_query(key, es_type, **bounds):
+
+    """
+    Generates query matching documents where flattened predicate with given key has value within given bounds.
+
+    :param key: Predicate key
+    :param es_type: ES datatype of value Ex: long, double, date
+    :param bounds: Range bounds Ex: gte=10, lt=20
+    :return: Elastic Search query Dict
+    """
+
+    value_field = "{}.{}".format(ElasticSearchDocumentFields.FLATTENED_PREDICATES.value,
+                                 get_flattened_value_field(es_type))
+
+    return get_flattened_predicate_query(key, {"range": {value_field: bounds}})
+
+
+def get_versioned_index_name(index_version):
+
+    """
+    Generates name of concrete index for given index version.
+
+    :param index_version: Index version
+    :return: Concrete index name Ex: amazon_neptune_v1
+    """
+
+    return "{}_v{}".format(INDEX, index_version)
+
+
+def get_index_version(index_name):
+
+    """
+    Returns version of a concrete index. Index named same as alias was created before indices were versioned
+    & is considered version 1 i.e. default IndexVersion, so that it is only rebuilt when IndexVersion is bumped.
+
+    :param index_name: Concrete index name
+    :return: Index version
+    """
+
+    match = VERSIONED_INDEX_PATTERN.match(index_name)
+    return int(match.group(1)) if match else 1
+
+
+def get_aliased_index(es_client, use_cache=True):
+
+    """
+    Returns concrete index documents are currently written to through alias. Alias can point to multiple indices
+    when documents are routed to separate indices, in which case write index is returned. Index is cached for
+    mapping cache TTL, as it is looked up on every Stream batch.
+
+    :param es_client: Elastic Search Client
+    :param use_cache: Whether cached index can be returned. Alias is always read when False.
+    :return: Concrete index name, INDEX itself if it is a concrete index
+    """
+
+    aliased_index = _aliased_index_cache.get(INDEX) if use_cache else None
+    if aliased_index is None:
+        aliased_index = __read_aliased_index__(es_client)
+        _aliased_index_cache[INDEX] = aliased_index
+    return aliased_index
+
+
+def __read_aliased_index__(es_client):
+
+    """
+    Reads concrete write index behind INDEX alias from Elastic Search.
+
+    :param es_client: Elastic Search Client
+    :return: Concrete index name, INDEX itself if it is a concrete index
+    """
+
+    if not es_client.indices.exists_alias(name=INDEX):
+        return INDEX
+
+    aliased_indices = es_client.indices.get_alias(name=INDEX)
+    for index_name, index_aliases in aliased_indices.items():
+        if index_aliases["aliases"][INDEX].get("is_write_index"):
+            return index_name
+    return next(iter(aliased_indices))
+
+
+def merge_live_index_mappings(es_client, mappings):
+
+    """
+    Generates mappings for a new index from given mappings & mappings of live index. Mappings of live index take
+    precedence, so that predicates mapped so far keep their types in new index.
+
+    :param es_client: Elastic Search Client
+    :param mappings: Default index mappings
+    :return: Dict of index mappings
+    """
+
+    mappings = copy.deepcopy(mappings)
+    live_mappings = get_index_mapping(es_client)[INDEX]["mappings"]
+    mappings.setdefault("properties", {}).update(copy.deepcopy(live_mappings.get("properties", {})))
+    return mappings
+
+
+def create_index(es_client, index_name, mappings=None):
+
+    """
+    Creates Elastic Search Index with specific Mappings & Settings if not already present.
+    Concrete index is created for configured index version & is referenced using index name as alias.
 
 
     :param es_client:  Elastic Search Client
-    :param index_name: Elastic Search Index name
+    :param index_name: Elastic Search Index alias name
+    :param mappings: Index mappings. Defaults to predicate mappings with index schema applied.
     """
 
     if es_client.indices.exists(index=index_name):
         logger.info("Elastic Search Index - {} already exist".format(index_name))
     else:
+        concrete_index_name = "{}_v{}".format(index_name, INDEX_VERSION)
         body = {"settings": __index_settings__()}
-        body["mappings"] = MAPPINGS
-        es_client.indices.create(index=index_name, body=body)
-        logger.info("Created index - {} Successfully with mapping - {}".format(index_name, str(body)))
+        body["mappings"] = mappings if mappings else get_index_mappings()
+        body["aliases"] = {index_name: {"is_write_index": True}}
+        es_client.indices.create(index=concrete_index_name, body=body)
+        log_event(logger, logging.INFO, "index_created", "Created index Successfully", index=concrete_index_name,
+                  alias=index_name, body=Payload(body))
 
 
 def generate_es_document_id(record_data):
@@ -440,28 +1009,88 @@ def add_mapping_to_es(es_client, index_mapping_cache, field_name, field_type=Dat
     :param field_type:
     :return:
     """
-    es_client.indices.put_mapping(index='amazon_neptune',
+    es_client.indices.put_mapping(index=MAPPING_INDEX_PATTERN,
                                   doc_type='_doc',
                                   include_type_name=True,
                                   body=get_es_mapping_for_predicate(field_name, field_type))
 
+    return __add_local_mapping__(index_mapping_cache, field_name, field_type)
+
+
+def add_mappings_to_es(es_client, index_mapping_cache, field_types):
+
+    """
+    Adds mappings for multiple predicates using a single put_mapping request, instead of one cluster state
+    update per predicate.
+
+    Elastic Search rejects the whole request if any of the fields conflicts with an existing mapping. In that case
+    mappings are refreshed & fields still missing a mapping are added one by one so that conflicts are
+    reported per field. Fields with conflicting type are left without mapping in the returned cache.
+
+    :param es_client: Elastic Search Client
+    :param index_mapping_cache: Locally cached dict of index mappings
+    :param field_types: Ordered Dict of predicate key to Stream record datatype string
+    :return: Updated dict of index mappings
+    """
+
+    if not field_types:
+        return index_mapping_cache
+
+    try:
+        es_client.indices.put_mapping(index=MAPPING_INDEX_PATTERN,
+                                      doc_type='_doc',
+                                      include_type_name=True,
+                                      body=get_es_mapping_for_predicates(field_types))
+        for field_name, field_type in field_types.items():
+            index_mapping_cache = __add_local_mapping__(index_mapping_cache, field_name, field_type)
+        return index_mapping_cache
+    except RequestError as e:
+        if e.error != "illegal_argument_exception":
+            raise e
+        log_event(logger, logging.DEBUG, "mapping_conflict",
+                  "Concurrency issue detected! Property mapping with conflicting type already exists in index. "
+                  "Refreshing mappings", error=Payload(e))
+
+    invalidate_index_mapping()
+    index_mapping_cache = get_index_mapping(es_client)
+    for field_name, field_type in field_types.items():
+        if get_current_mapping_for_predicate(field_name, index_mapping_cache):
+            continue
+        try:
+            index_mapping_cache = add_mapping_to_es(es_client, index_mapping_cache, field_name, field_type)
+        except RequestError as e:
+            if e.error == "illegal_argument_exception":
+                log_event(logger, logging.DEBUG, "mapping_conflict",
+                          "Concurrency issue detected! Property mapping with conflicting type already exists in index",
+                          field=field_name, error=Payload(e))
+            else:
+                raise e
+
+    return index_mapping_cache
+
+
+def __add_local_mapping__(index_mapping_cache, field_name, field_type):
+
+    """
+    Adds mapping for a predicate to locally cached index mappings.
+
+    :param index_mapping_cache: Locally cached dict of index mappings
+    :param field_name: Stream record property key string
+    :param field_type: Stream record property datatype string
+    :return: Updated dict of index mappings
+    """
+
     if not index_mapping_cache:
         index_mapping_cache = {}
 
-    local_mapping = get_local_mapping_for_predicate(field_type)
-    try:
-        index_mapping_cache["amazon_neptune"]["mappings"]["properties"]["predicates"]["properties"][field_name] \
-            = local_mapping
-    except KeyError:
-        index_mapping_cache["amazon_neptune"]["mappings"]["properties"] = {
-            "predicates": {
-                "properties": {
-                    field_name: local_mapping
-                }
-            }
-        }
+    local_mapping = get_local_mapping_for_predicate(field_type, field_name)
+    # Missing levels are created without replacing other fields mapped so far
+    index_properties = index_mapping_cache.setdefault(INDEX, {}).setdefault("mappings", {}) \
+        .setdefault("properties", {})
+    index_properties.setdefault("predicates", {}).setdefault("properties", {})[field_name] = local_mapping
 
-    logger.debug("Added new mapping for field - {}, mapping - {}".format(field_name, str(local_mapping)))
+    log_event(logger, logging.DEBUG, "mapping_added", "Added new mapping", field=field_name,
+              mapping=Payload(local_mapping))
     return index_mapping_cache
 
 
@@ -500,7 +1129,30 @@ def get_es_mapping_for_predicate(record_key, record_type):
         "properties": {
             "predicates": {
                 "properties": {
-                    record_key: get_local_mapping_for_predicate(record_type)
+                    record_key: get_local_mapping_for_predicate(record_type, record_key)
+                }
+            }
+        }
+    }
+
+
+def get_es_mapping_for_predicates(field_types):
+
+    """
+    Generates new index type mapping for multiple predicates based on given predicate keys and datatypes.
+
+    Provides full mapping hierarchy for fields to satisfy format required by ElasticSearch Put Mapping API.
+
+    :param field_types: Dict of Stream record property key to datatype string
+    :return: Dict of mappings
+    """
+
+    return {
+        "properties": {
+            "predicates": {
+                "properties": {
+                    record_key: get_local_mapping_for_predicate(record_type, record_key)
+                    for record_key, record_type in field_types.items()
                 }
             }
         }
@@ -532,7 +1184,7 @@ def get_local_mapping_for_string_predicate():
     }
 
 
-def get_local_mapping_for_predicate(record_type):
+def get_local_mapping_for_predicate(record_type, record_key=None):
 
     """
     Generates new index type mapping for local index, based on given predicate datatype.
@@ -540,21 +1192,96 @@ def get_local_mapping_for_predicate(record_type):
     Provides base mapping value to be inserted with predicate key into local mapping cache.
 
     :param record_type: Stream record property datatype string
+    :param record_key: Stream record property key string. Index profile configured for property is applied if given.
     :return: Dict of mappings
     """
 
     es_type = get_es_type_for_neptune_type(record_type)
 
     if es_type == DataType.STRING.value:
-        return get_local_mapping_for_string_predicate()
-
-    return {
-        "properties": {
-            "value": {
-                "type": es_type
+        mapping = get_local_mapping_for_string_predicate()
+    else:
+        mapping = {
+            "properties": {
+                "value": {
+                    "type": es_type
+                }
             }
         }
-    }
+
+    profile = get_property_index_profiles().get(record_key)
+    if profile:
+        mapping["properties"]["value"] = apply_index_profile(mapping["properties"]["value"], profile)
+    return mapping
+
+
+def get_property_index_profiles():
+
+    """
+    Generates index profiles configured for properties. Config value is a comma separated list of
+    property:option pairs, a property can be listed multiple times to combine options.
+    Ex: card4:keyword,TransactionDT:no_index,TransactionDT:no_doc_values,deviceInfo:ignore_above=64
+
+    :return: Dict of property name to dict of index profile options
+    """
+
+    global _property_index_profiles
+    if _property_index_profiles is not None:
+        return _property_index_profiles
+
+    profiles = {}
+    for entry in PROPERTY_INDEX_PROFILES.split(","):
+        if ":" not in entry:
+            continue
+        field, option = entry.rsplit(":", 1)
+        option_name, _, option_value = option.strip().lower().partition("=")
+        try:
+            profile_option = IndexProfile(option_name)
+            profiles.setdefault(field.strip(), {})[profile_option] = \
+                int(option_value) if profile_option == IndexProfile.IGNORE_ABOVE else True
+        except ValueError:
+            logger.warning("Ignoring invalid index profile - {} for property - {}".format(option, field))
+
+    _property_index_profiles = profiles
+    return profiles
+
+
+def apply_index_profile(value_mapping, profile):
+
+    """
+    Applies index profile options to mapping of predicate value. String specific options (keyword, text,
+    ignore_above) are ignored for other datatypes. Geo points are always indexed.
+
+    :param value_mapping: Mapping of predicate value Ex: {"type": "long"}
+    :param profile: Dict of index profile options
+    :return: Updated mapping of predicate value
+    """
+
+    if value_mapping["type"] == DataType.TEXT.value:
+        if IndexProfile.KEYWORD in profile:
+            value_mapping = {"type": DataType.KEYWORD.value, "ignore_above": 256}
+        elif IndexProfile.TEXT in profile:
+            value_mapping.pop("fields", None)
+
+    keyword_mapping = value_mapping if value_mapping["type"] == DataType.KEYWORD.value \
+        else value_mapping.get("fields", {}).get("keyword")
+
+    if IndexProfile.IGNORE_ABOVE in profile and keyword_mapping is not None:
+        keyword_mapping["ignore_above"] = profile[IndexProfile.IGNORE_ABOVE]
+
+    if IndexProfile.NO_INDEX in profile and value_mapping["type"] != DataType.GEO_POINT.value:
+        value_mapping["index"] = False
+        if keyword_mapping is not None:
+            keyword_mapping["index"] = False
+
+    # Text fields don't have doc values, so option applies to keyword sub field only.
+    if IndexProfile.NO_DOC_VALUES in profile:
+        if keyword_mapping is not None:
+            keyword_mapping["doc_values"] = False
+        elif value_mapping["type"] not in {DataType.TEXT.value, DataType.GEO_POINT.value}:
+            value_mapping["doc_values"] = False
+
+    return value_mapping
 
 
 def get_current_mapping_for_predicate(record_key, local_mapping):
@@ -572,7 +1299,7 @@ def get_current_mapping_for_predicate(record_key, local_mapping):
 
     try:
         try:
-            field_mapping_type_temp = local_mapping["amazon_neptune"]["mappings"]["properties"]["predicates"]["properties"]
+            field_mapping_type_temp = local_mapping[INDEX]["mappings"]["properties"]["predicates"]["properties"]
 
             # when predicate name has "." then mapping is nested
             key_split = record_key.split(".")
@@ -621,7 +1348,7 @@ def convert_to_es_value(es_mapping_type, obj_value):
             if is_str_represents_valid_integer_value(obj_value):
                 return get_date_time_from_millis(float(obj_value))
             try:
-                obj_date_val = parse(str(obj_value), False)
+                obj_date_val = parse_date(str(obj_value))
             # In case we encounter an error, we return obj_value back instead of abruptly stopping, eg: value is 123.45
             except ParserError:
                 return obj_value
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import os
+import json
+import logging
+import numpy as np
+
+from commons import *
+from config_provider import config_provider
+from log_helper import log_event
+from neptune_to_es import es_helper
+from neptune_to_es.es_helper import ElasticSearchDocumentFields
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Normalisations of numeric features
+NORMALISATIONS = {"none", "minmax", "zscore", "log"}
+
+
+class NumericFeature:
+
+    """
+    Numeric property encoded as a single normalised vector component. Missing & non numeric values are encoded as 0.
+
+    Normalisations:
+    none - Value as is
+    minmax - (value - min) / (max - min), clipped to [0, 1]
+    zscore - (value - mean) / std
+    log - log(1 + value), negative values are clipped to 0
+    """
+
+    def __init__(self, spec):
+        self.property = spec["property"]
+        self.normalisation = spec.get("normalisation", "none")
+        if self.normalisation not in NORMALISATIONS:
+            raise ValueError("Invalid normalisation - {} for feature - {}".format(self.normalisation, self.property))
+        self.min = float(spec.get("min", 0))
+        self.max = float(spec.get("max", 1))
+        self.mean = float(spec.get("mean", 0))
+        self.std = float(spec.get("std", 1))
+        self.width = 1
+
+    def encode(self, values):
+
+        """
+        Encodes values of vertices.
+
+        :param values: List of property value lists, one per vertex
+        :return: NumPy array of shape (vertices, 1)
+        """
+
+        column = np.array([__to_float__(vertex_values[0]) if vertex_values else np.nan for vertex_values in values],
+                          dtype=np.float64)
+        if self.normalisation == "minmax":
+            column = np.clip((column - self.min) / ((self.max - self.min) or 1.0), 0.0, 1.0)
+        elif self.normalisation == "zscore":
+            column = (column - self.mean) / (self.std or 1.0)
+        elif self.normalisation == "log":
+            column = np.log1p(np.clip(column, 0.0, None))
+        return np.nan_to_num(column, nan=0.0).reshape(-1, 1)
+
+
+class CategoricalFeature:
+
+    """
+    Categorical property one-hot encoded over configured categories. Values outside categories are encoded in an
+    extra component if "other" is set, else as all zeros.
+    """
+
+    def __init__(self, spec):
+        self.property = spec["property"]
+        self.categories = {str(category): position for position, category in enumerate(spec["categories"])}
+        self.other = len(self.categories) if spec.get("other", False) else -1
+        self.width = len(self.categories) + (1 if self.other >= 0 else 0)
+
+    def encode(self, values):
+
+        """
+        Encodes values of vertices.
+
+        :param values: List of property value lists, one per vertex
+        :return: NumPy array of shape (vertices, width)
+        """
+
+        positions = np.array([self.categories.get(str(vertex_values[0]), self.other) if vertex_values else -1
+                              for vertex_values in values], dtype=np.int64)
+        encoded = np.zeros((len(values), self.width), dtype=np.float64)
+        rows = np.nonzero(positions >= 0)[0]
+        encoded[rows, positions[rows]] = 1.0
+        return encoded
+
+
+def __to_float__(value):
+
+    """
+    Converts property value to float.
+
+    :param value: Property value
+    :return: Float value, NaN if value isn't numeric
+    """
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def load_feature_vector_spec(spec_file=es_helper.FEATURE_VECTOR_FILE):
+
+    """
+    Loads feature vector spec. Relative file path is resolved against Lambda app directory.
+    Ex: {"label": "transaction", "features": [
+            {"property": "TransactionAmt", "normalisation": "log"},
+            {"property": "ProductCD", "categories": ["W", "C", "H", "R", "S"], "other": true}]}
+    Optional "method" is used as k-NN method of knn_vector mapping.
+
+    :param spec_file: Json file with feature vector spec
+    :return: Tuple of (label of vectorised vertices, List of features, k-NN method). Empty features if no spec file
+             is configured.
+    """
+
+    if not spec_file:
+        return None, [], None
+    if not os.path.isabs(spec_file):
+        spec_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), spec_file)
+
+    with open(spec_file) as spec:
+        config = json.load(spec)
+    features = [CategoricalFeature(feature) if "categories" in feature else NumericFeature(feature)
+                for feature in config.get("features", [])]
+    return config.get("label"), features, config.get("method")
+
+
+class FeatureVectorizer:
+
+    """
+    Encodes numeric & categorical properties of changed vertices Ex: transactions into a fixed length feature vector
+    stored in knn_vector field "feature_vector", so that similar vertices can be found with k-NN queries in cluster.
+    Vectors of a chunk of Stream records are computed together as one NumPy matrix & written in the same bulk request
+    as the changes.
+
+    Vector layout follows order of features in spec. Spec changing vector dimension can't be applied to an existing
+    index, as dimension of knn_vector mapping is fixed.
+    """
+
+    def __init__(self, spec_file=es_helper.FEATURE_VECTOR_FILE):
+        self.label, self.features, self.method = load_feature_vector_spec(spec_file)
+        self.dimension = sum(feature.width for feature in self.features)
+        self.mapping_added = False
+
+    def get_mapping(self):
+
+        """
+        Generates knn_vector mapping for feature vector field.
+
+        :return: Field mapping
+        """
+
+        mapping = {"type": "knn_vector", "dimension": self.dimension}
+        if self.method:
+            mapping["method"] = self.method
+        return mapping
+
+    def add_mapping(self, mappings):
+
+        """
+        Adds feature vector mapping to index mappings when feature vectors are configured.
+
+        :param mappings: Dict of index mappings
+        :return: Dict of index mappings
+        """
+
+        if self.features:
+            mappings.setdefault("properties", {})[ElasticSearchDocumentFields.FEATURE_VECTOR.value] = \
+                self.get_mapping()
+        return mappings
+
+    def ensure_mapping(self, es_client):
+
+        """
+        Adds feature vector mapping to existing indices once per process. Needed when index was created before
+        feature vectors were configured.
+
+        :param es_client: Elastic Search Client
+        """
+
+        if not self.mapping_added:
+            es_client.indices.put_mapping(index=es_helper.MAPPING_INDEX_PATTERN,
+                                          doc_type='_doc',
+                                          include_type_name=True,
+                                          body={
+                                              "properties": {
+                                                  ElasticSearchDocumentFields.FEATURE_VECTOR.value: self.get_mapping()
+                                              }
+                                          })
+            self.mapping_added = True
+
+    def generate_actions(self, es_client, states):
+
+        """
+        Generates Elastic Search actions writing feature vectors of vertices changed by Stream records.
+
+        :param es_client: Elastic Search Client
+        :param states: Dict of vertex id to VertexState of changed vertices. See VertexStateLoader.
+        :return: List of Elastic Search Bulk API actions
+        """
+
+        if not self.features:
+            return []
+
+        vertex_states = [state for state in states.values()
+                         if (state.labels or state.properties) and (not self.label or self.label in state.labels)]
+        if not vertex_states:
+            return []
+
+        self.ensure_mapping(es_client)
+        vectors = np.hstack([feature.encode([state.properties.get(feature.property, []) for state in vertex_states])
+                             for feature in self.features])
+
+        actions = [{
+            "_op_type": "update",
+            "_index": es_helper.INDEX,
+            "_type": "_doc",
+            "_id": es_helper.generate_es_document_id({ID_STR: state.vertex_id, TYPE_STR: "vl"}),
+            "doc": {
+                ElasticSearchDocumentFields.FEATURE_VECTOR.value: vector
+            }
+        } for state, vector in zip(vertex_states, vectors.tolist())]
+
+        log_event(logger, logging.DEBUG, "feature_vectors_generated", "Generated feature vectors",
+                  vertices=len(actions))
+        return actions
@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import collections
+import json
+import logging
+import os
+from enum import Enum
+from cachetools import TTLCache
+
+from commons import *
+from config_provider import config_provider
+from neptune_to_es import es_helper
+from neptune_to_es.es_helper import ElasticSearchDocumentFields, datatypeMapping, get_excluded_datatypes, \
+    get_excluded_properties
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Json file with include / exclude rules by vertex & edge label, property per label & Sparql predicate & graph
+REPLICATION_RULES_FILE = config_provider.get_handler_additional_param('ReplicationRulesFile', '')
+
+# Number of vertices & edges whose labels are cached for replication rules & TTL in seconds of cached labels
+REPLICATION_LABEL_CACHE_SIZE = int(config_provider.get_handler_additional_param('ReplicationLabelCacheSize', 100000))
+REPLICATION_LABEL_CACHE_TTL = int(config_provider.get_handler_additional_param('ReplicationLabelCacheTTL', 3600))
+
+# Maximum number of memoised decisions per filter plan. Decisions are cleared once exceeded, so that lookups stay a
+# plain dict access while memory is bounded Ex: for Sparql statements across many named graphs
+FILTER_DECISION_CACHE_SIZE = int(config_provider.get_handler_additional_param('FilterDecisionCacheSize', 10000))
+
+# Rules matching any label
+ANY_LABEL = "*"
+
+# Graph of Sparql statements without graph
+DEFAULT_GRAPH = "http://aws.amazon.com/neptune/vocab/v01/DefaultNamedGraph"
+
+
+class DropReason(Enum):
+
+    """
+    Reasons Stream records are dropped for instead of being stored in Elastic Search. Values are published as
+    dimension of dropped records metrics.
+    """
+
+    EDGE_UPDATES = "edge_updates"
+    INVALID_DATATYPE = "invalid_datatype"
+    EXCLUDED_PROPERTY = "excluded_property"
+    EXCLUDED_DATATYPE = "excluded_datatype"
+    EXCLUDED_LABEL = "excluded_label"
+    EXCLUDED_PREDICATE = "excluded_predicate"
+    EXCLUDED_GRAPH = "excluded_graph"
+    MAPPING_CONFLICT = "mapping_conflict"
+    INVALID_VALUE = "invalid_value"
+    NON_STRING_VALUE = "non_string_value"
+    BLANK_NODE = "blank_node"
+    RESOURCE_OBJECT = "resource_object"
+    INVALID_LANGUAGE = "invalid_language"
+    NON_FINITE_VALUE = "non_finite_value"
+
+
+def __memoise__(decisions, plan_key, decide):
+
+    """
+    Memoises decision for a plan key, clearing memoised decisions once FILTER_DECISION_CACHE_SIZE is reached.
+
+    :param decisions: Dict of plan key to memoised decision
+    :param plan_key: Tuple of arguments decision is made from
+    :param decide: Function making decision from plan key
+    :return: Decision
+    """
+
+    if len(decisions) >= FILTER_DECISION_CACHE_SIZE:
+        decisions.clear()
+    decision = decisions[plan_key] = decide(*plan_key)
+    return decision
+
+
+class ScopeRule:
+
+    """
+    Include / exclude rule for names Ex: labels, properties. A name is in scope if include list is not given or
+    contains it, and exclude list doesn't contain it.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = set(include) if include is not None else None
+        self.exclude = set(exclude or [])
+
+    def allows(self, name):
+        return (self.include is None or name in self.include) and name not in self.exclude
+
+    def allows_any(self, names):
+
+        """
+        Checks if any of names of an element Ex: labels of a vertex, is in scope. Element with unknown names is only
+        in scope if rule has no include list.
+
+        :param names: Collection of names
+        :return: True if element is in scope
+        """
+
+        if not names:
+            return self.include is None
+        return any(self.allows(name) for name in names)
+
+
+class ReplicationRules:
+
+    """
+    Model for Storing selective replication rules.
+
+    This Class has five attributes:
+    vertex_labels - ScopeRule for vertex labels, None if all vertices are replicated
+    edge_labels - ScopeRule for edge labels, None if all edges are replicated
+    properties - Dict of label (or * for any label) to ScopeRule for property keys
+    predicates - ScopeRule for Sparql predicates, None if all predicates are replicated
+    graphs - ScopeRule for Sparql graphs, None if all graphs are replicated
+    """
+
+    def __init__(self, vertex_labels=None, edge_labels=None, properties=None, predicates=None, graphs=None):
+        self.vertex_labels = vertex_labels
+        self.edge_labels = edge_labels
+        self.properties = properties or {}
+        self.predicates = predicates
+        self.graphs = graphs
+
+    def uses_labels(self):
+        return bool(self.vertex_labels or self.edge_labels or self.properties)
+
+
+def __scope_rule__(config):
+    return ScopeRule(config.get("include"), config.get("exclude")) if config is not None else None
+
+
+def load_replication_rules(rules_file=REPLICATION_RULES_FILE):
+
+    """
+    Loads selective replication rules. Relative file path is resolved against Lambda app directory.
+    Ex: {"vertices": {"include": ["transaction", "device"]}, "edges": {"include": ["relation_device"]},
+         "properties": {"transaction": {"exclude": ["raw"]}},
+         "predicates": {"exclude": ["http://example.org/comment"]}, "graphs": {"include": ["http://example.org/g"]}}
+
+    :param rules_file: Json file with rules
+    :return: ReplicationRules. Replicates everything if no rules file is configured.
+    """
+
+    if not rules_file:
+        return ReplicationRules()
+    if not os.path.isabs(rules_file):
+        rules_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), rules_file)
+
+    with open(rules_file) as rules:
+        config = json.load(rules)
+    return ReplicationRules(__scope_rule__(config.get("vertices")), __scope_rule__(config.get("edges")),
+                            {label: __scope_rule__(rule) for label, rule in config.get("properties", {}).items()},
+                            __scope_rule__(config.get("predicates")), __scope_rule__(config.get("graphs")))
+
+
+class GremlinFilterPlan:
+
+    """
+    Replication rules of Gremlin Stream records compiled once per process. Decision to drop a record only depends on
+    its (type, labels, property key, datatype), so decisions are memoised per such key & records are checked with a
+    single dict lookup. Rules in order:
+
+    1) drop edge & edge property records, if user has selected to drop edge updates
+    2) drop records of vertices & edges, if their labels are not in scope of ReplicationRulesFile
+    3) drop property records, if property is not in scope for labels of its vertex or edge
+    4) drop property records, if data type is not a valid Gremlin type
+    5) drop property records, if property is present in excluded properties
+    6) drop property records, if data type is present in excluded datatypes
+
+    Labels are only resolved if rules use them. Property records don't carry labels of their vertex or edge, so labels
+    are taken from label & edge records, cached, and read from documents for elements not seen recently, see
+    resolve_labels.
+    """
+
+    def __init__(self, drop_edges, rules=None):
+        self.drop_edges = drop_edges
+        self.rules = rules or load_replication_rules()
+        self.excluded_datatypes = get_excluded_datatypes("gremlin")
+        self.excluded_properties = get_excluded_properties()
+        self.label_cache = TTLCache(maxsize=REPLICATION_LABEL_CACHE_SIZE, ttl=REPLICATION_LABEL_CACHE_TTL)
+        self.decisions = {}
+        self.scope_decisions = {}
+
+    def __label_key__(self, record_data):
+        return ("vl" if record_data[TYPE_STR] in ["vl", "vp"] else "e"), record_data[ID_STR]
+
+    def __fetch_labels__(self, es_client, label_keys, indices, routings):
+
+        """
+        Reads labels of vertices & edges from their documents. Documents are read by id with a single multi get on
+        all indices they can be stored in. Multi get is real time, so documents written by earlier batches are seen.
+        Documents not found Ex: edges routed by an unknown from vertex, are searched through alias.
+
+        :param es_client: Elastic Search Client
+        :param label_keys: List of (vl or e, element id)
+        :param indices: Indices documents can be stored in
+        :param routings: Dict of (vl or e, element id) to shard routing, for documents routed by vertex id
+        :return: Dict of (vl or e, element id) to tuple of labels, for elements with a document
+        """
+
+        document_keys = {es_helper.generate_es_document_id({ID_STR: element_id, TYPE_STR: element_type}):
+                         (element_type, element_id) for element_type, element_id in label_keys}
+        docs = []
+        for document_id, label_key in document_keys.items():
+            for index in indices:
+                doc = {"_index": index, "_id": document_id,
+                       "_source": [ElasticSearchDocumentFields.ENTITY_TYPE.value]}
+                if label_key in routings:
+                    doc["routing"] = routings[label_key]
+                docs.append(doc)
+
+        # Routed indices may not exist yet, their docs are returned with an error instead of found
+        # Deleted documents are kept as tombstones without labels
+        sources = {doc["_id"]: doc["_source"] for doc in es_client.mget(body={"docs": docs})["docs"]
+                   if doc.get("found") and doc["_source"].get(ElasticSearchDocumentFields.ENTITY_TYPE.value)}
+        missing_ids = [document_id for document_id in document_keys if document_id not in sources]
+        if missing_ids:
+            response = es_client.search(index=es_helper.INDEX, body={
+                "query": {"ids": {"values": missing_ids}},
+                "_source": [ElasticSearchDocumentFields.ENTITY_TYPE.value],
+                "size": len(missing_ids)
+            })
+            sources.update({hit["_id"]: hit["_source"] for hit in response["hits"]["hits"]
+                            if hit["_source"].get(ElasticSearchDocumentFields.ENTITY_TYPE.value)})
+
+        return {document_keys[document_id]:
+                tuple(sorted(source.get(ElasticSearchDocumentFields.ENTITY_TYPE.value, [])))
+                for document_id, source in sources.items()}
+
+    def resolve_labels(self, es_client, records, indices=None, edge_routings=None):
+
+        """
+        Resolves labels of vertices & edges of Stream records before they are checked. Labels come from added label &
+        edge records, cache & documents, in that order. Removed labels are not taken from records, so that records
+        removing a label or edge are checked against labels the element has. Elements without a document aren't
+        cached, so that elements written by an earlier batch are read again until their document is found.
+
+        :param es_client: Elastic Search Client
+        :param records: Stream records
+        :param indices: Indices documents can be stored in. Defaults to write index of alias.
+        :param edge_routings: Dict of edge document id to routing of edges stored earlier Ex: cached by ShardRouter
+        """
+
+        if not self.rules.uses_labels():
+            return
+
+        batch_labels = collections.OrderedDict()
+        from_vertex_ids = {}
+        for record in records:
+            record_data = record[DATA_STR]
+            if record_data.get(FROM_VERTEX_STR) is not None:
+                from_vertex_ids[self.__label_key__(record_data)] = record_data[FROM_VERTEX_STR]
+            if record_data[TYPE_STR] in ["vl", "e"] and record[OPERATION_STR] == "ADD":
+                batch_labels.setdefault(self.__label_key__(record_data), set()) \
+                    .add(record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR])
+
+        missing_keys = list(collections.OrderedDict.fromkeys(
+            self.__label_key__(record[DATA_STR]) for record in records
+            if self.__label_key__(record[DATA_STR]) not in batch_labels
+            and self.__label_key__(record[DATA_STR]) not in self.label_cache))
+        if missing_keys:
+            fetched_labels = self.__fetch_labels__(
+                es_client, missing_keys, indices or [es_helper.get_aliased_index(es_client)],
+                self.__routings__(es_client, missing_keys, from_vertex_ids, edge_routings or {}))
+            for label_key in missing_keys:
+                if label_key in fetched_labels:
+                    self.label_cache[label_key] = fetched_labels[label_key]
+
+        for label_key, labels in batch_labels.items():
+            self.label_cache[label_key] = tuple(sorted(labels.union(self.label_cache.get(label_key, ()))))
+
+    @staticmethod
+    def __routings__(es_client, label_keys, from_vertex_ids, edge_routings):
+
+        """
+        Gets shard routing of vertex & edge documents, if write index is routed by from vertex, see ShardRouter.
+        Vertices are routed by their id & edges by id of their from vertex, taken from records or routings of edges
+        stored earlier. Edges with unknown routing are read without routing.
+
+        :param es_client: Elastic Search Client
+        :param label_keys: List of (vl or e, element id)
+        :param from_vertex_ids: Dict of (e, edge id) to from vertex id present in Stream records
+        :param edge_routings: Dict of edge document id to routing of edges stored earlier
+        :return: Dict of (vl or e, element id) to shard routing
+        """
+
+        if es_helper.EDGE_ROUTING != es_helper.FROM_VERTEX_ROUTING or not es_helper.is_routed_by_from_vertex(es_client):
+            return {}
+
+        routings = {}
+        for element_type, element_id in label_keys:
+            if element_type == "vl":
+                routings[(element_type, element_id)] = element_id
+                continue
+            routing = from_vertex_ids.get((element_type, element_id)) or edge_routings.get(
+                es_helper.generate_es_document_id({ID_STR: element_id, TYPE_STR: element_type}))
+            if routing:
+                routings[(element_type, element_id)] = routing
+        return routings
+
+    def __decide_scope__(self, record_type, labels, key):
+
+        """
+        Applies rules 1) to 3) to a (type, labels, property key).
+
+        :param record_type: Stream record type Ex: vl, vp, e, ep
+        :param labels: Tuple of labels of vertex or edge, None if rules don't use labels
+        :param key: Property key, None for label & edge records
+        :return: DropReason, None if records are in scope
+        """
+
+        if self.drop_edges and record_type in ["e", "ep"]:
+            return DropReason.EDGE_UPDATES
+        label_rule = self.rules.vertex_labels if record_type in ["vl", "vp"] else self.rules.edge_labels
+        if label_rule and not label_rule.allows_any(labels):
+            return DropReason.EXCLUDED_LABEL
+        if record_type in ["vp", "ep"]:
+            for label in (ANY_LABEL,) + (labels or ()):
+                property_rule = self.rules.properties.get(label)
+                if property_rule and not property_rule.allows(key):
+                    return DropReason.EXCLUDED_PROPERTY
+        return None
+
+    def __decide__(self, record_type, labels, key, datatype):
+
+        """
+        Applies rules to a (type, labels, property key, datatype).
+
+        :param record_type: Stream record type Ex: vl, vp, e, ep
+        :param labels: Tuple of labels of vertex or edge, None if rules don't use labels
+        :param key: Property key, None for label & edge records
+        :param datatype: Property datatype, None for label & edge records
+        :return: DropReason, None if records are replicated
+        """
+
+        drop_reason = self.__decide_scope__(record_type, labels, key)
+        if drop_reason or record_type not in ["vp", "ep"]:
+            return drop_reason
+        if datatype.lower() not in datatypeMapping:
+            return DropReason.INVALID_DATATYPE
+        if key.strip() in self.excluded_properties:
+            return DropReason.EXCLUDED_PROPERTY
+        if datatype.strip().lower() in self.excluded_datatypes:
+            return DropReason.EXCLUDED_DATATYPE
+        return None
+
+    def __plan_key__(self, record_data):
+
+        """
+        Builds key records are checked by. Labels are expected to be resolved by resolve_labels.
+
+        :param record_data: Stream record data
+        :return: Tuple of (type, labels, property key, datatype)
+        """
+
+        record_type = record_data[TYPE_STR]
+        labels = self.label_cache.get(self.__label_key__(record_data), ()) if self.rules.uses_labels() else None
+        if record_type in ["vp", "ep"]:
+            return (record_type, labels, record_data[PROPERTY_KEY_STR],
+                    record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR])
+        return record_type, labels, None, None
+
+    def check(self, record_data):
+
+        """
+        Checks Stream record data against replication rules.
+
+        :param record_data: Stream record data
+        :return: DropReason, None if record is replicated
+        """
+
+        plan_key = self.__plan_key__(record_data)
+        try:
+            return self.decisions[plan_key]
+        except KeyError:
+            return __memoise__(self.decisions, plan_key, self.__decide__)
+
+    def check_scope(self, record_data):
+
+        """
+        Checks Stream record data against rules 1) to 3) only. Used by handlers which don't apply excluded properties
+        & datatypes Ex: string only handler.
+
+        :param record_data: Stream record data
+        :return: DropReason, None if record is in scope
+        """
+
+        plan_key = self.__plan_key__(record_data)[:3]
+        try:
+            return self.scope_decisions[plan_key]
+        except KeyError:
+            return __memoise__(self.scope_decisions, plan_key, self.__decide_scope__)
+
+
+class SparqlFilterPlan:
+
+    """
+    Replication rules of Sparql statements compiled once per process. Decisions are memoised per (predicate, graph)
+    for statements & per (predicate, datatype token) for literals, so statements are checked with dict lookups.
+    Statement rules, checked by check_statement:
+
+    1) drop statement, if its graph is not in scope of ReplicationRulesFile
+    2) drop statement, if its predicate is not in scope of ReplicationRulesFile. rdf:type statements are always in
+       scope, as they carry types of resources.
+
+    Literal rules, checked by check:
+
+    1) drop literal, if predicate is present in excluded properties
+    2) drop literal, if datatype is present in excluded datatypes
+    """
+
+    def __init__(self, rules=None):
+        self.rules = rules or load_replication_rules()
+        self.excluded_datatypes = get_excluded_datatypes("sparql")
+        self.excluded_properties = get_excluded_properties()
+        self.decisions = {}
+        self.statement_decisions = {}
+
+    def __decide_statement__(self, predicate, graph):
+
+        """
+        Applies statement rules to a (predicate, graph).
+
+        :param predicate: Predicate of statement
+        :param graph: Graph of statement
+        :return: DropReason, None if statement is in scope
+        """
+
+        if self.rules.graphs and not self.rules.graphs.allows(graph):
+            return DropReason.EXCLUDED_GRAPH
+        if self.rules.predicates and predicate != str(RDF_TYPE) and not self.rules.predicates.allows(predicate):
+            return DropReason.EXCLUDED_PREDICATE
+        return None
+
+    def check_statement(self, statement_elements):
+
+        """
+        Checks predicate & graph of a parsed Sparql statement against statement rules.
+
+        :param statement_elements: Parsed Sparql statement
+        :return: DropReason, None if statement is in scope
+        """
+
+        if not self.rules.graphs and not self.rules.predicates:
+            return None
+
+        graph = statement_elements.get(GRAPH)
+        plan_key = (str(statement_elements[PREDICATE]), str(graph) if graph else DEFAULT_GRAPH)
+        try:
+            return self.statement_decisions[plan_key]
+        except KeyError:
+            return __memoise__(self.statement_decisions, plan_key, self.__decide_statement__)
+
+    def __decide__(self, predicate, datatype_token):
+
+        """
+        Applies rules to a (predicate, datatype token).
+
+        :param predicate: Predicate of literal
+        :param datatype_token: Lower case datatype token of literal Ex: integer
+        :return: DropReason, None if literal is replicated
+        """
+
+        if predicate.strip() in self.excluded_properties:
+            return DropReason.EXCLUDED_PROPERTY
+        if datatype_token in self.excluded_datatypes:
+            return DropReason.EXCLUDED_DATATYPE
+        return None
+
+    def check(self, predicate, datatype_token):
+
+        """
+        Checks predicate & datatype of a Sparql literal against replication rules.
+
+        :param predicate: Predicate of literal
+        :param datatype_token: Lower case datatype token of literal Ex: integer
+        :return: DropReason, None if literal is replicated
+        """
+
+        plan_key = (predicate, datatype_token)
+        try:
+            return self.decisions[plan_key]
+        except KeyError:
+            return __memoise__(self.decisions, plan_key, self.__decide__)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import os
+import re
+import json
+import logging
+from cachetools import LRUCache
+
+from commons import *
+from config_provider import config_provider
+from log_helper import log_event
+from neptune_to_es import es_helper
+from neptune_to_es.es_helper import ElasticSearchDocumentFields
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Json file with fingerprint patterns per property. Relative path is resolved against Lambda app directory. Empty
+# disables fingerprints.
+FINGERPRINT_RULES_FILE = config_provider.get_handler_additional_param('FingerprintRulesFile', '')
+
+# Number of normalised property values memoised
+FINGERPRINT_CACHE_SIZE = 10000
+
+# Field holding canonical form of whole property value
+CANONICAL_VALUE_FIELD = "value"
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Painless Script to replace fingerprints of changed properties. Properties without values are removed.
+FINGERPRINT_SCRIPT = '''if (ctx._source.fingerprints == null) {
+                            ctx._source.fingerprints = new HashMap()
+                        }
+                        for (entry in params.fingerprints.entrySet()) {
+                            if (entry.getValue() == null) {
+                                ctx._source.fingerprints.remove(entry.getKey())
+                            } else {
+                                ctx._source.fingerprints[entry.getKey()] = entry.getValue()
+                            }
+                        }'''
+
+
+def canonicalise(value):
+
+    """
+    Canonical form of a value i.e. lower cased & trimmed, with whitespace runs collapsed to a single space.
+
+    :param value: Value
+    :return: Canonical string
+    """
+
+    return WHITESPACE_PATTERN.sub(" ", str(value)).strip().lower()
+
+
+class FingerprintPattern:
+
+    """
+    Model for Storing compiled fingerprint pattern.
+
+    This Class has two attributes:
+    regex - Compiled case insensitive regex. Named groups are extracted as fingerprint fields.
+    fields - Dict of constant fingerprint fields set when regex matches Ex: {"vendor": "apple"}
+    """
+
+    def __init__(self, spec):
+        self.regex = re.compile(spec["pattern"], re.IGNORECASE)
+        self.fields = {field: canonicalise(value) for field, value in spec.get("fields", {}).items()}
+
+    def field_names(self):
+        return set(self.regex.groupindex) | set(self.fields)
+
+    def match(self, value):
+
+        """
+        Extracts fingerprint fields from a canonical value.
+
+        :param value: Canonical value
+        :return: Dict of fingerprint fields, None if value doesn't match
+        """
+
+        match = self.regex.search(value)
+        if not match:
+            return None
+        fields = dict(self.fields)
+        fields.update({field: canonicalise(group) for field, group in match.groupdict().items() if group})
+        return fields
+
+
+def load_fingerprint_patterns(rules_file=FINGERPRINT_RULES_FILE):
+
+    """
+    Loads & compiles fingerprint patterns. Relative file path is resolved against Lambda app directory.
+    Ex: {"deviceInfo": [{"pattern": "^(?P<vendor>samsung) (?P<model>sm-\\w+) build/(?P<build>[a-z]+)"},
+                        {"pattern": "^ios device$", "fields": {"vendor": "apple", "model": "ios device"}}]}
+
+    :param rules_file: Json file with fingerprint patterns
+    :return: Dict of property key to List of FingerprintPattern, in match order. Empty if no file is configured.
+    """
+
+    if not rules_file:
+        return {}
+    if not os.path.isabs(rules_file):
+        rules_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), rules_file)
+
+    with open(rules_file) as rules:
+        config = json.load(rules)
+    return {key: [FingerprintPattern(spec) for spec in specs] for key, specs in config.items()}
+
+
+class FingerprintNormaliser:
+
+    """
+    Derives canonical fingerprint keywords Ex: vendor, model & build family of a device from selected vertex
+    properties, so that devices & identities can be matched across entities with exact term queries instead of fuzzy
+    queries on analysed text. Fingerprints of a property are stored in "fingerprints.<property>" with canonical form
+    of the whole value in "value" & fields of first matching pattern, and are written in the same bulk request as the
+    property change.
+
+    Patterns are compiled once per process & normalised values are memoised.
+    """
+
+    def __init__(self, rules_file=FINGERPRINT_RULES_FILE):
+        self.patterns = load_fingerprint_patterns(rules_file)
+        self.cache = LRUCache(maxsize=FINGERPRINT_CACHE_SIZE)
+        self.mapping_added = False
+
+    def get_mapping(self):
+
+        """
+        Generates keyword mappings for fingerprint fields of configured properties.
+
+        :return: Field mapping
+        """
+
+        return {
+            "properties": {
+                key: {
+                    "properties": {
+                        field: {"type": "keyword"}
+                        for field in sorted(set.union({CANONICAL_VALUE_FIELD},
+                                                      *[pattern.field_names() for pattern in patterns]))
+                    }
+                } for key, patterns in self.patterns.items()
+            }
+        }
+
+    def add_mapping(self, mappings):
+
+        """
+        Adds fingerprint mappings to index mappings when fingerprints are configured.
+
+        :param mappings: Dict of index mappings
+        :return: Dict of index mappings
+        """
+
+        if self.patterns:
+            mappings.setdefault("properties", {})[ElasticSearchDocumentFields.FINGERPRINTS.value] = self.get_mapping()
+        return mappings
+
+    def ensure_mapping(self, es_client):
+
+        """
+        Adds fingerprint mappings to existing indices once per process. Needed when index was created before
+        fingerprints were configured, as fingerprint fields would otherwise be mapped as analysed text.
+
+        :param es_client: Elastic Search Client
+        """
+
+        if not self.mapping_added:
+            es_client.indices.put_mapping(index=es_helper.MAPPING_INDEX_PATTERN,
+                                          doc_type='_doc',
+                                          include_type_name=True,
+                                          body={
+                                              "properties": {
+                                                  ElasticSearchDocumentFields.FINGERPRINTS.value: self.get_mapping()
+                                              }
+                                          })
+            self.mapping_added = True
+
+    def normalise(self, key, value):
+
+        """
+        Derives fingerprint fields of a property value.
+
+        :param key: Property key
+        :param value: Property value
+        :return: Dict of fingerprint fields
+        """
+
+        cache_key = (key, str(value))
+        if cache_key not in self.cache:
+            canonical_value = canonicalise(value)
+            fields = {CANONICAL_VALUE_FIELD: canonical_value}
+            for pattern in self.patterns[key]:
+                matched_fields = pattern.match(canonical_value)
+                if matched_fields is not None:
+                    fields.update(matched_fields)
+                    break
+            self.cache[cache_key] = fields
+        return self.cache[cache_key]
+
+    def __fingerprint__(self, key, values):
+
+        """
+        Derives fingerprints of a property. Fields of multiple values are merged into lists of distinct values.
+
+        :param key: Property key
+        :param values: List of property values
+        :return: Dict of fingerprint field to List of values, None if property has no values
+        """
+
+        if not values:
+            return None
+        fingerprint = {}
+        for value in values:
+            for field, field_value in self.normalise(key, value).items():
+                field_values = fingerprint.setdefault(field, [])
+                if field_value not in field_values:
+                    field_values.append(field_value)
+        return fingerprint
+
+    def generate_actions(self, es_client, records, states):
+
+        """
+        Generates Elastic Search actions writing fingerprints of vertex properties changed by Stream records.
+
+        :param es_client: Elastic Search Client
+        :param records: Filtered Stream records
+        :param states: Dict of vertex id to VertexState of changed vertices. See VertexStateLoader.
+        :return: List of Elastic Search Bulk API actions
+        """
+
+        if not self.patterns:
+            return []
+
+        changed_keys = {}
+        for record in records:
+            record_data = record[DATA_STR]
+            if record_data[TYPE_STR] == "vp" and record_data[PROPERTY_KEY_STR] in self.patterns:
+                changed_keys.setdefault(record_data[ID_STR], set()).add(record_data[PROPERTY_KEY_STR])
+
+        actions = []
+        for vertex_id, keys in changed_keys.items():
+            state = states[vertex_id]
+            # Removed vertex
+            if not state.labels and not state.properties:
+                continue
+            actions.append({
+                "_op_type": "update",
+                "_index": es_helper.INDEX,
+                "_type": "_doc",
+                "_id": es_helper.generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"}),
+                "script": {
+                    "source": FINGERPRINT_SCRIPT,
+                    "lang": "painless",
+                    "params": {
+                        "fingerprints": {key: self.__fingerprint__(key, state.properties.get(key, []))
+                                         for key in sorted(keys)}
+                    }
+                }
+            })
+
+        if actions:
+            self.ensure_mapping(es_client)
+        log_event(logger, logging.DEBUG, "fingerprints_generated", "Generated fingerprints", vertices=len(actions))
+        return actions
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import os
+import collections
+import json
+import logging
+import operator
+from cachetools import TTLCache
+
+from commons import *
+from config_provider import config_provider
+from log_helper import log_event
+from neptune_to_es import es_helper
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Json file with fraud scoring rules. Relative path is resolved against Lambda app directory. Empty disables scoring.
+FRAUD_RULES_FILE = config_provider.get_handler_additional_param('FraudRulesFile', '')
+
+# TTL in seconds of neighbour vertex data cached for scoring
+FRAUD_NEIGHBOUR_CACHE_TTL = int(config_provider.get_handler_additional_param('FraudNeighbourCacheTTL', 300))
+FRAUD_NEIGHBOUR_CACHE_SIZE = 10000
+
+# Painless Script to set fraud score & matched rules of a vertex document
+FRAUD_SCORE_SCRIPT = '''ctx._source.fraud_score = params.score;
+                        ctx._source.fraud_rules = params.rules'''
+
+COMPARISON_OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda value, values: value in values
+}
+
+
+class EvaluationContext:
+
+    """
+    Vertex state rules are evaluated on, with access to neighbour states loaded on demand.
+    """
+
+    def __init__(self, state, load_neighbours):
+        self.state = state
+        self.load_neighbours = load_neighbours
+
+    def neighbours(self, direction, label):
+        return [EvaluationContext(neighbour, self.load_neighbours)
+                for neighbour in self.load_neighbours(self.state.neighbour_ids(direction, label))]
+
+
+def __compare__(comparison, actual, expected):
+
+    """
+    Compares values, values of incompatible types don't match.
+    """
+
+    try:
+        return comparison(actual, expected)
+    except TypeError:
+        return False
+
+
+def compile_condition(spec):
+
+    """
+    Compiles declarative rule condition into a function evaluating it on an EvaluationContext. Conditions:
+
+    {"all": [...]}, {"any": [...]}, {"not": {...}} - Combine conditions
+    {"label": "transaction"} - Vertex has label
+    {"property": "TransactionAmt", "op": "gte", "value": 1000} - Any value of property compares to value
+    {"degree": {"direction": "in", "label": "relation_identity", "op": "gt", "value": 1}} - Number of neighbours
+    {"neighbour": {"direction": "out", "label": "relation_device", "condition": {...}}} - Any neighbour matches
+
+    :param spec: Condition Dict
+    :return: Function taking an EvaluationContext & returning a boolean
+    """
+
+    if "all" in spec:
+        conditions = [compile_condition(condition) for condition in spec["all"]]
+        return lambda context: all(condition(context) for condition in conditions)
+    if "any" in spec:
+        conditions = [compile_condition(condition) for condition in spec["any"]]
+        return lambda context: any(condition(context) for condition in conditions)
+    if "not" in spec:
+        condition = compile_condition(spec["not"])
+        return lambda context: not condition(context)
+    if "label" in spec:
+        label = spec["label"]
+        return lambda context: label in context.state.labels
+    if "property" in spec:
+        key, comparison, expected = spec["property"], COMPARISON_OPERATORS[spec["op"]], spec["value"]
+        return lambda context: any(__compare__(comparison, value, expected)
+                                   for value in context.state.properties.get(key, []))
+    if "degree" in spec:
+        degree = spec["degree"]
+        direction, label = degree.get("direction", "out"), degree["label"]
+        comparison, expected = COMPARISON_OPERATORS[degree["op"]], degree["value"]
+        return lambda context: comparison(len(context.state.neighbour_ids(direction, label)), expected)
+    if "neighbour" in spec:
+        neighbour = spec["neighbour"]
+        direction, label = neighbour.get("direction", "out"), neighbour["label"]
+        condition = compile_condition(neighbour["condition"])
+        return lambda context: any(condition(neighbour_context)
+                                   for neighbour_context in context.neighbours(direction, label))
+    raise ValueError("Invalid fraud rule condition - {}".format(json.dumps(spec)))
+
+
+def neighbour_edges(spec):
+
+    """
+    Collects edges a condition reads neighbours of the evaluated vertex over. Conditions on neighbours of
+    neighbours aren't included.
+
+    :param spec: Condition Dict
+    :return: Set of (direction, edge label) tuples
+    """
+
+    if "all" in spec or "any" in spec:
+        return set().union(*[neighbour_edges(condition) for condition in spec.get("all", spec.get("any"))])
+    if "not" in spec:
+        return neighbour_edges(spec["not"])
+    if "neighbour" in spec:
+        return {(spec["neighbour"].get("direction", "out"), spec["neighbour"]["label"])}
+    return set()
+
+
+class FraudRule:
+
+    """
+    Model for Storing compiled Fraud Rule.
+
+    This Class has four attributes:
+    rule_id - Rule id written to matched rules of document
+    weight - Score added when rule matches
+    condition - Compiled condition
+    neighbour_edges - Set of (direction, edge label) tuples condition reads neighbours over
+    """
+
+    def __init__(self, rule_id, weight, condition, neighbour_edges=None):
+        self.rule_id = rule_id
+        self.weight = weight
+        self.condition = condition
+        self.neighbour_edges = neighbour_edges or set()
+
+
+def load_fraud_rules(rules_file=FRAUD_RULES_FILE):
+
+    """
+    Loads & compiles fraud rules. Relative file path is resolved against Lambda app directory.
+    Ex: {"label": "transaction", "rules": [{"id": "high_amount", "weight": 30,
+                                            "when": {"property": "TransactionAmt", "op": "gte", "value": 1000}}]}
+
+    :param rules_file: Json file with rules
+    :return: Tuple of (label of scored vertices, List of FraudRule). Empty list if no rules file is configured.
+    """
+
+    if not rules_file:
+        return None, []
+    if not os.path.isabs(rules_file):
+        rules_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), rules_file)
+
+    with open(rules_file) as rules:
+        config = json.load(rules)
+    return config.get("label"), [FraudRule(rule["id"], float(rule.get("weight", 1)), compile_condition(rule["when"]),
+                                           neighbour_edges(rule["when"]))
+                                 for rule in config.get("rules", [])]
+
+
+class FraudScorer:
+
+    """
+    Scores changed vertices Ex: transactions with declarative fraud rules while replicating Stream records, and
+    writes fraud_score (sum of weights of matched rules) & fraud_rules (ids of matched rules) in the same bulk
+    request as the changes. Rules are compiled once per process.
+
+    Neighbours are taken from adjacency summaries (see AdjacencySummaries) & edges of the batch, and their documents
+    are cached for a short time. Neighbours rules read are fetched for all vertices of a batch at once. Changes of
+    a neighbour alone don't rescore its neighbours.
+    """
+
+    def __init__(self, state_loader, rules_file=FRAUD_RULES_FILE):
+        self.state_loader = state_loader
+        self.label, self.rules = load_fraud_rules(rules_file)
+        self.neighbour_edges = set().union(*[rule.neighbour_edges for rule in self.rules])
+        self.neighbour_cache = TTLCache(maxsize=FRAUD_NEIGHBOUR_CACHE_SIZE, ttl=FRAUD_NEIGHBOUR_CACHE_TTL)
+
+    def __load_neighbours__(self, es_client, vertex_ids, neighbour_cache, index=None):
+
+        """
+        Loads neighbour vertex states, from cache if present.
+
+        :param es_client: Elastic Search Client
+        :param vertex_ids: List of vertex ids
+        :param neighbour_cache: Cache of neighbour vertex states
+        :param index: Index being built by reindex neighbours are read from. Defaults to index alias.
+        :return: List of VertexState
+        """
+
+        missing_ids = list(collections.OrderedDict.fromkeys(
+            vertex_id for vertex_id in vertex_ids if vertex_id not in neighbour_cache))
+        if missing_ids:
+            for vertex_id, state in self.state_loader.fetch_states(es_client, missing_ids, index).items():
+                neighbour_cache[vertex_id] = state
+        return [neighbour_cache[vertex_id] for vertex_id in vertex_ids if vertex_id in neighbour_cache]
+
+    def generate_actions(self, es_client, states, index=None):
+
+        """
+        Generates Elastic Search actions writing fraud score of vertices changed by Stream records.
+
+        :param es_client: Elastic Search Client
+        :param states: Dict of vertex id to VertexState of changed vertices. See VertexStateLoader.
+        :param index: Index being built by reindex neighbours are read from. Defaults to index alias.
+        :return: List of Elastic Search Bulk API actions
+        """
+
+        if not self.rules:
+            return []
+
+        scored_states = {vertex_id: state for vertex_id, state in states.items()
+                         # Removed vertices have no labels & properties
+                         if (not self.label or self.label in state.labels) and (state.labels or state.properties)}
+
+        # Index being built by reindex lags behind index alias, so neighbours read from it are only kept for the call
+        neighbour_cache = {} if index else self.neighbour_cache
+
+        # Neighbours of all scored vertices are fetched at once instead of per vertex while evaluating rules
+        self.__load_neighbours__(es_client, [neighbour_id for state in scored_states.values()
+                                             for direction, label in self.neighbour_edges
+                                             for neighbour_id in state.neighbour_ids(direction, label)],
+                                 neighbour_cache, index)
+
+        actions = []
+        for vertex_id, state in scored_states.items():
+            context = EvaluationContext(state, lambda ids: self.__load_neighbours__(es_client, ids, neighbour_cache,
+                                                                                    index))
+            matched = [rule for rule in self.rules if rule.condition(context)]
+            actions.append({
+                "_op_type": "update",
+                "_index": es_helper.INDEX,
+                "_type": "_doc",
+                "_id": es_helper.generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"}),
+                "script": {
+                    "source": FRAUD_SCORE_SCRIPT,
+                    "lang": "painless",
+                    "params": {
+                        "score": sum(rule.weight for rule in matched),
+                        "rules": [rule.rule_id for rule in matched]
+                    }
+                }
+            })
+
+        log_event(logger, logging.DEBUG, "fraud_scored", "Scored vertices", vertices=len(actions))
+        return actions
@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import re
+import logging
+from enum import Enum
+from cachetools import LRUCache
+
+from commons import *
+from config_provider import config_provider
+from neptune_to_es import es_helper, edge_backfill
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Routing rules. Comma separated list of selector:value[:shards[:replicas]]
+# Ex: label:transaction:10:1,document_type:edge
+INDEX_ROUTING_RULES = config_provider.get_handler_additional_param('IndexRoutingRules', '')
+
+# Maximum number of document ids for which index is remembered
+ROUTED_DOCUMENT_CACHE_SIZE = int(config_provider.get_handler_additional_param('RoutedDocumentCacheSize', 100000))
+
+# Characters not allowed in index names are replaced by "_"
+INVALID_INDEX_NAME_CHARS = re.compile(r"[^a-z0-9_\-]")
+
+
+class RoutingSelector(Enum):
+
+    """
+    Document attribute routing rule is matched against.
+    """
+
+    # Vertex / Edge label or rdf:type
+    LABEL = "label"
+
+    # vertex / edge / rdf-resource
+    DOCUMENT_TYPE = "document_type"
+
+
+class RoutingRule:
+
+    """
+    Model for Storing Routing Rule.
+
+    This Class has four attributes:
+    selector - RoutingSelector rule is matched against
+    value - Label or document type matched by rule
+    shards - Number of shards of routed index
+    replicas - Number of replicas of routed index
+    """
+
+    def __init__(self, selector, value, shards, replicas):
+        self.selector = selector
+        self.value = value
+        self.shards = shards
+        self.replicas = replicas
+        self.index = "{}_{}_{}".format(es_helper.INDEX, selector.value,
+                                       INVALID_INDEX_NAME_CHARS.sub("_", value.lower()))
+
+
+def parse_routing_rules(rules_str):
+
+    """
+    Parses routing rules config value. Label may contain ":" Ex: rdf:type URI, so shards & replicas are taken
+    from end of rule. Shards & replicas default to NumberOfShards & NumberOfReplica config values.
+
+    :param rules_str: Comma separated list of selector:value[:shards[:replicas]]
+    :return: List of RoutingRule, label rules first
+    """
+
+    rules = []
+    for entry in rules_str.split(","):
+        parts = [part.strip() for part in entry.split(":")]
+        if len(parts) < 2:
+            continue
+
+        numbers = []
+        while len(parts) > 2 and len(numbers) < 2 and parts[-1].isdigit():
+            numbers.insert(0, int(parts.pop()))
+
+        try:
+            selector = RoutingSelector(parts[0].lower())
+        except ValueError:
+            logger.warning("Ignoring routing rule with invalid selector - {}".format(entry))
+            continue
+
+        rules.append(RoutingRule(selector, ":".join(parts[1:]),
+                                 numbers[0] if numbers else es_helper.NO_OF_SHARDS,
+                                 numbers[1] if len(numbers) > 1 else es_helper.NO_OF_REPLICA))
+
+    return sorted(rules, key=lambda rule: rule.selector != RoutingSelector.LABEL)
+
+
+class IndexRouter:
+
+    """
+    Routes documents to separate indices based on label or document type, so that each index can be sized to
+    its volume Ex: transaction vertices in an index with more shards than device vertices.
+
+    Routed indices are named amazon_neptune_<selector>_<value> & are added to index alias, which keeps serving
+    reads across all documents. Documents not matching any rule are written through index alias as before.
+
+    A document stays in the index it was first written to. Property records don't carry labels, so index of a
+    document is remembered in a bounded cache & looked up in Elastic Search on cache miss.
+    """
+
+    def __init__(self, rules_str=INDEX_ROUTING_RULES):
+        self.rules = parse_routing_rules(rules_str)
+        self.routed_indices = {rule.index for rule in self.rules}
+        self.document_index_cache = LRUCache(maxsize=ROUTED_DOCUMENT_CACHE_SIZE)
+
+    def ensure_indices(self, es_client, mappings):
+
+        """
+        Creates routed indices if not already present & adds them to index alias for reads. Index behind
+        alias before routing was enabled is marked as write index.
+
+        :param es_client: Elastic Search Client
+        :param mappings: Default index mappings
+        """
+
+        if not self.rules:
+            return
+
+        aliased = es_client.indices.exists_alias(name=es_helper.INDEX)
+        if not aliased:
+            logger.warning("Index - {} is not an alias. Routed indices are not added to it for reads. Increase "
+                           "IndexVersion to migrate index behind an alias.".format(es_helper.INDEX))
+
+        for rule in self.rules:
+            if es_client.indices.exists(index=rule.index):
+                continue
+
+            settings = es_helper.__index_settings__()
+            settings.update({
+                "number_of_shards": rule.shards,
+                "number_of_replicas": rule.replicas
+            })
+            body = {
+                "settings": settings,
+                "mappings": es_helper.merge_live_index_mappings(es_client, mappings)
+            }
+            if aliased:
+                body["aliases"] = {es_helper.INDEX: {"is_write_index": False}}
+            es_client.indices.create(index=rule.index, body=body)
+            logger.info("Created routed index - {} for {} - {}".format(rule.index, rule.selector.value, rule.value))
+
+        if aliased:
+            write_index = es_helper.get_aliased_index(es_client)
+            es_client.indices.update_aliases(body={
+                "actions": [
+                    {"add": {"index": write_index, "alias": es_helper.INDEX, "is_write_index": True}}
+                ]
+            })
+
+    def __match_rule__(self, document_type, labels):
+
+        """
+        Finds index for a document using routing rules.
+
+        :param document_type: Document type
+        :param labels: Labels of document seen in Stream records
+        :return: Routed index name or index alias if no rule matches
+        """
+
+        for rule in self.rules:
+            if (rule.selector == RoutingSelector.LABEL and rule.value in labels) or \
+                    (rule.selector == RoutingSelector.DOCUMENT_TYPE and rule.value == document_type):
+                return rule.index
+        return es_helper.INDEX
+
+    def candidate_indices(self, es_client):
+
+        """
+        Gets indices documents can be stored in i.e. write index of alias & routed indices.
+
+        :param es_client: Elastic Search Client
+        :return: List of index names
+        """
+
+        return [es_helper.get_aliased_index(es_client)] + sorted(self.routed_indices)
+
+    def __lookup_indices__(self, es_client, document_ids, document_routings):
+
+        """
+        Looks up indices existing documents are stored in using a single multi get on write index & routed indices.
+        Multi get is real time, so documents written by earlier batches are found before a refresh.
+
+        :param es_client: Elastic Search Client
+        :param document_ids: List of document ids
+        :param document_routings: Dict of document id to shard routing, for documents routed by vertex id
+        :return: Dict of document id to routed index name or index alias
+        """
+
+        docs = []
+        for document_id in document_ids:
+            for index in self.candidate_indices(es_client):
+                doc = {"_index": index, "_id": document_id, "_source": False}
+                if document_id in document_routings:
+                    doc["routing"] = document_routings[document_id]
+                docs.append(doc)
+
+        document_indices = {}
+        # Routed indices may not exist yet, their docs are returned with an error instead of found
+        for doc in es_client.mget(body={"docs": docs})["docs"]:
+            if not doc.get("found"):
+                continue
+            # Documents in index behind alias are written through alias
+            index = doc["_index"] if doc["_index"] in self.routed_indices else es_helper.INDEX
+            if document_indices.get(doc["_id"]) not in self.routed_indices:
+                document_indices[doc["_id"]] = index
+        return document_indices
+
+    @staticmethod
+    def __add_routings__(document_routings, document_id, record_data):
+
+        """
+        Adds shard routing of documents a Gremlin record can update, as set by ShardRouter.
+
+        :param document_routings: Dict of document id to shard routing
+        :param document_id: Document id of record
+        :param record_data: Stream record data
+        """
+
+        if record_data[TYPE_STR] in ["vl", "vp"]:
+            document_routings[document_id] = record_data[ID_STR]
+            return
+        if record_data.get(FROM_VERTEX_STR) is not None:
+            document_routings.setdefault(document_id, record_data[FROM_VERTEX_STR])
+        # Edge records can update end vertex documents too Ex: adjacency summaries
+        for vertex_id in [record_data.get(FROM_VERTEX_STR), record_data.get(TO_VERTEX_STR)]:
+            if vertex_id is not None:
+                document_routings[es_helper.generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"})] = vertex_id
+
+    def route_actions(self, es_client, records, actions, handler):
+
+        """
+        Sets index of Elastic Search actions generated from Stream records to index of respective document.
+
+        :param es_client: Elastic Search Client
+        :param records: Stream records actions are generated from
+        :param actions: Elastic Search Bulk API actions
+        :param handler: Handler used to derive document type & labels from Stream records
+        """
+
+        if not self.rules:
+            return
+
+        routed = es_helper.EDGE_ROUTING == es_helper.FROM_VERTEX_ROUTING and \
+            es_helper.is_routed_by_from_vertex(es_client)
+        document_types = {}
+        document_labels = {}
+        document_routings = {}
+        for record in records:
+            record_data = record[DATA_STR]
+            document_id = es_helper.generate_es_document_id(record_data)
+            document_types.setdefault(document_id, handler.get_document_type(record_data))
+            if handler.generate_es_field_key(record_data) == es_helper.ElasticSearchDocumentFields.ENTITY_TYPE.value:
+                document_labels.setdefault(document_id, set()).add(handler.generate_es_field_value(record_data))
+            # Routed documents are only found by multi get with their routing. Only Gremlin records are routed.
+            if routed and TYPE_STR in record_data:
+                self.__add_routings__(document_routings, document_id, record_data)
+
+        # Actions can update documents other than the ones records belong to Ex: adjacency summaries of end
+        # vertices of an edge. These are only routed if they already exist.
+        document_ids = list(document_types)
+        document_ids.extend({action["_id"] for action in actions} - set(document_types))
+
+        document_indices = {}
+        unresolved_ids = []
+        for document_id in document_ids:
+            if document_id in self.document_index_cache:
+                document_indices[document_id] = self.document_index_cache[document_id]
+            else:
+                unresolved_ids.append(document_id)
+
+        if unresolved_ids:
+            existing_indices = self.__lookup_indices__(es_client, unresolved_ids, document_routings)
+            for document_id in unresolved_ids:
+                if document_id in document_types:
+                    document_indices[document_id] = existing_indices.get(document_id) or \
+                        self.__match_rule__(document_types[document_id], document_labels.get(document_id, set()))
+                elif document_id in existing_indices:
+                    document_indices[document_id] = existing_indices[document_id]
+                else:
+                    continue
+                self.document_index_cache[document_id] = document_indices[document_id]
+
+        for action in actions:
+            action["_index"] = document_indices.get(action["_id"], action["_index"])
+
+
+class ShardRouter:
+
+    """
+    Routes documents to shards when EdgeRouting is set to from_vertex. Vertex documents are routed by vertex id &
+    edge documents by id of their from vertex, so that a vertex & its outgoing edges are stored in the same shard
+    & traversal style queries Ex: edges of a vertex can be served by a single shard.
+
+    Routing of a document can't change once it is indexed, so routing is only applied when write index was created
+    with from_vertex routing. Changing EdgeRouting for existing index requires increasing IndexVersion, which
+    reindexes documents with new routing.
+
+    Edge property & removed edge records don't always carry from vertex id & edges indexed before from_id was stored
+    keep default routing, so routing of an edge is remembered in a bounded cache & looked up in Elastic Search on
+    cache miss. From vertex ids of edges not found without routing are queried from Neptune.
+    """
+
+    # Cached routing of edges stored with default routing
+    DEFAULT_ROUTING = ""
+
+    def __init__(self, edge_routing=es_helper.EDGE_ROUTING, query_endpoints=edge_backfill.query_edge_endpoints):
+        self.enabled = edge_routing == es_helper.FROM_VERTEX_ROUTING
+        self.edge_routing_cache = LRUCache(maxsize=ROUTED_DOCUMENT_CACHE_SIZE)
+        self.query_endpoints = query_endpoints
+        self.__warned = False
+
+    def __is_index_routed__(self, es_client, index):
+
+        """
+        Checks if documents of index actions are written to are routed by from vertex id.
+
+        :param es_client: Elastic Search Client
+        :param index: Index being built by reindex or None for write index of alias
+        :return: True if documents are to be routed
+        """
+
+        # Index being built by reindex is created with configured routing
+        if index or es_helper.is_routed_by_from_vertex(es_client):
+            return True
+
+        if not self.__warned:
+            logger.warning("Index - {} was not created with {} routing. Increase IndexVersion to reindex "
+                           "documents with new routing.".format(es_helper.INDEX, es_helper.FROM_VERTEX_ROUTING))
+            self.__warned = True
+        return False
+
+    def __lookup_routings__(self, es_client, document_indices, edge_ids, from_vertex_ids):
+
+        """
+        Looks up routing of existing edge documents using a single multi get, which is real time unlike search.
+        Each edge is looked up in the index its actions are written to, with & without from vertex routing. Edges not
+        found without routing are routed by their from vertex, which is queried from Neptune when records don't carry
+        it.
+
+        :param es_client: Elastic Search Client
+        :param document_indices: Dict of edge document id to index or alias actions are written to
+        :param edge_ids: Dict of edge document id to edge id
+        :param from_vertex_ids: Dict of edge document id to from vertex id or None if not known
+        :return: Dict of document id to routing, DEFAULT_ROUTING for documents stored without routing
+        """
+
+        write_index = None
+        docs = []
+        for document_id, from_vertex_id in from_vertex_ids.items():
+            index = document_indices[document_id]
+            if index == es_helper.INDEX:
+                write_index = write_index or es_helper.get_aliased_index(es_client)
+                index = write_index
+            docs.append({"_index": index, "_id": document_id, "_source": False})
+            if from_vertex_id is not None:
+                docs.append({"_index": index, "_id": document_id, "_source": False, "routing": from_vertex_id})
+
+        routings = {doc["_id"]: doc.get("_routing", self.DEFAULT_ROUTING)
+                    for doc in es_client.mget(body={"docs": docs})["docs"] if doc.get("found")}
+
+        missing_ids = [document_id for document_id, from_vertex_id in from_vertex_ids.items()
+                       if from_vertex_id is None and document_id not in routings]
+        if missing_ids:
+            # Edges removed from Neptune since are left out & keep default routing
+            edge_endpoints = self.query_endpoints([edge_ids[document_id] for document_id in missing_ids])
+            for document_id in missing_ids:
+                if edge_ids[document_id] in edge_endpoints:
+                    routings[document_id] = edge_endpoints[edge_ids[document_id]][0]
+        return routings
+
+    def route_actions(self, es_client, records, actions, index=None):
+
+        """
+        Sets routing of Elastic Search actions generated from Stream records to routing of respective document.
+
+        :param es_client: Elastic Search Client
+        :param records: Stream records actions are generated from
+        :param actions: Elastic Search Bulk API actions
+        :param index: Index being built by reindex actions are written to. Defaults to index alias. Actions are
+                      expected to be routed to their index by IndexRouter & to reindex target before.
+        """
+
+        if not self.enabled or not self.__is_index_routed__(es_client, index):
+            return
+
+        document_routings = {}
+        edge_ids = {}
+        from_vertex_ids = {}
+        for record in records:
+            record_data = record[DATA_STR]
+            # Only Gremlin records are routed
+            if TYPE_STR not in record_data:
+                continue
+            document_id = es_helper.generate_es_document_id(record_data)
+            if record_data[TYPE_STR] in ["vl", "vp"]:
+                document_routings[document_id] = record_data[ID_STR]
+            else:
+                edge_ids[document_id] = record_data[ID_STR]
+                # Edge bundles can start with edge property records, which don't carry from vertex id
+                if from_vertex_ids.get(document_id) is None:
+                    from_vertex_ids[document_id] = record_data.get(FROM_VERTEX_STR)
+                # Edge records can update end vertex documents too Ex: adjacency summaries
+                for vertex_id in [record_data.get(FROM_VERTEX_STR), record_data.get(TO_VERTEX_STR)]:
+                    if vertex_id is not None:
+                        document_routings[es_helper.generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"})] = \
+                            vertex_id
+
+        unresolved_ids = []
+        for document_id in from_vertex_ids:
+            if document_id in self.edge_routing_cache:
+                document_routings[document_id] = self.edge_routing_cache[document_id]
+            else:
+                unresolved_ids.append(document_id)
+
+        if unresolved_ids:
+            document_indices = {action["_id"]: action["_index"] for action in actions}
+            existing_routings = self.__lookup_routings__(
+                es_client, {document_id: document_indices.get(document_id, index or es_helper.INDEX)
+                            for document_id in unresolved_ids},
+                edge_ids, {document_id: from_vertex_ids[document_id] for document_id in unresolved_ids})
+            for document_id in unresolved_ids:
+                routing = existing_routings.get(document_id, from_vertex_ids[document_id])
+                if routing is None:
+                    # Edge was removed from Neptune & records don't carry from vertex id
+                    continue
+                document_routings[document_id] = routing
+                self.edge_routing_cache[document_id] = routing
+
+        for action in actions:
+            routing = document_routings.get(action["_id"])
+            if routing:
+                action["routing"] = routing
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+from neptune_to_es.es_helper import *
+from neptune_to_es.neptune_gremlin_es_handler import ElasticSearchGremlinHandler
+from neptune_to_es.neptune_to_es_handler import STALE_CHANGE_FUNCTION
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Painless Script to add fields to respective ES document in flattened layout. Labels are added to "entity_type" &
+# property entries to "flattened_predicates". Both are document level lists, so no per property object is created.
+FLATTENED_ADD_FIELD_SCRIPT = STALE_CHANGE_FUNCTION + '''void add(def object, def key, def value){
+                                   if (object[key] != null) {
+                                      if(!object[key].contains(value)) {
+                                          object[key].add(value)
+                                      }
+                                   }else {
+                                      object[key] = [value]
+                                   }
+                                }
+                                if (isStale(ctx._source, params)) {
+                                    ctx.op = "noop"
+                                } else {
+                                    for (predicate in params.predicates){
+                                        add(ctx._source, predicate["key"], predicate["value"])
+                                    }
+                                    if (params.endpoints != null) {
+                                        ctx._source.putAll(params.endpoints)
+                                    }
+                                    if (params.commit_num != null) {
+                                        ctx._source["stream_position"] = ["commit_num": params.commit_num,
+                                                                          "op_num": params.op_num]
+                                    }
+                                }'''
+
+# Painless Script to delete fields from respective ES document in flattened layout. Document left with neither entity
+# type nor property entries is kept as a tombstone carrying the Stream position of the delete.
+FLATTENED_DROP_FIELD_SCRIPT = STALE_CHANGE_FUNCTION + '''void remove(def object, def key, def value){
+                                    if (object[key] != null) {
+                                        object[key].removeIf(x -> x.equals(value));
+                                        if (object[key].length == 0){
+                                           object.remove(key)
+                                        }
+                                    }
+                                 }
+                                 if (isStale(ctx._source, params)) {
+                                     ctx.op = "noop"
+                                 } else {
+                                     for (predicate in params.predicates){
+                                         remove(ctx._source, predicate["key"], predicate["value"])
+                                     }
+                                     if (params.commit_num != null) {
+                                         ctx._source["stream_position"] = ["commit_num": params.commit_num,
+                                                                           "op_num": params.op_num]
+                                     }
+                                 }'''
+
+
+def __flattened_entry_value__(entry):
+
+    """
+    Gets value of a flattened predicate entry from the value field it is stored in.
+
+    :param entry: Flattened predicate entry
+    :return: Value
+    """
+
+    return next((entry[field] for field in FLATTENED_VALUE_FIELDS.values() if field in entry), None)
+
+
+class ElasticSearchFlattenedGremlinHandler(ElasticSearchGremlinHandler):
+
+    """
+    Replicates Stream records to a target Elastic Search Service using flattened document layout.
+
+    Default layout stores each property as its own "predicates.<key>" field, so every new property adds a mapping
+    to cluster state & needs a put_mapping request. Flattened layout stores all properties of a Vertex / Edge as
+    typed key/value entries of a single nested field with a fixed mapping. Value is stored in the field matching
+    its Elastic Search type (string_value, long_value, double_value, date_value, boolean_value, geo_point_value), so
+    mapping size stays constant irrespective of number of distinct properties in graph.
+
+    Type of a property value is derived from its Neptune datatype, or geo_point for configured geo location fields.
+    Same property can therefore hold values of different types. Use es_helper.get_flattened_term_query &
+    es_helper.get_flattened_range_query to query entries.
+
+    Below is the sample representation of Elastic Search Document in flattened layout.
+
+    VERTEX -
+    {
+        "_index": "amazon_neptune",
+        "_type": "_doc",
+        "_id": "723c31fc529b23952d1f21b165a8f437",
+        "_source": {
+            "entity_id" : "151",
+            "entity_type" : [ "transaction"],
+            "document_type" : "vertex",
+            "flattened_predicates" : [
+                {
+                  "key" : "card4",
+                  "string_value" : "visa"
+                },
+                {
+                  "key" : "TransactionAmt",
+                  "datatype" : "Double",
+                  "double_value" : 68.5
+                }
+            ]
+        }
+    }
+
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.geo_location_fields = set(get_geopoint_properties())
+
+    def get_index_mappings(self):
+
+        """
+        Returns index mappings with fixed mapping for flattened predicates, & feature vector & fingerprint mappings
+        when they are configured.
+        :return: Elastic Search index mappings
+        """
+
+        mappings = self.feature_vectorizer.add_mapping(get_flattened_index_mappings())
+        return self.fingerprint_normaliser.add_mapping(mappings)
+
+    def get_add_field_script(self):
+
+        """
+        Returns Elastic Search Painless script to add fields in Elastic Search Document in flattened layout.
+        :return: Elastic Search Painless script to add/update Fields in Document
+        """
+
+        return FLATTENED_ADD_FIELD_SCRIPT
+
+    def get_drop_field_script(self):
+
+        """
+        Returns Elastic Search Painless script to delete fields from Elastic Search Document in flattened layout.
+        :return: Elastic Search Painless script to delete Fields from Document
+        """
+
+        return FLATTENED_DROP_FIELD_SCRIPT
+
+    def generate_es_field_key(self, record_data):
+
+        """
+        Generates Elastic Search document field Key from Stream Record data. All properties are stored
+        in flattened predicates field.
+
+        :param record_data: Stream Record data
+        :return: Elastic Search Document field key
+        """
+
+        return ElasticSearchDocumentFields.ENTITY_TYPE.value if record_data[PROPERTY_KEY_STR] == LABEL_STR \
+            else ElasticSearchDocumentFields.FLATTENED_PREDICATES.value
+
+    def generate_es_field_value(self, record_data):
+
+        """
+        Generates Elastic Search document flattened predicate entry from Stream Record data.
+
+        :param record_data: Stream Record data
+        :return: Elastic Search Document field value
+        """
+
+        # For Vertex/Edge Label directly return value instead of dictionary
+        if record_data[PROPERTY_KEY_STR] == LABEL_STR:
+            return record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR]
+
+        es_type = record_data[ES_TYPE_STR] if ES_TYPE_STR in record_data else DataType.STRING.value
+        # Value converted while filtering records is reused
+        es_value = record_data[ES_VALUE_STR] if ES_VALUE_STR in record_data \
+            else convert_to_es_value(es_type, record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR])
+        entry = {
+            "key": record_data[PROPERTY_KEY_STR],
+            get_flattened_value_field(es_type): es_value
+        }
+        if record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR].lower() != DataType.STRING.value:
+            entry["datatype"] = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR]
+        return entry
+
+    def get_document_properties(self, source):
+
+        """
+        Gets property values stored in flattened predicates of a document.
+
+        :param source: Elastic Search document source
+        :return: Dict of property key to list of values
+        """
+
+        properties = {}
+        for entry in source.get(ElasticSearchDocumentFields.FLATTENED_PREDICATES.value, []):
+            properties.setdefault(entry["key"], []).append(__flattened_entry_value__(entry))
+        return properties
+
+    def get_property_value(self, record_data):
+
+        """
+        Gets property value of a property Stream record, as stored in flattened predicate entry.
+
+        :param record_data: Stream Record data
+        :return: Property value
+        """
+
+        return __flattened_entry_value__(self.generate_es_field_value(record_data))
+
+    def get_field_mapping_type(self, record_key, record_type, client):
+
+        """
+        Returns Elastic Search type property value is stored as. Derived from Neptune datatype as flattened
+        predicates mapping is fixed.
+
+        :param record_key: Stream record property key
+        :param record_type: Stream record property datatype
+        :param client: Elastic Search client
+        :return: ES datatype string
+        """
+
+        if record_key in self.geo_location_fields:
+            return DataType.GEO_POINT.value
+        return get_es_type_for_neptune_type(record_type)
+
+    def prepare_records(self, records, client):
+
+        """
+        Makes sure index has flattened predicates mapping. No mapping is needed for new properties.
+
+        :param client: Elastic Search client
+        :param records: Stream Records list
+        """
+
+        ensure_flattened_predicates_mapping(client)
+
+    def get_upsert_json(self, record_data_list):
+
+        """
+        Generates Upsert Document value in flattened layout.
+
+        :param record_data_list: List of stream record data referenced to generate upsert Document
+                                 for Elastic search query
+        :return: Upsert Document Json
+        """
+
+        record_data = record_data_list[0]
+        upsert_doc = {
+            ElasticSearchDocumentFields.ENTITY_ID.value: record_data[ID_STR],
+            ElasticSearchDocumentFields.DOCUMENT_TYPE.value: self.get_document_type(record_data)
+        }
+
+        # End vertex ids are stored on edge documents for adjacency lookups & routing
+        upsert_doc.update(self.get_edge_endpoints(record_data_list))
+
+        for record_data in record_data_list:
+            upsert_doc.setdefault(self.generate_es_field_key(record_data), []) \
+                .append(self.generate_es_field_value(record_data))
+
+        return upsert_doc
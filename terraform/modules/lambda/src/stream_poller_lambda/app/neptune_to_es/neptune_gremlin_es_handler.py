@@ -19,10 +19,17 @@ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
 SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-from elasticsearch.exceptions import RequestError
+import collections
 
 from neptune_to_es.es_helper import *
-from neptune_to_es.neptune_to_es_handler import ElasticSearchBaseHandler
+from neptune_to_es.neptune_to_es_handler import ElasticSearchBaseHandler, __base_action__, ES_AGGREGATE_QUERY_SIZE, \
+    aggregator
+from neptune_to_es.edge_backfill import EdgeEndpointBackfill
+from neptune_to_es.fraud_scorer import FraudScorer
+from neptune_to_es.feature_vectors import FeatureVectorizer
+from neptune_to_es.fingerprints import FingerprintNormaliser
+from neptune_to_es.vertex_state import VertexStateLoader
+from neptune_to_es.filter_plan import DropReason, GremlinFilterPlan
 from neptune_to_es.datatype_validators import *
 
 # Logger
@@ -34,6 +41,34 @@ IGNORE_MISSING_DOCUMENT_ERROR = config_provider.get_handler_additional_param('Ig
 DROP_EDGE = config_provider.get_handler_additional_param('ReplicationScope') == 'nodes'
 datatypes = set(datatype.value for datatype in DataType)
 
+# Maintain adjacency summaries of edges on end vertex documents. Disabled by default.
+ADJACENCY_SUMMARIES = config_provider.get_handler_additional_param('AdjacencySummaries', 'false') == 'true'
+
+# Painless Script to add / remove edges in adjacency summary of a vertex document. Edges are tracked by id, which
+# makes replayed or duplicate records safe without stream position check. Edge & neighbour ids are kept in
+# parallel lists, so that parallel edges between two vertices are counted separately.
+ADJACENCY_SCRIPT = '''if (ctx._source["adjacency"] == null) {
+                         ctx._source["adjacency"] = new HashMap()
+                     }
+                     for (change in params.changes) {
+                         def direction = ctx._source.adjacency.computeIfAbsent(change["direction"],
+                                                                               k -> new HashMap());
+                         def summary = direction.computeIfAbsent(change["label"],
+                                                                 k -> ["edges": [], "neighbours": [], "degree": 0]);
+                         int position = summary.edges.indexOf(change["edge"]);
+                         if (change["op"] == "ADD" && position < 0) {
+                             summary.edges.add(change["edge"]);
+                             summary.neighbours.add(change["neighbour"])
+                         } else if (change["op"] == "REMOVE" && position >= 0) {
+                             summary.edges.remove(position);
+                             summary.neighbours.remove(position)
+                         }
+                         summary.degree = summary.edges.size();
+                         if (summary.degree == 0) {
+                             direction.remove(change["label"])
+                         }
+                     }'''
+
 class ElasticSearchGremlinHandler(ElasticSearchBaseHandler):
 
     """
@@ -95,8 +130,16 @@ class ElasticSearchGremlinHandler(ElasticSearchBaseHandler):
     """
 
     def __init__(self):
+        # Feature vector & fingerprint mappings are part of index mappings, so their stages are needed before index
+        # is set up
+        self.feature_vectorizer = FeatureVectorizer()
+        self.fingerprint_normaliser = FingerprintNormaliser()
+        # Replication rules compiled once, see GremlinFilterPlan
+        self.filter_plan = GremlinFilterPlan(DROP_EDGE)
         super().__init__()
         self.add_query_builder_map()
+        self.vertex_state_loader = VertexStateLoader(self)
+        self.fraud_scorer = FraudScorer(self.vertex_state_loader)
 
     def add_query_builder_map(self):
         # If IGNORE_MISSING_DOCUMENT is set to true than need to do upsert while adding property for vertex/ edge
@@ -164,16 +207,81 @@ class ElasticSearchGremlinHandler(ElasticSearchBaseHandler):
         if record_data[PROPERTY_KEY_STR] == LABEL_STR:
             return record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR]
 
+        # Value converted while filtering records is reused
+        es_value = record_data[ES_VALUE_STR] if ES_VALUE_STR in record_data \
+            else convert_to_es_value(es_type, predicate_value)
         if record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR].lower() == DataType.STRING.value:
             return {
-                "value": convert_to_es_value(es_type, predicate_value)
+                "value": es_value
             }
         else:
             return {
-                "value": convert_to_es_value(es_type, predicate_value),
+                "value": es_value,
                 "datatype": record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR]
             }
 
+    def prepare_records(self, records, client):
+
+        """
+        Creates Elastic Search mappings for all new properties present in Stream records using a single
+        put_mapping request. Property records which would be dropped by filter_records are not considered.
+        Mapping type is inferred from the first record found for a property.
+
+        :param client: Elastic Search client
+        :param records: Stream Records list
+        """
+
+        # Labels of vertices & edges are needed to check property records against replication rules
+        self.filter_plan.resolve_labels(client, records, self.index_router.candidate_indices(client),
+                                        self.shard_router.edge_routing_cache)
+
+        # Handling property names representing geoPoint data. Passed by users as config value.
+        ensure_geo_location_mapping(client)
+
+        # Copy of Neptune ES index mappings shared across Stream batches. Refreshed on TTL expiry.
+        es_index_mapping_cache = get_index_mapping(client)
+
+        new_fields = collections.OrderedDict()
+        for record in records:
+            record_data = record[DATA_STR]
+            if record_data[TYPE_STR] not in ["vp", "ep"] or self.filter_plan.check(record_data):
+                continue
+
+            record_type = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR]
+            record_key = record_data[PROPERTY_KEY_STR]
+            if record_key in new_fields:
+                continue
+
+            if not get_current_mapping_for_predicate(record_key, es_index_mapping_cache):
+                new_fields[record_key] = record_type
+
+        add_mappings_to_es(client, es_index_mapping_cache, new_fields)
+
+    def get_document_type(self, record_data):
+
+        """
+        Gets type of Elastic Search document Stream Record data belongs to.
+
+        :param record_data: Stream Record data
+        :return: vertex for vertex label/ property records, edge otherwise
+        """
+
+        return DocumentType.VERTEX.value if record_data[TYPE_STR] in ["vl", "vp"] else DocumentType.EDGE.value
+
+    def get_field_mapping_type(self, record_key, record_type, client):
+
+        """
+        Returns Elastic Search type property values are stored as. Looked up in Neptune ES index mappings
+        shared across Stream batches & refreshed on TTL expiry.
+
+        :param record_key: Stream record property key
+        :param record_type: Stream record property datatype
+        :param client: Elastic Search client
+        :return: ES datatype string or None if property has no mapping
+        """
+
+        return get_current_mapping_for_predicate(record_key, get_index_mapping(client))
+
     def filter_records(self, records, client):
 
         """
@@ -184,88 +292,263 @@ class ElasticSearchGremlinHandler(ElasticSearchBaseHandler):
         2) drop a record representing property, if its value is of type present in excluded_types
         3) drop a record representing property, if its value cannot be converted to an existing ES mapping.
         4) drop a record representing property, if its data type is not a valid Gremlin type
+        5) drop a record of a vertex or edge, if its labels or property are not in scope of ReplicationRulesFile
+
+        Cases 0), 1), 2), 4) & 5) are looked up in filter plan compiled once, see GremlinFilterPlan. Dropped records
+        are counted per DropReason & published as metrics. Dropped records still advance checkpoint.
+        Mappings for new properties are expected to be created by prepare_records before records are filtered.
+        Labels of vertices & edges are resolved by prepare_records for the whole batch. Property values are coerced
+        to ES format grouped by ES type, see coerce_batch. Coerced values are kept in records & reused by actions
+        and upserts.
 
         :param client: Elastic Search client
         :param records: Stream Records list
         :return: Filtered Record List
         """
 
-        # Property types to be excluded
-        excluded_types = get_excluded_datatypes("gremlin")
-        # Properties to be excluded
-        excluded_properties = get_excluded_properties()
-
-        # Copy of Neptune ES index mappings. For each Stream API call we fetch mappings once.
-        es_index_mapping_cache = client.indices.get_mapping(index='amazon_neptune')
-
-        # Handling property names representing geoPoint data. Passed by users as config value.
-        add_geo_location_mapping(client, es_index_mapping_cache)
-
+        # Property records to be validated, grouped by (ES type, epoch date) & kept in Stream order
+        property_records = collections.OrderedDict()
+        kept_records = []
         for record in records:
 
             record_data = record[DATA_STR]
-            if DROP_EDGE and record_data[TYPE_STR] in ["e", "ep"]:
-                # Case  0) drop a record representing edge or edge property if user has selected to drop edge updates.
-                logger.debug("Dropping Record : Edge updates not needed to process - {}".format(str(record_data)))
+            # Cases 0), 1), 2), 4) & 5) only depend on (type, labels, key, datatype) & are looked up in filter plan
+            drop_reason = self.filter_plan.check(record_data)
+            if drop_reason:
+                self.count_dropped_record(drop_reason, record_data)
             elif record_data[TYPE_STR] in ["vp", "ep"]:
                 record_type = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR]
-                record_value = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR]
                 record_key = record_data[PROPERTY_KEY_STR]
 
-                if record_type.lower() not in datatypeMapping:
-                    # Case 4) drop a record representing property, if its data type is not a valid Gremlin type
-                    logger.debug("Dropping Record : Data type not a valid Gremlin type for record {}".format(str(record_data)))
+                # Get current type mapping for key
+                field_mapping_type_in_es = self.get_field_mapping_type(record_key, record_type, client)
+
+                if not field_mapping_type_in_es:
+                    # case 3) drop a record representing property, if mapping could not be created for it due to
+                    # a conflicting type mapping already present in index.
+                    self.count_dropped_record(DropReason.MAPPING_CONFLICT, record_data)
                     continue
 
-                # convert milliseconds to iso date format string. This conversion is done as we
-                # don't want to validate long value to be valid for conversion to Date format.
-                if record_type.lower() == DataType.DATE.value:
-                    record_value = get_date_time_from_millis(record_value)
+                # Milliseconds of date properties are validated as iso date format string, as we don't want to
+                # validate long value to be valid for conversion to Date format.
+                record_data[ES_TYPE_STR] = field_mapping_type_in_es
+                property_records.setdefault((field_mapping_type_in_es, record_type.lower() == DataType.DATE.value),
+                                            []).append(record_data)
+                kept_records.append(record)
+            else:
+                kept_records.append(record)
 
-                if record_key.strip() in excluded_properties:
-                    # Case 1) drop a record representing property, if it is present in excluded_properties
-                    logger.debug("Dropping Record : Property name found in indicated properties "
-                                 "to exclude for record {}".format(str(record_data)))
-                    continue
+        for (es_type, epoch_dates), records_data in property_records.items():
+            es_values = coerce_batch(
+                [record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR] for record_data in records_data],
+                es_type, epoch_dates)
+            for record_data, es_value in zip(records_data, es_values):
+                record_data[ES_VALUE_STR] = es_value
 
-                if record_type.strip().lower() in excluded_types:
-                    # Case 2) drop a record representing property, if its value is of type present in excluded_types
-                    logger.debug("Dropping Record : Property type found in indicated datatypes to exclude for record {}"
-                                 .format(str(record_data)))
-                    continue
+        for record in kept_records:
+            record_data = record[DATA_STR]
+            if isinstance(record_data.get(ES_VALUE_STR, None), InvalidValue):
+                # case 3) drop a record representing property, if its value cannot be converted
+                # to an existing ES mapping.
+                self.count_dropped_record(DropReason.INVALID_VALUE, record_data)
+                continue
+            yield record
 
-                # Get current type mapping for key from local mapping store
-                field_mapping_type_in_es = get_current_mapping_for_predicate(record_key, es_index_mapping_cache)
+    def __generate_aggregated_es_actions__(self, records):
 
-                # If no mapping exists for property key, then create it
-                if not field_mapping_type_in_es:
-                    try:
-                        es_index_mapping_cache = add_mapping_to_es(client, es_index_mapping_cache, record_key,
-                                                                   record_type)
-                        record_data[ES_TYPE_STR] = get_es_type_for_neptune_type(record_type)
-                        yield record
-                    except RequestError as e:
-                        if e.error == "illegal_argument_exception":
-                            # case 3) drop a record representing property, if its value cannot be converted
-                            logger.debug("Concurrency issue detected! - {}. Property mapping with conflicting "
-                                         "type already exists in index. Refreshing mappings.".format(str(e)))
-                            es_index_mapping_cache = client.indices.get_mapping(index='amazon_neptune')
-                            logger.debug("Dropping Record : Property value does not match index "
-                                         "type mapping for record {}".format(str(record_data)))
-                        else:
-                            raise e
-                else:
-                    # If mapping does exist, validate property type and/or value against ES type mapping
-                    if validate(record_value, field_mapping_type_in_es):
-                        record_data[ES_TYPE_STR] = field_mapping_type_in_es
-                        yield record
-                    else:
-                        # case 3) drop a record representing property, if its value cannot be converted
-                        # to an existing ES mapping.
-                        logger.debug("Dropping Record : Property type does not match indexed type mapping - {} for record {}"
-                                     .format(field_mapping_type_in_es, str(record_data)))
+        """
+        Generate Elastic search Actions for Bulk API call. When adjacency summaries are enabled, adjacency summary
+        update of an end vertex is emitted with the actions of the vertex's own bundle, or with the actions of the
+        first edge bundle referencing it if the vertex has no records in the batch. Updates not emitted with any
+        bundle are emitted last.
+
+        :param records: Stream Records
+        :return: Python Generator object yielding Elastic search Actions for Bulk API call
+        """
+
+        if not ADJACENCY_SUMMARIES:
+            yield from super().__generate_aggregated_es_actions__(records)
+            return
+
+        adjacency_actions = self.__generate_adjacency_actions__(records)
+        aggregate_map = aggregator.aggregate_records(records)
+        bundled_vertex_ids = {records_set[RECORDS_STR][0][ID_STR]
+                              for aggregate_entry in aggregate_map.values()
+                              for records_set in aggregate_entry[RECORDS_SET_STR]
+                              if records_set[RECORDS_STR][0][TYPE_STR] in ["vl", "vp"]}
+
+        for aggregate_entry in aggregate_map.values():
+            for records_set in aggregate_entry[RECORDS_SET_STR]:
+                yield from self.build_query(records_set[OPERATION_STR],
+                                            split_list(records_set[RECORDS_STR], ES_AGGREGATE_QUERY_SIZE))
+
+            record_data = aggregate_entry[RECORDS_SET_STR][0][RECORDS_STR][0]
+            if record_data[TYPE_STR] in ["vl", "vp"]:
+                vertex_ids = [record_data[ID_STR]]
             else:
-                yield record
+                # Edge bundle can start with edge property records, so end vertices are taken from any edge record
+                vertex_ids = [vertex_id
+                              for records_set in aggregate_entry[RECORDS_SET_STR]
+                              for edge_data in records_set[RECORDS_STR] if edge_data[TYPE_STR] == "e"
+                              for vertex_id in [edge_data[FROM_VERTEX_STR], edge_data[TO_VERTEX_STR]]
+                              if vertex_id not in bundled_vertex_ids]
+            for vertex_id in vertex_ids:
+                if vertex_id in adjacency_actions:
+                    yield adjacency_actions.pop(vertex_id)
+
+        yield from adjacency_actions.values()
+
+    def __generate_adjacency_actions__(self, records):
+
+        """
+        Generates actions updating adjacency summaries of end vertex documents from edge records. Changes for a
+        vertex are batched in a single scripted update, in Stream order. Vertex documents missing in Elastic Search
+        are created from a skeleton document when edges are added.
+
+        :param records: Stream Records
+        :return: OrderedDict of vertex id to Elastic search Action for Bulk API call
+        """
+
+        vertex_changes = collections.OrderedDict()
+        for record in records:
+            record_data = record[DATA_STR]
+            if record_data[TYPE_STR] != "e":
+                continue
+
+            label = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR]
+            for vertex_id, direction, neighbour_id in [
+                    (record_data[FROM_VERTEX_STR], "out", record_data[TO_VERTEX_STR]),
+                    (record_data[TO_VERTEX_STR], "in", record_data[FROM_VERTEX_STR])]:
+                vertex_changes.setdefault(vertex_id, []).append({
+                    "op": record[OPERATION_STR],
+                    "direction": direction,
+                    "label": label,
+                    "edge": record_data[ID_STR],
+                    "neighbour": neighbour_id
+                })
+
+        adjacency_actions = collections.OrderedDict()
+        for vertex_id, changes in vertex_changes.items():
+            action = __base_action__(generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"}), "update")
+            action["script"] = {
+                "source": ADJACENCY_SCRIPT,
+                "lang": "painless",
+                "params": {
+                    "changes": changes
+                }
+            }
+            # Removing edges alone doesn't create a document for a vertex removed already
+            if any(change["op"] == "ADD" for change in changes):
+                action["scripted_upsert"] = True
+                action["upsert"] = {
+                    ElasticSearchDocumentFields.ENTITY_ID.value: vertex_id,
+                    ElasticSearchDocumentFields.DOCUMENT_TYPE.value: DocumentType.VERTEX.value
+                }
+            adjacency_actions[vertex_id] = action
+        return adjacency_actions
+
+    def get_edge_endpoints(self, record_data_list):
+
+        """
+        Gets end vertex ids of an edge from Stream records. Only edge records carry them.
+
+        :param record_data_list: List of stream record data of a document
+        :return: Dict of from_id & to_id fields, empty if no edge record is present
+        """
+
+        for record_data in record_data_list:
+            if FROM_VERTEX_STR in record_data:
+                return {
+                    ElasticSearchDocumentFields.FROM_ID.value: record_data[FROM_VERTEX_STR],
+                    ElasticSearchDocumentFields.TO_ID.value: record_data[TO_VERTEX_STR]
+                }
+        return {}
+
+    def __update_query__(self, record_data_lists, operation, require_upsert=False):
+
+        """
+        Generates Elastic Search action to update a document. End vertex ids of added edges are passed to update
+        script as well, so that edge documents created by edge property records get them.
+
+        :param record_data_lists: List of bundle of Stream records data which can be combined together to  create
+         single Elastic search action.
+        :param operation: Stream record operation i.e. ADD or REMOVE
+        :param require_upsert: Boolean to check if Upsert Document is required for Elastic Search Update Action.
+        :return: Elastic Search action to update a document
+        """
+
+        for record_data_list, action in zip(record_data_lists, super().__update_query__(record_data_lists, operation,
+                                                                                          require_upsert)):
+            edge_endpoints = self.get_edge_endpoints(record_data_list) if operation == "ADD" else None
+            if edge_endpoints:
+                action["script"]["params"]["endpoints"] = edge_endpoints
+            yield action
+
+    def get_document_properties(self, source):
+
+        """
+        Gets property values stored in a Gremlin document.
+
+        :param source: Elastic Search document source
+        :return: Dict of property key to list of values
+        """
+
+        return {key: [entry[ElasticSearchDocumentFields.VALUE.value] for entry in entries]
+                for key, entries in source.get(ElasticSearchDocumentFields.PREDICATES.value, {}).items()}
+
+    def get_property_value(self, record_data):
+
+        """
+        Gets property value of a property Stream record, as stored in Elastic Search document.
+
+        :param record_data: Stream Record data
+        :return: Property value
+        """
+
+        return self.generate_es_field_value(record_data)[ElasticSearchDocumentFields.VALUE.value]
+
+    def generate_derived_actions(self, records, es_client, index=None):
+
+        """
+        Generates actions writing fraud score, feature vector & fingerprints of vertices changed by Stream records.
+        Changed vertices are loaded once for all of them. See FraudScorer, FeatureVectorizer & FingerprintNormaliser.
+
+        :param records: Chunk of filtered Stream records
+        :param es_client: Elastic Search Client
+        :param index: Index being built by reindex vertices are loaded from. Defaults to index alias.
+        :return: List of Elastic Search Bulk API actions
+        """
+
+        if not self.fraud_scorer.rules and not self.feature_vectorizer.features \
+                and not self.fingerprint_normaliser.patterns:
+            return []
+
+        states = self.vertex_state_loader.load_changed_states(es_client, records, index)
+        return self.fraud_scorer.generate_actions(es_client, states, index) + \
+            self.feature_vectorizer.generate_actions(es_client, states) + \
+            self.fingerprint_normaliser.generate_actions(es_client, records, states)
+
+    def get_index_mappings(self):
+
+        """
+        Returns index mappings with feature vector & fingerprint mappings when they are configured.
+        :return: Elastic Search index mappings
+        """
+
+        mappings = self.feature_vectorizer.add_mapping(super().get_index_mappings())
+        return self.fingerprint_normaliser.add_mapping(mappings)
+
+    def run_document_maintenance(self, es_client, state_store, execution_end_time):
+
+        """
+        Backfills end vertex ids of edge documents indexed before they were stored. See EdgeEndpointBackfill.
+
+        :param es_client: Elastic Search Client
+        :param state_store: Store to persist maintenance state across Lambda invocations
+        :param execution_end_time: Time in milliseconds by which maintenance should return
+        """
+
+        EdgeEndpointBackfill(es_client, state_store).run(execution_end_time)
 
     def get_upsert_json(self, record_data_list):
 
@@ -279,16 +562,17 @@ class ElasticSearchGremlinHandler(ElasticSearchBaseHandler):
         """
 
         record_data = record_data_list[0]
-        operation_type = record_data[TYPE_STR]
-        document_type = DocumentType.VERTEX.value if operation_type in ["vl", "vp"] else DocumentType.EDGE.value
         entity_id = record_data[ID_STR]
 
         # Adding Subject & Document Type to upsert document model
         upsert_doc = {
             ElasticSearchDocumentFields.ENTITY_ID.value: entity_id,
-            ElasticSearchDocumentFields.DOCUMENT_TYPE.value: document_type
+            ElasticSearchDocumentFields.DOCUMENT_TYPE.value: self.get_document_type(record_data)
         }
 
+        # End vertex ids are stored on edge documents for adjacency lookups & routing
+        upsert_doc.update(self.get_edge_endpoints(record_data_list))
+
         # Adding Predicates to the upsert Document
         for record_data in record_data_list:
             field_key = self.generate_es_field_key(record_data)
@@ -24,6 +24,7 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 from neptune_to_es.es_helper import *
 from neptune_to_es.neptune_gremlin_es_handler import ElasticSearchGremlinHandler
 from neptune_to_es.datatype_validators import *
+from neptune_to_es.filter_plan import DropReason
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -130,6 +131,19 @@ class ElasticSearchStringOnlyGremlinHandler(ElasticSearchGremlinHandler):
             "value": self.__convert_property_value__(record_data[PROPERTY_VALUE_STR])
         }
 
+    def prepare_records(self, records, client):
+
+        """
+        Resolves labels of vertices & edges present in Stream records, to check records against replication rules.
+        String data is mapped by dynamic templates, so no mappings need to be created before filtering records.
+
+        :param client: Elastic Search client
+        :param records: Stream Records list
+        """
+
+        self.filter_plan.resolve_labels(client, records, self.index_router.candidate_indices(client),
+                                        self.shard_router.edge_routing_cache)
+
     def filter_records(self, records, client):
 
         """
@@ -137,6 +151,9 @@ class ElasticSearchStringOnlyGremlinHandler(ElasticSearchGremlinHandler):
         For Gremlin Language, Stream Records are filtered out based on below logic:
         0) drop a record representing edge or edge property if user has selected to drop edge updates.
         1) drop a record representing property, if its value is not of type string
+        2) drop a record of a vertex or edge, if its labels or property are not in scope of ReplicationRulesFile
+
+        Labels of vertices & edges are resolved by prepare_records for the whole batch.
 
         :param client: Elastic Search client
         :param records: Stream Records list
@@ -146,11 +163,12 @@ class ElasticSearchStringOnlyGremlinHandler(ElasticSearchGremlinHandler):
         for record in records:
 
             record_data = record[DATA_STR]
-            if DROP_EDGE and record_data[TYPE_STR] in ["e", "ep"]:
-                # Case  0) drop a record representing edge or edge property if user has selected to drop edge updates.
-                logger.debug("Dropping Record : Edge updates not needed to process - {}".format(str(record_data)))
+            # Cases 0) & 2) are looked up in filter plan, see GremlinFilterPlan.check_scope
+            drop_reason = self.filter_plan.check_scope(record_data)
+            if drop_reason:
+                self.count_dropped_record(drop_reason, record_data)
             elif record_data[TYPE_STR] in ["vp", "ep"] and not (record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR].lower() == "string"):
                 # Case 1) drop a record representing property, if its value is not of type string
-                logger.debug("Dropping Record : Property value is not string for record {}".format(str(record_data)))
+                self.count_dropped_record(DropReason.NON_STRING_VALUE, record_data)
             else:
                 yield record
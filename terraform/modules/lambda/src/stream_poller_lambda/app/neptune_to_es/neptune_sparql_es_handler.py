@@ -23,10 +23,11 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 from rdflib.term import BNode, Literal
 from neptune_to_es.datatype_validators import *
 from neptune_to_es.es_helper import *
-from elasticsearch.exceptions import RequestError
 from commons import *
 from neptune_to_es.neptune_to_es_handler import ElasticSearchBaseHandler
+from neptune_to_es.filter_plan import DropReason, SparqlFilterPlan
 from config_provider import config_provider
+import collections
 import math
 
 # Logger
@@ -106,6 +107,8 @@ class ElasticSearchSparqlHandler(ElasticSearchBaseHandler):
         """
 
     def __init__(self):
+        # Replication rules compiled once, see SparqlFilterPlan
+        self.filter_plan = SparqlFilterPlan()
         super().__init__()
         self.add_query_builder_map()
 
@@ -168,11 +171,12 @@ class ElasticSearchSparqlHandler(ElasticSearchBaseHandler):
         obj_value = statement_elements[OBJECT].value if statement_elements[OBJECT].value \
             else str(statement_elements[OBJECT].toPython())
 
-        # Converter here
+        # Converter here. Value coerced while filtering records is reused
         if statement_elements[OBJECT].datatype:
 
             value = {
-                "value": convert_to_es_value(es_type, obj_value),
+                "value": record_data[ES_VALUE_STR] if ES_VALUE_STR in record_data
+                else convert_to_es_value(es_type, obj_value),
                 "datatype": str(statement_elements[OBJECT].datatype)
             }
         else:
@@ -191,6 +195,93 @@ class ElasticSearchSparqlHandler(ElasticSearchBaseHandler):
 
         return value
 
+    def get_document_type(self, record_data):
+
+        """
+        Gets type of Elastic Search document Stream Record data belongs to. All Sparql documents represent
+        a RDF resource.
+
+        :param record_data: Stream Record data
+        :return: rdf-resource
+        """
+
+        return DocumentType.RDF_RESOURCE.value
+
+    def __check_literal__(self, statement_elements):
+
+        """
+        Checks literal object of a parsed Sparql statement against filtering rules 3) to 6) of filter_records.
+        Rules 3) & 4) are looked up in filter plan, see SparqlFilterPlan.
+
+        :param statement_elements: Parsed Sparql statement with a literal object
+        :return: Tuple of (DropReason, predicate key, object value, object datatype token). Drop reason is None
+                 if literal can be replicated.
+        """
+
+        obj_key = str(statement_elements[PREDICATE])
+        obj_value = statement_elements[OBJECT].value if statement_elements[OBJECT].value \
+            else str(statement_elements[OBJECT].toPython())
+        obj_datatype = str(statement_elements[OBJECT].datatype)
+        obj_datatype_token = get_datatype_token(obj_datatype).strip().lower()
+        # case 3) Predicate name present in excluded_properties list
+        # case 4) Object type is present in excluded_types list
+        drop_reason = self.filter_plan.check(obj_key, obj_datatype_token)
+
+        if drop_reason:
+            return drop_reason, obj_key, obj_value, obj_datatype_token
+
+        if obj_datatype_token == DataType.STRING.value and statement_elements[OBJECT].language \
+                and not validate_language(statement_elements[OBJECT].language):
+            # case 5) Object if of type lang literal and lang fails regex check
+            drop_reason = DropReason.INVALID_LANGUAGE
+
+        elif obj_datatype_token in {DataType.FLOAT.value, DataType.DOUBLE.value, DataType.DECIMAL.value}:
+            # Need to confirm is obj_value is float otherwise error is thrown
+            if is_valid_float_value(obj_value) and (math.isinf(float(obj_value)) or math.isnan(float(obj_value))):
+                # case 6) Object if of type Float/ Double / Decimal  literal and value is not finite
+                # i.e. NaN, INF, -INF
+                drop_reason = DropReason.NON_FINITE_VALUE
+
+        return drop_reason, obj_key, obj_value, obj_datatype_token
+
+    def prepare_records(self, records, client):
+
+        """
+        Parses Sparql statements & creates Elastic Search mappings for all new predicates present in Stream records
+        using a single put_mapping request. Statements which would be dropped by filter_records are not considered.
+        Mapping type is inferred from the first valid literal found for a predicate.
+
+        :param client: ElasticSearch client
+        :param records: Stream records list
+        """
+
+        # Handling property names representing geoPoint data. Passed by users as config value.
+        ensure_geo_location_mapping(client)
+
+        # Copy of Neptune ES index mappings shared across Stream batches. Refreshed on TTL expiry.
+        es_index_mapping_cache = get_index_mapping(client)
+
+        new_fields = collections.OrderedDict()
+        for record in records:
+            record_data = record[DATA_STR]
+            statement_elements = parse_sparql_statement(record_data)
+            # Storing parsed SPARQL statement in-memory for further usage
+            record_data[ELEMENTS_STR] = statement_elements
+            if isinstance(statement_elements[SUBJECT], BNode) or statement_elements[PREDICATE].eq(RDF_TYPE) \
+                    or not isinstance(statement_elements[OBJECT], Literal) \
+                    or self.filter_plan.check_statement(statement_elements):
+                continue
+
+            drop_reason, obj_key, obj_value, obj_datatype_token = self.__check_literal__(statement_elements)
+            if drop_reason or obj_key in new_fields \
+                    or get_current_mapping_for_predicate(obj_key, es_index_mapping_cache):
+                continue
+
+            if not isinstance(coerce(obj_value, get_es_type_for_neptune_type(obj_datatype_token)), InvalidValue):
+                new_fields[obj_key] = obj_datatype_token
+
+        add_mappings_to_es(client, es_index_mapping_cache, new_fields)
+
     def filter_records(self, records, client):
 
         """
@@ -204,120 +295,70 @@ class ElasticSearchSparqlHandler(ElasticSearchBaseHandler):
         6) Object if of type Float/ Double literal and value is not finite i.e. NaN, INF, -INF
         7) Property value invalid for property type specified for record
         8) Object is any literal and its value cannot be converted to appropriate ES type.
+        9) Graph or predicate of statement is not in scope of ReplicationRulesFile
 
+        Mappings for new predicates are expected to be created by prepare_records before records are filtered.
+        Dropped records are counted per DropReason & published as metrics. Dropped records still advance checkpoint.
 
         :param client: ElasticSearch client
         :param records: Stream records list
         :return: Filtered records list
         """
 
-        excluded_types = get_excluded_datatypes("sparql")
-        excluded_properties = get_excluded_properties()
-
-        # Copy of Neptune ES index mappings for local use
-        es_index_mapping_cache = client.indices.get_mapping(index='amazon_neptune')
-
-        # Handling property names representing geoPoint data. Passed by users as config value.
-        add_geo_location_mapping(client, es_index_mapping_cache)
+        # Copy of Neptune ES index mappings shared across Stream batches. Refreshed on TTL expiry.
+        es_index_mapping_cache = get_index_mapping(client)
 
         for record in records:
             record_data = record[DATA_STR]
-            statement_elements = parse_sparql_statement(record_data)
-            # Storing parsed SPARQL statement in-memory for further usage
-            record_data[ELEMENTS_STR] = statement_elements
-            if isinstance(statement_elements[SUBJECT], BNode):
+            if ELEMENTS_STR in record_data:
+                statement_elements = record_data[ELEMENTS_STR]
+            else:
+                statement_elements = parse_sparql_statement(record_data)
+                # Storing parsed SPARQL statement in-memory for further usage
+                record_data[ELEMENTS_STR] = statement_elements
+            # case 9) Graph or predicate not in scope of ReplicationRulesFile
+            drop_reason = self.filter_plan.check_statement(statement_elements)
+            if drop_reason:
+                self.count_dropped_record(drop_reason, record_data)
+            elif isinstance(statement_elements[SUBJECT], BNode):
                 # case 1) Subject is a Blank Node
-                logger.debug("Dropping Record : Rdf Resource is represented by Blank Node for record {}"
-                             .format(str(record_data)))
+                self.count_dropped_record(DropReason.BLANK_NODE, record_data)
             elif statement_elements[PREDICATE].neq(RDF_TYPE):
                 # case 2) Object is a Resource for predicates other than rdf:type
                 if not isinstance(statement_elements[OBJECT], Literal):
-                    logger.debug("Dropping Record : Rdf Object value is not a literal for record {}"
-                                 .format(str(record_data)))
+                    self.count_dropped_record(DropReason.RESOURCE_OBJECT, record_data)
+                    continue
+
+                drop_reason, obj_key, obj_value, obj_datatype_token = self.__check_literal__(statement_elements)
+                if drop_reason:
+                    # case 3) to 6)
+                    self.count_dropped_record(drop_reason, record_data)
+                    continue
+
+                # Get current type mapping for key from local mapping store
+                field_mapping_type_in_es = get_current_mapping_for_predicate(obj_key, es_index_mapping_cache)
+
+                if not field_mapping_type_in_es:
+                    if isinstance(coerce(obj_value, get_es_type_for_neptune_type(obj_datatype_token)), InvalidValue):
+                        # case 7) Property value invalid for property type specified for record
+                        self.count_dropped_record(DropReason.INVALID_VALUE, record_data)
+                    else:
+                        # case 8) Mapping could not be created as mapping with conflicting type already exists
+                        self.count_dropped_record(DropReason.MAPPING_CONFLICT, record_data)
                 else:
-                    obj_key = str(statement_elements[PREDICATE])
-                    obj_value = statement_elements[OBJECT].value if statement_elements[OBJECT].value \
-                        else str(statement_elements[OBJECT].toPython())
-                    obj_datatype = str(statement_elements[OBJECT].datatype)
-                    obj_datatype_token = get_datatype_token(obj_datatype).strip().lower()
-
-                    if obj_key.strip() in excluded_properties:
-                        # case 3) Predicate name present in excluded_properties list
-                        logger.debug("Dropping Record : Property name found in list of indicated properties to exclude for record {}"
-                                     .format(str(record_data)))
-                        continue
-
-                    if obj_datatype_token in excluded_types:
-                        # case 4) Object type is present in excluded_types list
-                        logger.debug(
-                            "Dropping Record : Property type found in list of indicated datatypes to exclude for record {}"
-                                .format(str(record_data)))
+                    # Validate property type and/or value against ES type mapping. Coerced value is kept in record &
+                    # reused by actions and upserts.
+                    es_value = coerce(obj_value, field_mapping_type_in_es)
+                    if isinstance(es_value, InvalidValue):
+                        # case 8) Object is any literal and its value cannot be converted to appropriate ES type.
+                        self.count_dropped_record(DropReason.INVALID_VALUE, record_data)
                         continue
-
-                    if obj_datatype_token == DataType.STRING.value and statement_elements[OBJECT].language:
-                        obj_lang = statement_elements[OBJECT].language
-                        if not validate_language(obj_lang):
-                            # case 5) Object if of type lang literal and lang fails regex check
-                            logger.debug(
-                                "Dropping Record : String literal has invalid language tag for record {}"
-                                .format(str(record_data))
-                            )
-                            continue
-
-                    if obj_datatype_token in {DataType.FLOAT.value, DataType.DOUBLE.value, DataType.DECIMAL.value}:
-                        # Need to confirm is obj_value is float otherwise error is thrown
-                        if is_valid_float_value(obj_value) and (math.isinf(float(obj_value)) or math.isnan(float(obj_value))):
-                            # case 6) Object if of type Float/ Double / Decimal  literal and value is not finite
-                            # i.e. NaN, INF, -INF
-                            logger.debug(
-                                "Dropping Record : Float literal does not have finite value for record {}"
-                                    .format(str(record_data)))
-                            continue
-
-                    # Get current type mapping for key from local mapping store
-                    field_mapping_type_in_es = get_current_mapping_for_predicate(obj_key, es_index_mapping_cache)
-
-                    # If no mapping exists for property key, then create it
-                    if not field_mapping_type_in_es:
-                        # Strings always get dynamic mapped correctly by ES
-                        try:
-                            field_mapping_type_in_es = get_es_type_for_neptune_type(obj_datatype_token)
-                            if validate(obj_value, field_mapping_type_in_es):
-                                es_index_mapping_cache = add_mapping_to_es(client, es_index_mapping_cache, obj_key,
-                                                                           obj_datatype_token)
-                                record_data[ES_TYPE_STR] = field_mapping_type_in_es
-                                yield record
-                            else:
-                                # case 7) Property value invalid for property type specified for record
-                                logger.debug(
-                                    "Dropping Record : Property value invalid for property type specified for record {}"
-                                    .format(str(record_data))
-                                )
-                        except RequestError as e:
-                            if e.error == "illegal_argument_exception":
-                                # case 8) Object is any literal and its value cannot be converted to appropriate ES type.
-                                logger.debug("Concurrency issue detected! - {}. Property mapping with conflicting "
-                                             "type already exists in index. Refreshing mappings.".format(str(e)))
-                                es_index_mapping_cache = client.indices.get_mapping(index='amazon_neptune')
-                                logger.debug("Dropping Record : Property value does not match index "
-                                             "type mapping for record {}".format(str(record_data)))
-                            else:
-                                raise e
-                    else:
-                        # If mapping does exist, validate property type and/or value against ES type mapping
-                        if validate(obj_value, field_mapping_type_in_es):
-                            record_data[ES_TYPE_STR] = field_mapping_type_in_es
-                            yield record
-                        else:
-                            # case 8) Object is any literal and its value cannot be converted to appropriate ES type.
-                            logger.debug(
-                                "Dropping Record : Property type does not match indexed type mapping for record {}"
-                                .format(str(record_data))
-                            )
+                    record_data[ES_TYPE_STR] = field_mapping_type_in_es
+                    record_data[ES_VALUE_STR] = es_value
+                    yield record
             else:
                 yield record
 
-
     def get_upsert_json(self, record_data_list):
 
         """
@@ -23,6 +23,7 @@ from rdflib.term import BNode, Literal
 from neptune_to_es.es_helper import *
 from commons import parse_sparql_statement
 from neptune_to_es.neptune_sparql_es_handler import ElasticSearchSparqlHandler
+from neptune_to_es.filter_plan import DropReason
 from config_provider import config_provider
 
 ENABLE_NON_STRING_INDEXING = config_provider.get_handler_additional_param('EnableNonStringIndexing') == 'true'
@@ -137,6 +138,17 @@ class ElasticSearchStringOnlySparqlHandler(ElasticSearchSparqlHandler):
 
         return value
 
+    def prepare_records(self, records, client):
+
+        """
+        String data is mapped by dynamic templates, so no mappings need to be created before filtering records.
+
+        :param client: ElasticSearch client
+        :param records: Stream records list
+        """
+
+        pass
+
     def filter_records(self, records, client):
 
         """
@@ -144,6 +156,7 @@ class ElasticSearchStringOnlySparqlHandler(ElasticSearchSparqlHandler):
         For Sparql Language, Stream Records are filtered out if:
         1) Subject is a Blank Node
         2) Object is not a String Literal(xsd:string, rdf:langString) for predicates other than rdf:type
+        3) Graph or predicate of statement is not in scope of ReplicationRulesFile
 
 
         :param client: ElasticSearch client
@@ -160,16 +173,18 @@ class ElasticSearchStringOnlySparqlHandler(ElasticSearchSparqlHandler):
             statement_elements = parse_sparql_statement(record_data)
             # Storing parsed SPARQL statement in-memory for further usage
             record_data[ELEMENTS_STR] = statement_elements
-            if isinstance(statement_elements[SUBJECT], BNode):
+            # case 3) Graph or predicate not in scope of ReplicationRulesFile
+            drop_reason = self.filter_plan.check_statement(statement_elements)
+            if drop_reason:
+                self.count_dropped_record(drop_reason, record_data)
+            elif isinstance(statement_elements[SUBJECT], BNode):
                 # case 1) Subject is a Blank Node
-                logger.debug("Dropping Record : Rdf Resource is represented by Blank Node for record {}"
-                             .format(str(record_data)))
+                self.count_dropped_record(DropReason.BLANK_NODE, record_data)
             elif statement_elements[PREDICATE].neq(RDF_TYPE) and (not isinstance(statement_elements[OBJECT], Literal) or statement_elements[OBJECT].datatype):
                 # case 2) Object is not a String Literal(xsd:string, rdf:langString) for predicates other than rdf:type
                 if (statement_elements[OBJECT].datatype and (not (statement_elements[OBJECT].datatype.eq(stringURI)
                                                              or statement_elements[OBJECT].datatype.eq(langStringURI)))):
-                    logger.debug("Dropping Record : Rdf Object value is not a String Literal for record {}"
-                             .format(str(record_data)))
+                    self.count_dropped_record(DropReason.NON_STRING_VALUE, record_data)
                 # No Datatype or datatype is xsd:string or rdf:langString
                 else:
                     yield record
@@ -19,6 +19,7 @@ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
 SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import collections
 import logging
 from retrying import retry
 from elasticsearch import Elasticsearch, RequestsHttpConnection, TransportError
@@ -29,10 +30,16 @@ import six
 from cachetools import cached, TTLCache
 
 from handler import AbstractHandler, HandlerResponse
+from log_helper import LogSampler, Payload, log_event
 from commons import *
 
 from aggregator.es_aggregator import ElasticSearchAggregator
 from neptune_to_es import es_helper
+from neptune_to_es.reindex_manager import ReindexManager
+from neptune_to_es.index_router import IndexRouter, ShardRouter
+from neptune_to_es.rolling_aggregates import RollingAggregator
+from neptune_to_es.ring_tracker import RingTracker
+from neptune_to_es.alert_percolator import AlertPercolator
 from config_provider import config_provider
 from credential_provider import credential_provider
 
@@ -50,13 +57,33 @@ ES_ENDPOINT = es_helper.get_url_components(config_provider
                                                     .get_handler_additional_param('ElasticSearchEndpoint'))
 IGNORE_MISSING_DOCUMENT_ERROR = config_provider.get_handler_additional_param('IgnoreMissingDocument') != 'false'
 
+# Maximum number of filtered Stream records converted to actions & sent to Elastic Search in one go.
+# Bounds memory used for a Stream batch irrespective of StreamRecordsBatchSize.
+BULK_BUFFER_SIZE = int(config_provider.get_handler_additional_param('BulkBufferSize', 2000))
+
+# Painless function to check if a change is older than the last change applied to the document.
+# Each document carries the Stream position (commitNum, opNum) of its last applied change in "stream_position".
+# Changes at or before that position are turned into a noop, which makes replayed or out of order
+# writes safe. Functions need to be declared before any statement in Painless, so this is
+# prepended to the update scripts below.
+STALE_CHANGE_FUNCTION = '''boolean isStale(def source, def params){
+                             def position = source["stream_position"];
+                             if (position == null || params.commit_num == null) {
+                                return false
+                             }
+                             return position.commit_num > params.commit_num ||
+                                (position.commit_num == params.commit_num && position.op_num >= params.op_num)
+                         }
+                         '''
+
 # Painless Script to add field to respective ES document.
 # Painless Script is used to update specific field within a document.
 # Reference Doc - https://www.elastic.co/guide/en/elasticsearch/reference/master/modules-scripting-painless.html
 # Queries generated using painless script are idempotent and thus can handle duplicate
 # records. Painless script can also update multiple fields for same document in one go.
 # Below script append different values for same property Key in a list.
-ADD_FIELD_SCRIPT = '''void add(def object, def key, def value){
+# End vertex ids of Gremlin edges passed as endpoints param are set on the document as is.
+ADD_FIELD_SCRIPT = STALE_CHANGE_FUNCTION + '''void add(def object, def key, def value){
                          if (object[key] != null) {
                             if(!object[key].contains(value)) {
                                 object[key].add(value)
@@ -65,15 +92,26 @@ ADD_FIELD_SCRIPT = '''void add(def object, def key, def value){
                             object[key] = [value]
                          }
                       }
-                      for (predicate in params.predicates){
-                          if (predicate["key"]=="entity_type"){
-                              add(ctx._source, predicate["key"], predicate["value"])
+                      if (isStale(ctx._source, params)) {
+                          ctx.op = "noop"
+                      } else {
+                          for (predicate in params.predicates){
+                              if (predicate["key"]=="entity_type"){
+                                  add(ctx._source, predicate["key"], predicate["value"])
+                              }
+                              else {
+                                  if (ctx._source["predicates"] == null){
+                                     ctx._source["predicates"] = new HashMap()
+                                  }  
+                                  add(ctx._source.predicates, predicate["key"], predicate["value"])
+                              }
                           }
-                          else {
-                              if (ctx._source["predicates"] == null){
-                                 ctx._source["predicates"] = new HashMap()
-                              }  
-                              add(ctx._source.predicates, predicate["key"], predicate["value"])
+                          if (params.endpoints != null) {
+                              ctx._source.putAll(params.endpoints)
+                          }
+                          if (params.commit_num != null) {
+                              ctx._source["stream_position"] = ["commit_num": params.commit_num,
+                                                                "op_num": params.op_num]
                           }
                       }'''
 
@@ -81,8 +119,9 @@ ADD_FIELD_SCRIPT = '''void add(def object, def key, def value){
 # Painless Script to delete Property from respective ES document.
 # This script take care of duplicate requests using Delete only if present
 # check. Script also removes property key from Vertex document if no more
-# values present after delete.
-DROP_FIELD_SCRIPT = '''void remove(def object, def key, def value){
+# values present after delete. Document left with neither entity type nor predicates is kept as a tombstone
+# carrying the Stream position of the delete, so that a replayed or late change older than it can't re-create it.
+DROP_FIELD_SCRIPT = STALE_CHANGE_FUNCTION + '''void remove(def object, def key, def value){
                          if (object[key] != null) {
                              object[key].removeIf(x -> x.equals(value));
                              if (object[key].length == 0){
@@ -90,23 +129,39 @@ DROP_FIELD_SCRIPT = '''void remove(def object, def key, def value){
                              }
                          }
                        }  
-                       for (predicate in params.predicates){
-                           if (predicate["key"]=="entity_type"){
-                               remove(ctx._source, predicate["key"], predicate["value"])
+                       if (isStale(ctx._source, params)) {
+                           ctx.op = "noop"
+                       } else {
+                           for (predicate in params.predicates){
+                               if (predicate["key"]=="entity_type"){
+                                   remove(ctx._source, predicate["key"], predicate["value"])
+                               }
+                               else if(ctx._source["predicates"] != null){
+                                   remove(ctx._source.predicates, predicate["key"], predicate["value"])
+                               }   
+                           }
+                           if (ctx._source["predicates"] != null && ctx._source.predicates.size() == 0){
+                               ctx._source.remove("predicates")    
+                           }
+                           if (params.commit_num != null) {
+                               ctx._source["stream_position"] = ["commit_num": params.commit_num,
+                                                                 "op_num": params.op_num]
                            }
-                           else if(ctx._source["predicates"] != null){
-                               remove(ctx._source.predicates, predicate["key"], predicate["value"])
-                           }   
-                       }
-                       if (ctx._source["predicates"] != null && ctx._source.predicates.size() == 0){
-                           ctx._source.remove("predicates")    
-                       }
-                       if(ctx._source.size() == 2){
-                           ctx.op = "delete" 
-                       }else{ 
-                           ctx.op = "index"
                        }'''
 
+# Painless Script to delete ES document. Document is kept as a tombstone without entity type & predicates, for the
+# same reason as above. Documents without entity type are not considered found when labels are read.
+DELETE_DOCUMENT_SCRIPT = STALE_CHANGE_FUNCTION + '''if (isStale(ctx._source, params)) {
+                             ctx.op = "noop"
+                         } else {
+                             ctx._source.remove("entity_type");
+                             ctx._source.remove("predicates");
+                             if (params.commit_num != null) {
+                                 ctx._source["stream_position"] = ["commit_num": params.commit_num,
+                                                                   "op_num": params.op_num]
+                             }
+                         }'''
+
 # ES Client connection Cache with TTL
 _es_connection_cache = TTLCache(maxsize=1, ttl=900)   # TTL is in Seconds
 
@@ -114,17 +169,20 @@ _es_connection_cache = TTLCache(maxsize=1, ttl=900)   # TTL is in Seconds
 aggregator = ElasticSearchAggregator()
 
 
-def __initial_setup__(es_client):
+def __initial_setup__(es_client, mappings=None):
 
     """
     Do initial setup for Elastic Search by creating relevant indices
+
+    :param es_client: Elastic Search Client
+    :param mappings: Mappings used if index needs to be created
     """
 
     # Checking Elastic Search version
     es_helper.validate_es_version(es_client)
 
     logger.info("Trying to Create Index for Elastic Search")
-    es_helper.create_index(es_client, es_helper.INDEX)
+    es_helper.create_index(es_client, es_helper.INDEX, mappings)
 
 
 def __base_action__(document_id, query_type):
@@ -146,7 +204,7 @@ def __base_action__(document_id, query_type):
     }
 
 
-def __update_action__(document_id, script_source, params_json, upsert_json=None):
+def __update_action__(document_id, script_source, params_json, upsert_json=None, stream_position=None):
 
     """
     Generates action object to perform update operation in Elastic Search using Bulk API.
@@ -161,6 +219,8 @@ def __update_action__(document_id, script_source, params_json, upsert_json=None)
     :param params_json: Value referenced from Painless Script. Ex : For updating Properties it can be property values.
                         For Vertex / Edge  insert it can be Labels.
     :param upsert_json: Document json to be inserted in Elastic Search when no valid Document found to update.
+    :param stream_position: Stream position (commitNum, opNum) of the latest change applied by this action. Script
+                            turns the update into a noop if the document already has a same or newer position.
     :return: Json object to be used as an Action for Elastic search Update Operation
     """
 
@@ -173,23 +233,37 @@ def __update_action__(document_id, script_source, params_json, upsert_json=None)
         }
     }
 
+    if stream_position:
+        action["script"]["params"]["commit_num"] = stream_position[COMMIT_NUM_STR]
+        action["script"]["params"]["op_num"] = stream_position[OP_NUM_STR]
+
     if upsert_json:
         action["upsert"] = upsert_json
 
     return action
 
 
-def __delete_action__(document_id):
+def __delete_action__(document_id, stream_position=None):
 
     """
     Generate action object to perform delete operation in Elastic Search using Bulk API.
-    Delete action object is generated using base action object.
+    Document isn't deleted, but turned into a tombstone by an update action, as the Stream position of the delete
+    would be lost with the document. Missing document is inserted as a tombstone for the same reason.
 
     :param document_id: Unique Id for Elastic Search document
+    :param stream_position: Stream position (commitNum, opNum) of the delete
     :return: Json object to be used as an action for Elastic search delete operation
     """
 
-    return __base_action__(document_id, "delete")
+    upsert_json = None
+    if stream_position:
+        upsert_json = {
+            es_helper.ElasticSearchDocumentFields.STREAM_POSITION.value: {
+                "commit_num": stream_position[COMMIT_NUM_STR],
+                "op_num": stream_position[OP_NUM_STR]
+            }
+        }
+    return __update_action__(document_id, DELETE_DOCUMENT_SCRIPT, [], upsert_json, stream_position)
 
 
 def __retryable_error__(exception):
@@ -236,7 +310,24 @@ class ElasticSearchBaseHandler(AbstractHandler):
     """
 
     def __init__(self):
-        __initial_setup__(self.__get_es_client())
+        __initial_setup__(self.__get_es_client(), self.get_index_mappings())
+        # Number of Stream records dropped by filter_records per DropReason, for the Stream batch being handled
+        self.dropped_records = collections.Counter()
+        # Dropped records are logged on first occurrence & then sampled per drop reason
+        self.log_sampler = LogSampler()
+        # Routes documents to separate indices when IndexRoutingRules are configured
+        self.index_router = IndexRouter()
+        self.index_router.ensure_indices(self.__get_es_client(), self.get_index_mappings())
+        # Routes vertices & their outgoing edges to same shard when EdgeRouting is from_vertex
+        self.shard_router = ShardRouter()
+        # Maintains rolling window aggregates in feature index when RollingAggregates are configured
+        self.rolling_aggregator = RollingAggregator()
+        self.rolling_aggregator.ensure_index(self.__get_es_client())
+        # Maintains fraud rings over edges with RingEdgeLabels
+        self.ring_tracker = RingTracker()
+        # Raises fraud alerts for changed documents matching rules in AlertRulesFile
+        self.alert_percolator = AlertPercolator()
+        self.alert_percolator.register_rules(self.__get_es_client(), self.get_index_mappings())
 
     @cached(_es_connection_cache)
     def __get_es_client(self):
@@ -314,11 +405,24 @@ class ElasticSearchBaseHandler(AbstractHandler):
 
         pass
 
+    @abc.abstractmethod
+    def get_document_type(self, record_data):
+
+        """
+        Abstract Method to get type of Elastic Search document Stream Record data belongs to.
+
+        :param record_data: Stream Record data
+        :return: Document type i.e. vertex, edge or rdf-resource
+        """
+
+        pass
+
     @abc.abstractmethod
     def filter_records(self, records, es_client):
 
         """
-        Abstract Method to filter records to be stored in Elastic Search.
+        Abstract Method to filter records to be stored in Elastic Search. Called with one chunk of Stream
+        records at a time, after prepare_records was called with the whole batch.
 
         :param records: Stream Records list
         :param es_client: Client for ES connection
@@ -327,6 +431,42 @@ class ElasticSearchBaseHandler(AbstractHandler):
 
         pass
 
+    def count_dropped_record(self, reason, record_data):
+
+        """
+        Counts a Stream record dropped by filter_records. Counts are published as metrics per reason.
+
+        :param reason: DropReason record is dropped for
+        :param record_data: Stream record data
+        """
+
+        self.dropped_records[reason.value] += 1
+        self.log_sampler.log(logger, logging.DEBUG, "record_dropped." + reason.value, "Dropping Record",
+                             reason=reason.value, record=Payload(record_data))
+
+    def prepare_records(self, records, es_client):
+
+        """
+        Prepares Elastic Search for a Stream batch before records are filtered Ex: creating mappings for all new
+        properties of the batch in one go. Called with whole list of Stream records, unlike filter_records which
+        is called with one chunk of records at a time. Default implementation does nothing.
+
+        :param records: Stream Records list
+        :param es_client: Client for ES connection
+        """
+
+        pass
+
+    def get_index_mappings(self):
+
+        """
+        Returns mappings used to create Elastic Search index. This method can be overriden by sub-classes
+        storing documents in another layout.
+        :return: Elastic Search index mappings
+        """
+
+        return es_helper.get_index_mappings()
+
     def get_add_field_script(self):
 
         """
@@ -371,7 +511,7 @@ class ElasticSearchBaseHandler(AbstractHandler):
                 }
             )
         return __update_action__(document_id, script_source,
-                                 params_json, None)
+                                 params_json, None, record_data_list[-1].get(EVENT_ID_STR))
 
     @abc.abstractmethod
     def get_upsert_json(self, record_data_list):
@@ -400,6 +540,13 @@ class ElasticSearchBaseHandler(AbstractHandler):
             action = self.__generate_Action__(record_data_list, operation)
             if require_upsert:
                 action["upsert"] = self.get_upsert_json(record_data_list)
+                # Upsert document is inserted as is without running the script, so it carries the position too
+                stream_position = record_data_list[-1].get(EVENT_ID_STR)
+                if stream_position:
+                    action["upsert"][es_helper.ElasticSearchDocumentFields.STREAM_POSITION.value] = {
+                        "commit_num": stream_position[COMMIT_NUM_STR],
+                        "op_num": stream_position[OP_NUM_STR]
+                    }
             yield action
 
     def __delete_query__(self, record_data_lists):
@@ -414,28 +561,41 @@ class ElasticSearchBaseHandler(AbstractHandler):
 
         for record_data_list in record_data_lists:
             for record_data in record_data_list:
-                yield __delete_action__(es_helper.generate_es_document_id(record_data))
+                yield __delete_action__(es_helper.generate_es_document_id(record_data), record_data.get(EVENT_ID_STR))
 
     def __generate_aggregated_es_actions__(self, records):
 
         """
-        Generate list of Elastic search Actions for Bulk API call. This method take stream records
-        & aggregate them before generating Actions from them.
+        Generate Elastic search Actions for Bulk API call. This method take stream records
+        & aggregate them before generating Actions from them. Actions are generated lazily.
 
         :param records: Stream Records
-        :return: List of Elastic search Actions for Bulk API call
+        :return: Python Generator object yielding Elastic search Actions for Bulk API call
         """
 
-        action_list = []
-
         # Aggregate Stream records in appropriate bundles
         aggregate_map = aggregator.aggregate_records(records)
         for aggregate_entry in aggregate_map.values():
             for records_set in aggregate_entry[RECORDS_SET_STR]:
-                action_list.extend(list(self.build_query(records_set[OPERATION_STR],
-                                                         split_list(records_set[RECORDS_STR],
-                                                                    ES_AGGREGATE_QUERY_SIZE))))
-        return action_list
+                yield from self.build_query(records_set[OPERATION_STR],
+                                            split_list(records_set[RECORDS_STR], ES_AGGREGATE_QUERY_SIZE))
+
+    @staticmethod
+    def __release_consumed_records__(records):
+
+        """
+        Iterates over Stream records & drops reference to each record from Stream records list as soon as
+        it is taken into a chunk. Chunk holds the last reference to its records, so records are released once
+        actions generated from them are acknowledged by Elastic Search, or right after filtering if dropped.
+
+        :param records: Stream Records list. Note: List is emptied out while iterating.
+        :return: Python Generator object yielding Stream records
+        """
+
+        for index in range(len(records)):
+            record = records[index]
+            records[index] = None
+            yield record
 
     @retry(retry_on_exception=__retryable_error__, wait_exponential_multiplier=1000, stop_max_attempt_number=5)
     def __execute_query(self, actions, raise_error=True):
@@ -447,7 +607,8 @@ class ElasticSearchBaseHandler(AbstractHandler):
         """
 
         try:
-            logger.debug("Executing bulk actions on Elastic Search - {}".format(str(actions)))
+            log_event(logger, logging.DEBUG, "bulk_request", "Executing bulk actions on Elastic Search",
+                      actions=len(actions), payload=Payload(actions))
             success, errors = bulk(self.__get_es_client(), actions, max_retries=3, chunk_size=2000,
                                    stats_only=False, raise_on_error=raise_error, raise_on_exception=True)
 
@@ -457,54 +618,144 @@ class ElasticSearchBaseHandler(AbstractHandler):
                 for error in errors:
                     if not __check_missing_document_error__(error):
                         raise BulkIndexError("%i document(s) failed to index." % len(errors), errors)
-                logger.info("Completed Elastic search Bulk query after ignoring Missing document exception. "
-                            "Success: {}, Ignored Missing Document: {}".format(success, len(errors)))
+                log_event(logger, logging.INFO, "bulk_completed",
+                          "Completed Elastic search Bulk query after ignoring Missing document exception",
+                          success=success, ignored_missing_document=len(errors))
             else:
-                logger.info("Completed Elastic search Bulk query. "
-                            "Success: {}, Failed: {}, Errors: {}".format(success, len(errors), errors))
+                log_event(logger, logging.INFO, "bulk_completed", "Completed Elastic search Bulk query",
+                          success=success, failed=len(errors), errors=Payload(errors))
         except BulkIndexError as err:
             # Checking if Bulk update can be retried in case of Document Missing Exception.
             if IGNORE_MISSING_DOCUMENT_ERROR and len(err.errors) > 0 and \
                     __check_missing_document_error__(err.errors[0]) and raise_error:
 
-                logger.info("Retrying after ignoring Document Missing Exception - {}.".format(err.errors[0]))
+                log_event(logger, logging.INFO, "bulk_retry", "Retrying after ignoring Document Missing Exception",
+                          error=Payload(err.errors[0]))
                 self.__execute_query(actions, False)
             else:
-                logger.error("Error Occurred: {}, Message: {}, Errors: {}".format("BulkIndexError", err, err.errors))
+                log_event(logger, logging.ERROR, "bulk_failed", "Error Occurred: BulkIndexError",
+                          message=err.args[0] if err.args else "", errors=Payload(err.errors))
                 raise
         except TransportError as err:
             logger.error("Exception Occurred: {}, Message: {}".format("TransportError", err))
             raise
 
-    def handle_records(self, stream_log):
+    def run_maintenance(self, lease, state_store, read_records, execution_end_time):
+
+        """
+        Runs managed reindex, if configured index version is newer than the version of index behind alias,
+        followed by handler specific document maintenance & recomputation of rings edges were removed from.
+        See ReindexManager & RingTracker for details.
+
+        :param lease: Lease object with checkpoint of last processed Stream record
+        :param state_store: Store to persist maintenance state across Lambda invocations
+        :param read_records: Function to read Stream records after a given (limit, commit_num, op_num)
+        :param execution_end_time: Time in milliseconds by which maintenance should return
+        """
+
+        ReindexManager(self.__get_es_client(), state_store, self, self.get_index_mappings()) \
+            .run(lease, read_records, execution_end_time)
+        self.run_document_maintenance(self.__get_es_client(), state_store, execution_end_time)
+        self.__update_rings__(self.ring_tracker.recompute(self.__get_es_client(), execution_end_time))
+
+    def __update_rings__(self, ring_actions):
+
+        """
+        Executes actions setting ring of vertex documents. Vertex documents are routed to index they are stored in.
+
+        :param ring_actions: Elastic Search Bulk API actions
+        """
+
+        if ring_actions:
+            self.index_router.route_actions(self.__get_es_client(), [], ring_actions, self)
+            self.__execute_query(ring_actions)
+
+    def run_document_maintenance(self, es_client, state_store, execution_end_time):
+
+        """
+        Hook to run handler specific maintenance of indexed documents after managed reindex Ex: backfill of a
+        new document field. No maintenance by default.
+
+        :param es_client: Elastic Search Client
+        :param state_store: Store to persist maintenance state across Lambda invocations
+        :param execution_end_time: Time in milliseconds by which maintenance should return
+        """
+
+        pass
+
+    def generate_derived_actions(self, records, es_client, index=None):
+
+        """
+        Hook to generate handler specific actions derived from a chunk of Stream records & current documents
+        Ex: scores of changed vertices. Actions are sent in the same bulk request as the chunk. None by default.
+
+        :param records: Chunk of filtered Stream records
+        :param es_client: Elastic Search Client
+        :param index: Index being built by reindex, which current documents are to be read from while it catches
+                      up. Defaults to index alias.
+        :return: List of Elastic Search Bulk API actions
+        """
+
+        return []
+
+    def handle_records(self, stream_log, index=None):
 
         """
         Method to Handle Stream records. This method is called from Lambda Function to process records.
         This method perform below steps sequentially :
 
-        1) Filter out Stream Records not to be stored in Elastic Search
-        2) Build Elastic Search Actions from filtered Stream records
-        2) Execute Query on Elastic Search using Bulk API
-        3) Yield HandlerResponse
+        1) Prepare Elastic Search for Stream Records Ex: create mappings for new properties
+        2) Filter out Stream Records of a bounded chunk not to be stored in Elastic Search
+        3) Build Elastic Search Actions from filtered Stream records of the chunk, including derived
+           & rolling aggregate updates
+        4) Execute Query on Elastic Search using Bulk API, update rings & percolate changed documents against
+           fraud rules. Repeat for next chunk
+        5) Yield HandlerResponse
 
         :param stream_log: Neptune Stream Change log
+        :param index: Concrete index to write to instead of index alias Ex: index being built by reindex
 
         """
 
         logger.info("Starting ES data replication !!!")
+        self.dropped_records.clear()
+
+        self.prepare_records(stream_log[RECORDS_STR], self.__get_es_client())
 
-        # Filtering out Records not to be stored in Elastic Search
-        records = self.filter_records(stream_log[RECORDS_STR], self.__get_es_client())
-        actions = self.__generate_aggregated_es_actions__(records)
         logger.info("About to copy data to ES !!!")
         try:
             logger.info("Doing Bulk update for Elastic Search using Stream records with" +
                         " last event id (commitNum, opNum) - {}, {}"
                         .format(stream_log[LAST_EVENT_ID][COMMIT_NUM_STR], stream_log[LAST_EVENT_ID][OP_NUM_STR]))
-            self.__execute_query(actions)
+
+            # Records are filtered, aggregated & sent to Elastic Search in bounded chunks, so that peak memory
+            # doesn't grow with Stream batch size. Actions for a chunk are kept in a list as bulk call may be retried.
+            for records_chunk in iter_chunks(self.__release_consumed_records__(stream_log[RECORDS_STR]),
+                                             BULK_BUFFER_SIZE):
+                # Filtering out Records not to be stored in Elastic Search
+                records_chunk = list(self.filter_records(records_chunk, self.__get_es_client()))
+                actions = list(self.__generate_aggregated_es_actions__(records_chunk))
+                actions.extend(self.generate_derived_actions(records_chunk, self.__get_es_client(), index))
+                self.index_router.route_actions(self.__get_es_client(), records_chunk, actions, self)
+                if index:
+                    # Only documents written through alias are stored in index being built by reindex
+                    for action in actions:
+                        if action["_index"] == es_helper.INDEX:
+                            action["_index"] = index
+                self.shard_router.route_actions(self.__get_es_client(), records_chunk, actions, index)
+                if not index:
+                    # Feature index isn't rebuilt by reindex, so aggregates are only updated from live records
+                    actions.extend(self.rolling_aggregator.generate_actions(self.__get_es_client(), records_chunk))
+                self.__execute_query(actions)
+                if not index:
+                    # Rings are updated once vertex documents of a chunk exist
+                    self.__update_rings__(self.ring_tracker.process_records(self.__get_es_client(), records_chunk))
+                    self.alert_percolator.percolate(self.__get_es_client(), actions)
+                # Releasing acknowledged records & actions before next chunk is built
+                del records_chunk, actions
 
             yield HandlerResponse(stream_log[LAST_EVENT_ID][OP_NUM_STR], stream_log[LAST_EVENT_ID][COMMIT_NUM_STR],
-                                  stream_log[TOTAL_RECORDS])
+                                  stream_log[TOTAL_RECORDS], dict(self.dropped_records))
         except Exception as e:
             logger.error("Error Occurred - {}  while doing bulk update to Elastic Search endpoint {}:{} "
                          .format(str(e), ES_ENDPOINT["host"], ES_ENDPOINT["port"]))
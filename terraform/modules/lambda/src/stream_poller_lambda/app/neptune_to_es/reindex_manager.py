@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import collections
+import logging
+from enum import Enum
+
+from commons import *
+from config_provider import config_provider
+from neptune_to_es import es_helper
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Suffix of lease table key storing reindex progress for application
+REINDEX_STATE_KEY_SUFFIX = "_reindex"
+
+# Legacy concrete index named same as alias can't be kept once alias is created, so it is only rebuilt & deleted
+# when operator opts in
+REMOVE_LEGACY_INDEX = config_provider.get_handler_additional_param('ReindexRemoveLegacyIndex') == 'true'
+
+# Routes copied vertex documents by vertex id & edge documents by from vertex id when EdgeRouting is from_vertex.
+# Edges indexed before from_id was stored keep default routing.
+REINDEX_ROUTING_SCRIPT = """
+if (ctx._source.document_type == 'vertex') {
+    ctx._routing = ctx._source.entity_id;
+} else if (ctx._source.from_id != null) {
+    ctx._routing = ctx._source.from_id;
+}
+"""
+
+
+class ReindexStatus(Enum):
+
+    """
+    Status of managed reindex stored in lease table.
+    """
+
+    # Documents are being copied from live index to new index by Elastic Search reindex task
+    COPYING = "copying"
+
+    # Stream records processed since copy started are being replayed into new index
+    CATCHING_UP = "catching_up"
+
+    # Alias points to new index
+    COMPLETED = "completed"
+
+    # Reindex task failed. Not retried for same index version.
+    FAILED = "failed"
+
+
+class ReindexManager:
+
+    """
+    Rebuilds Neptune index with current settings & mappings without stopping replication, when IndexVersion config
+    value is bumped Ex: to change number of shards. Documents are read & written through index alias, which is
+    swapped to new index once it is built. Below steps are run across Lambda invocations while lease is held:
+
+    1) Concrete index for new version is created with current settings & mappings of live index. Documents are
+       copied from live index by an asynchronous Elastic Search reindex task & Stream position of last processed
+       record is recorded. Replication continues into live index meanwhile & mapping updates are applied to
+       both indices.
+    2) Once copy is completed, Stream records after recorded position are replayed into new index until it has
+       caught up with lease checkpoint. Changes already present in copied documents are skipped by stream
+       position check of update scripts. Derived fields Ex: fraud score, are computed from vertex documents of new
+       index, which reflect replayed records, rather than from live index which is ahead of them.
+    3) Alias is atomically swapped to new index. Old index is kept for rollback. Legacy index named same as alias
+       has to be replaced by alias, so it is only rebuilt when ReindexRemoveLegacyIndex is true.
+
+    Reindex is only started when IndexVersion is bumped above version of live index. Legacy index is version 1.
+    If Stream records can't be replayed up to lease checkpoint Ex: Stream was trimmed, reindex is marked failed
+    & alias is left on live index.
+
+    Only index behind write alias is rebuilt. Indices documents are routed to by IndexRouter are left as is.
+
+    Progress is stored in lease table, so that reindex can resume in next Lambda invocation.
+    """
+
+    def __init__(self, es_client, state_store, handler, mappings):
+        self.es_client = es_client
+        self.state_store = state_store
+        self.handler = handler
+        self.mappings = mappings
+        self.state_key = config_provider.application_name + REINDEX_STATE_KEY_SUFFIX
+
+    def run(self, lease, read_records, execution_end_time):
+
+        """
+        Starts or resumes reindex.
+
+        :param lease: Lease object with checkpoint of last processed Stream record
+        :param read_records: Function to read Stream records after a given (limit, commit_num, op_num)
+        :param execution_end_time: Time in milliseconds by which reindex should return
+        """
+
+        state = self.state_store.get_state(self.state_key)
+        target_index = es_helper.get_versioned_index_name(es_helper.INDEX_VERSION)
+
+        if not state or state["status"] == ReindexStatus.COMPLETED.value \
+                or (state["status"] == ReindexStatus.FAILED.value and state["targetIndex"] != target_index):
+            state = self.__start__(lease, target_index)
+            if not state:
+                return
+
+        if state["status"] == ReindexStatus.COPYING.value:
+            self.__check_copy__(state)
+
+        if state["status"] == ReindexStatus.CATCHING_UP.value \
+                and self.__catch_up__(state, lease, read_records, execution_end_time):
+            self.__swap_alias__(state)
+
+    def __save_state__(self, state, status):
+
+        """
+        Saves reindex progress in lease table.
+
+        :param state: Reindex state item
+        :param status: ReindexStatus
+        """
+
+        state["status"] = status.value
+        state["lastUpdateTime"] = current_milli_time()
+        self.state_store.put_state(state)
+
+    def __start__(self, lease, target_index):
+
+        """
+        Creates new index & starts copying documents from live index, if configured index version is newer
+        than live index version.
+
+        :param lease: Lease object with checkpoint of last processed Stream record
+        :param target_index: Concrete index name for configured index version
+        :return: Reindex state item or None if no reindex is needed
+        """
+
+        source_index = es_helper.get_aliased_index(self.es_client, use_cache=False)
+        if es_helper.get_index_version(source_index) >= es_helper.INDEX_VERSION:
+            return None
+        if source_index == es_helper.INDEX and not REMOVE_LEGACY_INDEX:
+            logger.warning("Index - {} is not an alias & would be deleted by reindex. Set ReindexRemoveLegacyIndex to "
+                           "true to rebuild it as index - {}".format(source_index, target_index))
+            return None
+
+        logger.info("Starting reindex from index - {} to index - {}".format(source_index, target_index))
+        if not self.es_client.indices.exists(index=target_index):
+            self.es_client.indices.create(index=target_index, body={
+                "settings": es_helper.__index_settings__(),
+                "mappings": es_helper.merge_live_index_mappings(self.es_client, self.mappings)
+            })
+
+        body = {
+            "source": {"index": source_index},
+            "dest": {"index": target_index}
+        }
+        if es_helper.EDGE_ROUTING == es_helper.FROM_VERTEX_ROUTING:
+            body["script"] = {"lang": "painless", "source": REINDEX_ROUTING_SCRIPT}
+        response = self.es_client.reindex(body=body, wait_for_completion=False)
+
+        state = {
+            "leaseKey": self.state_key,
+            "sourceIndex": source_index,
+            "targetIndex": target_index,
+            "taskId": response["task"],
+            # Stream position from which changes are replayed into new index once copy is completed
+            "checkpoint": str(lease["checkpoint"]),
+            "checkpointSubSequenceNumber": str(lease["checkpointSubSequenceNumber"])
+        }
+        self.__save_state__(state, ReindexStatus.COPYING)
+        return state
+
+    def __check_copy__(self, state):
+
+        """
+        Checks if reindex task copying documents has completed.
+
+        :param state: Reindex state item
+        """
+
+        task = self.es_client.tasks.get(task_id=state["taskId"])
+        if not task.get("completed"):
+            logger.info("Reindex task - {} to index - {} is in progress. Status - {}"
+                        .format(state["taskId"], state["targetIndex"], str(task.get("task", {}).get("status"))))
+            return
+
+        failures = task.get("error") or task.get("response", {}).get("failures")
+        if failures:
+            logger.error("Reindex task - {} to index - {} failed. Index alias is not swapped. Errors - {}"
+                         .format(state["taskId"], state["targetIndex"], str(failures)))
+            self.__save_state__(state, ReindexStatus.FAILED)
+        else:
+            logger.info("Reindex task - {} to index - {} completed".format(state["taskId"], state["targetIndex"]))
+            self.__save_state__(state, ReindexStatus.CATCHING_UP)
+
+    def __catch_up__(self, state, lease, read_records, execution_end_time):
+
+        """
+        Replays Stream records processed since copy started into new index.
+
+        :param state: Reindex state item
+        :param lease: Lease object with checkpoint of last processed Stream record
+        :param read_records: Function to read Stream records after a given (limit, commit_num, op_num)
+        :param execution_end_time: Time in milliseconds by which catch up should return
+        :return: True if new index has caught up with lease checkpoint
+        """
+
+        live_position = (int(lease["checkpoint"]), int(lease["checkpointSubSequenceNumber"]))
+        while (int(state["checkpoint"]), int(state["checkpointSubSequenceNumber"])) < live_position:
+            if current_milli_time() >= execution_end_time:
+                return False
+
+            stream_log = read_records(config_provider.stream_records_batch_size, str(state["checkpoint"]),
+                                      str(state["checkpointSubSequenceNumber"]))
+            if stream_log is None:
+                logger.error("Stream records after event id (commitNum, opNum) - {}, {} could not be read before "
+                             "lease checkpoint - {}, {}. Index alias is not swapped to index - {}"
+                             .format(state["checkpoint"], state["checkpointSubSequenceNumber"], live_position[0],
+                                     live_position[1], state["targetIndex"]))
+                self.__save_state__(state, ReindexStatus.FAILED)
+                return False
+
+            # Replayed records aren't counted as dropped records of live replication
+            dropped_records = collections.Counter(self.handler.dropped_records)
+            try:
+                list(self.handler.handle_records(stream_log, state["targetIndex"]))
+            finally:
+                self.handler.dropped_records = dropped_records
+            state["checkpoint"] = str(stream_log[LAST_EVENT_ID][COMMIT_NUM_STR])
+            state["checkpointSubSequenceNumber"] = str(stream_log[LAST_EVENT_ID][OP_NUM_STR])
+            self.__save_state__(state, ReindexStatus.CATCHING_UP)
+            logger.info("Replayed Stream records into index - {} up to event id (commitNum, opNum) - {}, {}"
+                        .format(state["targetIndex"], state["checkpoint"], state["checkpointSubSequenceNumber"]))
+
+        return True
+
+    def __swap_alias__(self, state):
+
+        """
+        Atomically points index alias to new index.
+
+        :param state: Reindex state item
+        """
+
+        if state["sourceIndex"] == es_helper.INDEX:
+            # Legacy concrete index named same as alias has to be removed in same request. Only reached when
+            # ReindexRemoveLegacyIndex is true, see __start__
+            source_action = {"remove_index": {"index": state["sourceIndex"]}}
+        else:
+            source_action = {"remove": {"index": state["sourceIndex"], "alias": es_helper.INDEX}}
+
+        self.es_client.indices.update_aliases(body={
+            "actions": [
+                {"add": {"index": state["targetIndex"], "alias": es_helper.INDEX, "is_write_index": True}},
+                source_action
+            ]
+        })
+        es_helper.invalidate_index_mapping()
+        self.__save_state__(state, ReindexStatus.COMPLETED)
+        logger.info("Swapped index alias - {} from index - {} to index - {}"
+                    .format(es_helper.INDEX, state["sourceIndex"], state["targetIndex"]))
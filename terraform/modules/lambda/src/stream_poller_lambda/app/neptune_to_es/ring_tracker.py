@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+
+import boto3
+import logging
+from elasticsearch.exceptions import ConflictError
+from elasticsearch.helpers import scan
+
+from commons import *
+from config_provider import config_provider
+from log_helper import log_event
+from neptune_to_es import es_helper
+from neptune_to_es.es_helper import ElasticSearchDocumentFields, DocumentType
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Edge labels rings are built over. Comma separated Ex: relation_device,relation_identity. Empty disables rings.
+RING_EDGE_LABELS = config_provider.get_handler_additional_param('RingEdgeLabels', '')
+
+# Minimum time in seconds between recomputations of rings edges were removed from
+RING_RECOMPUTE_INTERVAL = int(config_provider.get_handler_additional_param('RingRecomputeInterval', 3600))
+
+# Time in milliseconds kept free for recomputing a ring before execution end time
+RING_RECOMPUTE_TIME = 10000
+
+# Lease table keys of union-find nodes & recomputation state
+RING_NODE_KEY_INFIX = "_ring:"
+RING_RECOMPUTE_KEY_SUFFIX = "_ring_recompute"
+
+# DynamoDB batch get limit
+DDB_BATCH_GET_SIZE = 100
+
+# Vertex ids per terms query, kept well below index.max_terms_count of 65536
+RING_TERMS_BATCH_SIZE = 10000
+
+# Attempts of updating members of merged rings before giving up on version conflicts
+RING_UPDATE_ATTEMPTS = 3
+
+# Time in milliseconds after which a document written by id is assumed visible to search. Covers the default
+# index refresh interval of 1 second.
+RING_SEARCH_VISIBILITY_TIME = 2000
+
+# Painless Script to set ring of a vertex document. Ring fields are removed if ring id is null.
+RING_SCRIPT = '''if (params.ring_id == null) {
+                     ctx._source.remove("ring_id");
+                     ctx._source.remove("ring_size")
+                 } else {
+                     ctx._source.ring_id = params.ring_id;
+                     ctx._source.ring_size = params.ring_size
+                 }'''
+
+
+class RingStore:
+
+    """
+    Persists union-find nodes of rings in lease table. Each vertex in a ring has an item with its parent vertex id,
+    root items also carry ring size.
+    """
+
+    def __init__(self, table=None):
+        self.table = table or boto3.resource('dynamodb', region_name=config_provider.region) \
+            .Table(config_provider.lease_table_name)
+        self.key_prefix = config_provider.application_name + RING_NODE_KEY_INFIX
+        self.recompute_key = config_provider.application_name + RING_RECOMPUTE_KEY_SUFFIX
+
+    def get_nodes(self, vertex_ids):
+
+        """
+        Loads union-find nodes of vertices using batch gets.
+
+        :param vertex_ids: List of vertex ids
+        :return: Dict of vertex id to Dict with parent & size, for vertices present in a ring
+        """
+
+        nodes = {}
+        for start in range(0, len(vertex_ids), DDB_BATCH_GET_SIZE):
+            request = {self.table.name: {
+                "Keys": [{"leaseKey": self.key_prefix + vertex_id}
+                         for vertex_id in vertex_ids[start:start + DDB_BATCH_GET_SIZE]],
+                "ConsistentRead": True
+            }}
+            while request:
+                response = self.table.meta.client.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table.name, []):
+                    nodes[item["leaseKey"][len(self.key_prefix):]] = {"parent": item["parent"],
+                                                                      "size": int(item.get("size", 1))}
+                request = response.get("UnprocessedKeys")
+        return nodes
+
+    def put_nodes(self, nodes):
+
+        """
+        Saves union-find nodes. Nodes without parent are deleted.
+
+        :param nodes: Dict of vertex id to Dict with parent & size
+        """
+
+        with self.table.batch_writer() as batch:
+            for vertex_id, node in nodes.items():
+                if node["parent"] is None:
+                    batch.delete_item(Key={"leaseKey": self.key_prefix + vertex_id})
+                else:
+                    batch.put_item(Item={"leaseKey": self.key_prefix + vertex_id, "parent": node["parent"],
+                                         "size": node["size"]})
+
+    def get_recompute_state(self):
+
+        """
+        Returns rings to be recomputed & time of last recomputation.
+
+        :return: Recompute state item
+        """
+
+        response = self.table.get_item(Key={"leaseKey": self.recompute_key}, ConsistentRead=True)
+        return response.get("Item") or {"leaseKey": self.recompute_key, "roots": [], "lastRecomputeTime": 0}
+
+    def put_recompute_state(self, state):
+
+        """
+        Saves rings to be recomputed & time of last recomputation.
+
+        :param state: Recompute state item
+        """
+
+        self.table.put_item(Item=state)
+
+
+class UnionFind:
+
+    """
+    Union-find over ring nodes loaded from RingStore on demand. Unions are by size, finds compress paths.
+    Modified nodes are tracked, so that only they are written back.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.nodes = {}
+        self.modified = set()
+
+    def load(self, vertex_ids):
+
+        """
+        Loads nodes of vertices & their ancestors. Vertices not present in any ring are singleton roots.
+
+        :param vertex_ids: Iterable of vertex ids
+        """
+
+        to_load = {vertex_id for vertex_id in vertex_ids if vertex_id not in self.nodes}
+        while to_load:
+            loaded = self.store.get_nodes(list(to_load))
+            for vertex_id in to_load:
+                self.nodes[vertex_id] = loaded.get(vertex_id) or {"parent": vertex_id, "size": 1}
+            to_load = {node["parent"] for node in self.nodes.values() if node["parent"] not in self.nodes}
+
+    def find(self, vertex_id):
+
+        """
+        Finds root of ring a vertex belongs to. Vertex must be loaded.
+
+        :param vertex_id: Vertex id
+        :return: Root vertex id
+        """
+
+        root = vertex_id
+        while self.nodes[root]["parent"] != root:
+            root = self.nodes[root]["parent"]
+
+        while self.nodes[vertex_id]["parent"] != root:
+            parent = self.nodes[vertex_id]["parent"]
+            self.nodes[vertex_id]["parent"] = root
+            self.modified.add(vertex_id)
+            vertex_id = parent
+        return root
+
+    def union(self, first_id, second_id):
+
+        """
+        Merges rings of two vertices.
+
+        :param first_id: Vertex id
+        :param second_id: Vertex id
+        :return: Tuple of (root, absorbed root) or None if vertices are already in same ring
+        """
+
+        first_root, second_root = self.find(first_id), self.find(second_id)
+        if first_root == second_root:
+            return None
+
+        if self.nodes[first_root]["size"] < self.nodes[second_root]["size"]:
+            first_root, second_root = second_root, first_root
+        self.nodes[second_root]["parent"] = first_root
+        self.nodes[first_root]["size"] += self.nodes[second_root]["size"]
+        self.modified.update([first_root, second_root])
+        return first_root, second_root
+
+    def save(self):
+
+        """
+        Writes modified nodes to RingStore.
+        """
+
+        self.store.put_nodes({vertex_id: self.nodes[vertex_id] for vertex_id in self.modified})
+        self.modified.clear()
+
+
+def __vertex_document_id__(vertex_id):
+
+    """
+    Generates Elastic Search document id of a vertex.
+
+    :param vertex_id: Vertex id
+    :return: Document id
+    """
+
+    return es_helper.generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"})
+
+
+class RingTracker:
+
+    """
+    Maintains fraud rings i.e. connected components of vertices over selected edge labels Ex: transactions sharing
+    devices or identities, & writes ring_id & ring_size onto vertex documents. A whole ring can then be fetched
+    with a single term query on ring_id.
+
+    Rings are kept in a union-find structure persisted in lease table, which is updated incrementally as edges are
+    added. Ring id is id of root vertex of union-find. When rings merge, documents of added vertices are updated by
+    id & documents of vertices already in a ring are updated by a query on their old ring id. Documents written by
+    id too recently to be visible to that query are remembered & updated by id as well, instead of forcing a refresh.
+
+    Union-find can't split rings, so edge removals mark their ring for recomputation. Marked rings are recomputed
+    periodically from edge documents in Elastic Search, which needs from_id / to_id on edge documents.
+    """
+
+    def __init__(self, edge_labels_str=RING_EDGE_LABELS, store=None):
+        self.edge_labels = {label.strip() for label in edge_labels_str.split(",") if label.strip()}
+        self.__store = store
+        # Vertex id to (ring id, write time) of documents which may not be visible to search yet
+        self.recent_writes = {}
+
+    @property
+    def store(self):
+        if self.__store is None:
+            self.__store = RingStore()
+        return self.__store
+
+    @staticmethod
+    def __ring_action__(es_client, vertex_id, ring_id, ring_size):
+
+        """
+        Generates action setting ring of a vertex document.
+
+        :param es_client: Elastic Search Client
+        :param vertex_id: Vertex id
+        :param ring_id: Ring id or None to remove ring
+        :param ring_size: Ring size
+        :return: Elastic Search Bulk API action
+        """
+
+        action = {
+            "_op_type": "update",
+            "_index": es_helper.INDEX,
+            "_type": "_doc",
+            "_id": __vertex_document_id__(vertex_id),
+            "script": {
+                "source": RING_SCRIPT,
+                "lang": "painless",
+                "params": {"ring_id": ring_id, "ring_size": ring_size}
+            }
+        }
+        if es_helper.EDGE_ROUTING == es_helper.FROM_VERTEX_ROUTING and es_helper.is_routed_by_from_vertex(es_client):
+            action["routing"] = vertex_id
+        return action
+
+    def __update_ring_members__(self, es_client, ring_ids, ring_id, ring_size):
+
+        """
+        Updates ring of documents currently in given rings using update by query. Query is retried on version
+        conflicts, so that documents updated concurrently aren't left in their old ring.
+
+        :param es_client: Elastic Search Client
+        :param ring_ids: List of current ring ids
+        :param ring_id: New ring id
+        :param ring_size: New ring size
+        """
+
+        for attempt in range(1, RING_UPDATE_ATTEMPTS + 1):
+            try:
+                es_client.update_by_query(index=es_helper.INDEX, body={
+                    "query": {"terms": {ElasticSearchDocumentFields.RING_ID.value: ring_ids}},
+                    "script": {
+                        "source": RING_SCRIPT,
+                        "lang": "painless",
+                        "params": {"ring_id": ring_id, "ring_size": ring_size}
+                    }
+                })
+                return
+            except ConflictError:
+                if attempt == RING_UPDATE_ATTEMPTS:
+                    raise
+                logger.warning("Version conflict updating ring - {}, Retrying. Attempt - {}".format(ring_id, attempt))
+
+    def __remember_writes__(self, vertex_rings):
+
+        """
+        Remembers ring of vertex documents written by id, until they are visible to search.
+
+        :param vertex_rings: Dict of vertex id to ring id written onto its document
+        """
+
+        now = current_milli_time()
+        self.recent_writes = {vertex_id: write for vertex_id, write in self.recent_writes.items()
+                              if now - write[1] < RING_SEARCH_VISIBILITY_TIME}
+        for vertex_id, ring_id in vertex_rings.items():
+            self.recent_writes[vertex_id] = (ring_id, now)
+
+    def process_records(self, es_client, records):
+
+        """
+        Updates rings from edge records of a batch, whose actions were already executed. Added edges merge rings
+        of their end vertices & removed edges mark their ring for recomputation.
+
+        :param es_client: Elastic Search Client
+        :param records: Filtered Stream records
+        :return: List of Elastic Search Bulk API actions setting ring of vertex documents
+        """
+
+        if not self.edge_labels:
+            return []
+
+        edges = [(record[OPERATION_STR], record[DATA_STR]) for record in records
+                 if record[DATA_STR].get(TYPE_STR) == "e"
+                 and record[DATA_STR][PROPERTY_VALUE_STR][PROPERTY_VALUE_STR] in self.edge_labels]
+        if not edges:
+            return []
+
+        union_find = UnionFind(self.store)
+        union_find.load({vertex_id for _, record_data in edges
+                         for vertex_id in [record_data[FROM_VERTEX_STR], record_data[TO_VERTEX_STR]]})
+
+        # Roots each final ring was assembled from, with their size before the batch
+        old_roots = {}
+        removed_roots = set()
+        touched_ids = set()
+        for operation, record_data in edges:
+            if operation != "ADD":
+                removed_roots.add(union_find.find(record_data[FROM_VERTEX_STR]))
+                continue
+
+            touched_ids.update([record_data[FROM_VERTEX_STR], record_data[TO_VERTEX_STR]])
+            for vertex_id in [record_data[FROM_VERTEX_STR], record_data[TO_VERTEX_STR]]:
+                root = union_find.find(vertex_id)
+                old_roots.setdefault(root, {root: union_find.nodes[root]["size"]})
+            merged = union_find.union(record_data[FROM_VERTEX_STR], record_data[TO_VERTEX_STR])
+            if merged:
+                root, absorbed_root = merged
+                old_roots[root].update(old_roots.pop(absorbed_root))
+
+        union_find.save()
+
+        if removed_roots:
+            state = self.store.get_recompute_state()
+            state["roots"] = sorted(set(state["roots"]) | removed_roots)
+            self.store.put_recompute_state(state)
+
+        vertex_rings = {vertex_id: union_find.find(vertex_id) for vertex_id in touched_ids}
+
+        for root, assembled_from in old_roots.items():
+            root = union_find.find(root)
+            # Members of rings which existed before the batch aren't all touched by its edges
+            existing_rings = [ring_id for ring_id, size in assembled_from.items() if size > 1]
+            if existing_rings and assembled_from != {root: union_find.nodes[root]["size"]}:
+                self.__update_ring_members__(es_client, existing_rings, root, union_find.nodes[root]["size"])
+                # Members written by earlier batches may not be visible to update by query yet
+                vertex_rings.update({vertex_id: root for vertex_id, (ring_id, _) in self.recent_writes.items()
+                                     if ring_id in assembled_from and vertex_id not in vertex_rings})
+
+        self.__remember_writes__(vertex_rings)
+        actions = [self.__ring_action__(es_client, vertex_id, ring_id, union_find.nodes[ring_id]["size"])
+                   for vertex_id, ring_id in vertex_rings.items()]
+
+        log_event(logger, logging.DEBUG, "rings_updated", "Updated rings", edge_records=len(edges))
+        return actions
+
+    def recompute(self, es_client, execution_end_time):
+
+        """
+        Recomputes rings edges were removed from, if recompute interval has passed since last recomputation.
+
+        :param es_client: Elastic Search Client
+        :param execution_end_time: Time in milliseconds by which recomputation should return
+        :return: List of Elastic Search Bulk API actions setting ring of vertex documents
+        """
+
+        if not self.edge_labels:
+            return []
+
+        state = self.store.get_recompute_state()
+        if not state["roots"] or current_milli_time() - int(state["lastRecomputeTime"]) < RING_RECOMPUTE_INTERVAL * 1000:
+            return []
+
+        actions = []
+        roots = list(state["roots"])
+        es_client.indices.refresh(index=es_helper.INDEX)
+        while roots and execution_end_time - current_milli_time() > RING_RECOMPUTE_TIME:
+            actions.extend(self.__recompute_ring__(es_client, roots.pop()))
+            state["roots"] = roots
+            self.store.put_recompute_state(state)
+
+        if not roots:
+            state["lastRecomputeTime"] = current_milli_time()
+            self.store.put_recompute_state(state)
+        return actions
+
+    def __recompute_ring__(self, es_client, ring_id):
+
+        """
+        Splits a ring into connected components of its remaining edges.
+
+        :param es_client: Elastic Search Client
+        :param ring_id: Ring id of ring to recompute. Ring may have been merged into another ring since.
+        :return: List of Elastic Search Bulk API actions setting ring of vertex documents
+        """
+
+        old_union_find = UnionFind(self.store)
+        old_union_find.load([ring_id])
+        ring_id = old_union_find.find(ring_id)
+
+        members = [hit["_source"][ElasticSearchDocumentFields.ENTITY_ID.value] for hit in scan(
+            es_client, index=es_helper.INDEX, _source=[ElasticSearchDocumentFields.ENTITY_ID.value],
+            query={"query": {"term": {ElasticSearchDocumentFields.RING_ID.value: ring_id}}})]
+        if not members:
+            return []
+
+        # Ring is rebuilt from scratch, so loaded nodes are replaced by singletons
+        union_find = UnionFind(self.store)
+        union_find.nodes = {member: {"parent": member, "size": 1} for member in members}
+        union_find.modified.update(members)
+        # Members are paged, as a terms query can't exceed index.max_terms_count
+        for members_batch in split_list(members, RING_TERMS_BATCH_SIZE):
+            for hit in scan(es_client, index=es_helper.INDEX, _source=[ElasticSearchDocumentFields.FROM_ID.value,
+                                                                       ElasticSearchDocumentFields.TO_ID.value],
+                            query={"query": {"bool": {"filter": [
+                                {"term": {ElasticSearchDocumentFields.DOCUMENT_TYPE.value: DocumentType.EDGE.value}},
+                                {"terms": {ElasticSearchDocumentFields.ENTITY_TYPE.value + ".keyword":
+                                               sorted(self.edge_labels)}},
+                                {"terms": {ElasticSearchDocumentFields.FROM_ID.value: members_batch}}
+                            ]}}}):
+                to_id = hit["_source"].get(ElasticSearchDocumentFields.TO_ID.value)
+                if to_id in union_find.nodes:
+                    union_find.union(hit["_source"][ElasticSearchDocumentFields.FROM_ID.value], to_id)
+
+        actions = []
+        vertex_rings = {}
+        for member in members:
+            root = union_find.find(member)
+            size = union_find.nodes[root]["size"]
+            if size == 1:
+                # Vertex is no longer connected to any other vertex
+                union_find.nodes[member]["parent"] = None
+                vertex_rings[member] = None
+                actions.append(self.__ring_action__(es_client, member, None, None))
+            else:
+                vertex_rings[member] = root
+                actions.append(self.__ring_action__(es_client, member, root, size))
+        union_find.save()
+        self.__remember_writes__(vertex_rings)
+
+        logger.info("Recomputed ring - {} of {} vertices".format(ring_id, len(members)))
+        return actions
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+
+import hashlib
+import logging
+
+from commons import *
+from config_provider import config_provider
+from log_helper import log_event
+from neptune_to_es import es_helper
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+# Rolling aggregates. Comma separated list of key:value:time:bucket_seconds
+# Ex: card1:TransactionAmt:TransactionDT:3600 keeps hourly count & sum of TransactionAmt per card1
+ROLLING_AGGREGATES = config_provider.get_handler_additional_param('RollingAggregates', '')
+
+# Index storing rolling aggregates. Named outside of Neptune index pattern, so that it isn't reindexed or
+# searched along with graph documents.
+FEATURE_INDEX = config_provider.get_handler_additional_param('FeatureIndex', 'neptune_features')
+
+# Feature index document types
+BUCKET_DOCUMENT_TYPE = "rolling_bucket"
+ENTITY_STATE_DOCUMENT_TYPE = "entity_state"
+
+FEATURE_INDEX_MAPPINGS = {
+    "properties": {
+        "document_type": {"type": "keyword"},
+        "aggregate": {"type": "keyword"},
+        "key": {"type": "keyword"},
+        "key_value": {"type": "keyword"},
+        "bucket_start": {"type": "double"},
+        "bucket_size": {"type": "double"},
+        "count": {"type": "long"},
+        "sum": {"type": "double"},
+        "entity_id": {"type": "keyword"},
+        # Keyed by entity id, so not indexed to keep mapping from growing
+        "members": {"type": "object", "enabled": False},
+        "attributes": {"type": "object", "enabled": False}
+    }
+}
+
+# Painless Script to apply contribution changes of entities to a bucket. Contributions are kept per entity, so that
+# replayed records & property updates don't count an entity twice. Empty buckets are deleted.
+BUCKET_SCRIPT = '''for (change in params.changes) {
+                       if (change["amount"] == null) {
+                           ctx._source.members.remove(change["entity"])
+                       } else {
+                           ctx._source.members[change["entity"]] = change["amount"]
+                       }
+                   }
+                   double total = 0;
+                   for (amount in ctx._source.members.values()) {
+                       total += amount
+                   }
+                   ctx._source.count = ctx._source.members.size();
+                   ctx._source.sum = total;
+                   if (ctx._source.count == 0) {
+                       ctx.op = ctx.op == "create" ? "noop" : "delete"
+                   }'''
+
+
+class RollingAggregate:
+
+    """
+    Model for Storing Rolling Aggregate.
+
+    This Class has four attributes:
+    key - Property aggregate is keyed by Ex: card1
+    value - Property counted & summed Ex: TransactionAmt
+    time - Property bucket is derived from Ex: TransactionDT
+    bucket_size - Size of time bucket. Rolling windows are answered by summing buckets within window.
+    """
+
+    def __init__(self, key, value, time, bucket_size):
+        self.key = key
+        self.value = value
+        self.time = time
+        self.bucket_size = bucket_size
+        self.name = "{}_{}_{}".format(key, value, bucket_size)
+
+    def get_contribution(self, attributes):
+
+        """
+        Gets contribution of an entity to aggregate from its attribute values.
+
+        :param attributes: Dict of property key to value of entity
+        :return: Tuple of (key value, bucket start, amount) or None if entity doesn't contribute
+        """
+
+        try:
+            key_value = attributes[self.key]
+            amount = float(attributes[self.value])
+            bucket_start = float(attributes[self.time]) // self.bucket_size * self.bucket_size
+        except (KeyError, TypeError, ValueError):
+            return None
+        return str(key_value), bucket_start, amount
+
+    def get_bucket_id(self, key_value, bucket_start):
+
+        """
+        Generates feature index document id for a bucket.
+
+        :param key_value: Value of key property
+        :param bucket_start: Start of time bucket
+        :return: Document id
+        """
+
+        return hashlib.md5("{}/{}/{}".format(self.name, key_value, bucket_start).encode('utf-8')).hexdigest()
+
+
+def parse_rolling_aggregates(aggregates_str):
+
+    """
+    Parses rolling aggregates config value.
+
+    :param aggregates_str: Comma separated list of key:value:time:bucket_seconds
+    :return: List of RollingAggregate
+    """
+
+    aggregates = []
+    for entry in aggregates_str.split(","):
+        parts = [part.strip() for part in entry.split(":")]
+        if len(parts) != 4 or not parts[3].isdigit() or int(parts[3]) == 0:
+            if entry.strip():
+                logger.warning("Ignoring invalid rolling aggregate - {}".format(entry))
+            continue
+        aggregates.append(RollingAggregate(parts[0], parts[1], parts[2], int(parts[3])))
+    return aggregates
+
+
+def get_rolling_window_query(aggregate_name, key_value, window_start, window_end):
+
+    """
+    Generates query summing buckets of a rolling aggregate within a time window. Window bounds are aligned to
+    bucket size of aggregate.
+
+    :param aggregate_name: Name of aggregate Ex: card1_TransactionAmt_3600
+    :param key_value: Value of key property Ex: 13926
+    :param window_start: Start of window (inclusive)
+    :param window_end: End of window (exclusive)
+    :return: Elastic Search query Dict with count & sum aggregations
+    """
+
+    return {
+        "size": 0,
+        "query": {
+            "bool": {
+                "filter": [
+                    {"term": {"aggregate": aggregate_name}},
+                    {"term": {"key_value": str(key_value)}},
+                    {"range": {"bucket_start": {"gte": window_start, "lt": window_end}}}
+                ]
+            }
+        },
+        "aggs": {
+            "count": {"sum": {"field": "count"}},
+            "sum": {"sum": {"field": "sum"}}
+        }
+    }
+
+
+class RollingAggregator:
+
+    """
+    Maintains rolling window aggregates Ex: count & sum of TransactionAmt per card1 over TransactionDT windows, in a
+    compact feature index as Stream records arrive, so that dashboards read precomputed features instead of
+    aggregating over whole Neptune index.
+
+    Aggregates are kept in fixed size time buckets per key value. Each bucket keeps contribution of every entity
+    (vertex) in it, which makes updates idempotent: a property update moves the contribution of an entity from
+    its old bucket to its new one & removing a property or vertex removes it. Last known values of aggregated
+    properties of an entity are kept in an entity state document in feature index, to find its old contribution.
+
+    Only Gremlin vertex property records are aggregated.
+    """
+
+    def __init__(self, aggregates_str=ROLLING_AGGREGATES):
+        self.aggregates = parse_rolling_aggregates(aggregates_str)
+        self.attributes = {attribute for aggregate in self.aggregates
+                           for attribute in [aggregate.key, aggregate.value, aggregate.time]}
+
+    def ensure_index(self, es_client):
+
+        """
+        Creates feature index if not already present.
+
+        :param es_client: Elastic Search Client
+        """
+
+        if self.aggregates and not es_client.indices.exists(index=FEATURE_INDEX):
+            es_client.indices.create(index=FEATURE_INDEX, body={
+                "settings": es_helper.__index_settings__(),
+                "mappings": FEATURE_INDEX_MAPPINGS
+            })
+            logger.info("Created feature index - {}".format(FEATURE_INDEX))
+
+    @staticmethod
+    def __get_state_id__(entity_id):
+
+        """
+        Generates feature index document id for entity state.
+
+        :param entity_id: Vertex id
+        :return: Document id
+        """
+
+        return hashlib.md5("entity://{}".format(entity_id).encode('utf-8')).hexdigest()
+
+    def __load_states__(self, es_client, entity_ids):
+
+        """
+        Loads last known aggregated property values of entities using a single mget.
+
+        :param es_client: Elastic Search Client
+        :param entity_ids: List of vertex ids
+        :return: Dict of vertex id to Dict of property key to value, for entities with a state document
+        """
+
+        response = es_client.mget(index=FEATURE_INDEX, body={
+            "ids": [self.__get_state_id__(entity_id) for entity_id in entity_ids]
+        })
+        return {doc["_source"]["entity_id"]: doc["_source"]["attributes"]
+                for doc in response["docs"] if doc.get("found")}
+
+    def generate_actions(self, es_client, records):
+
+        """
+        Generates Elastic Search actions updating rolling aggregates from Stream records.
+
+        :param es_client: Elastic Search Client
+        :param records: Filtered Stream records
+        :return: List of Elastic Search Bulk API actions
+        """
+
+        if not self.aggregates:
+            return []
+
+        changed_entities = []
+        for record in records:
+            record_data = record[DATA_STR]
+            if record_data.get(TYPE_STR) == "vp" and record_data[PROPERTY_KEY_STR] in self.attributes:
+                changed_entities.append(record)
+        if not changed_entities:
+            return []
+
+        old_states = self.__load_states__(es_client, list({record[DATA_STR][ID_STR] for record in changed_entities}))
+        new_states = {}
+        for record in changed_entities:
+            record_data = record[DATA_STR]
+            attributes = new_states.setdefault(record_data[ID_STR], dict(old_states.get(record_data[ID_STR], {})))
+            key = record_data[PROPERTY_KEY_STR]
+            value = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR]
+            if record[OPERATION_STR] == "ADD":
+                attributes[key] = value
+            elif attributes.get(key) == value:
+                # Properties can have multiple values. Only removal of last added value clears it.
+                del attributes[key]
+
+        bucket_changes = {}
+        for entity_id, attributes in new_states.items():
+            for aggregate in self.aggregates:
+                old_contribution = aggregate.get_contribution(old_states.get(entity_id, {}))
+                new_contribution = aggregate.get_contribution(attributes)
+                if old_contribution == new_contribution:
+                    continue
+                if old_contribution:
+                    self.__add_bucket_change__(bucket_changes, aggregate, old_contribution, entity_id, None)
+                if new_contribution:
+                    self.__add_bucket_change__(bucket_changes, aggregate, new_contribution, entity_id,
+                                               new_contribution[2])
+
+        # Bucket updates go first. If bulk fails midway, entity states are still old & replay applies same changes.
+        actions = list(bucket_changes.values())
+        for entity_id, attributes in new_states.items():
+            action = {"_index": FEATURE_INDEX, "_type": "_doc", "_id": self.__get_state_id__(entity_id)}
+            if attributes:
+                action["_op_type"] = "index"
+                action["_source"] = {
+                    "document_type": ENTITY_STATE_DOCUMENT_TYPE,
+                    "entity_id": entity_id,
+                    "attributes": attributes
+                }
+            elif entity_id in old_states:
+                action["_op_type"] = "delete"
+            else:
+                continue
+            actions.append(action)
+
+        log_event(logger, logging.DEBUG, "rolling_aggregates_generated", "Generated rolling aggregate actions",
+                  actions=len(actions), entities=len(new_states))
+        return actions
+
+    @staticmethod
+    def __add_bucket_change__(bucket_changes, aggregate, contribution, entity_id, amount):
+
+        """
+        Adds contribution change of an entity to update action of respective bucket.
+
+        :param bucket_changes: Dict of bucket document id to update action
+        :param aggregate: RollingAggregate
+        :param contribution: Tuple of (key value, bucket start, amount)
+        :param entity_id: Vertex id
+        :param amount: New contribution amount or None to remove contribution
+        """
+
+        key_value, bucket_start, _ = contribution
+        bucket_id = aggregate.get_bucket_id(key_value, bucket_start)
+        if bucket_id not in bucket_changes:
+            bucket_changes[bucket_id] = {
+                "_op_type": "update",
+                "_index": FEATURE_INDEX,
+                "_type": "_doc",
+                "_id": bucket_id,
+                "script": {
+                    "source": BUCKET_SCRIPT,
+                    "lang": "painless",
+                    "params": {
+                        "changes": []
+                    }
+                },
+                "scripted_upsert": True,
+                "upsert": {
+                    "document_type": BUCKET_DOCUMENT_TYPE,
+                    "aggregate": aggregate.name,
+                    "key": aggregate.key,
+                    "key_value": key_value,
+                    "bucket_start": bucket_start,
+                    "bucket_size": aggregate.bucket_size,
+                    "count": 0,
+                    "sum": 0,
+                    "members": {}
+                }
+            }
+        bucket_changes[bucket_id]["script"]["params"]["changes"].append({"entity": entity_id, "amount": amount})
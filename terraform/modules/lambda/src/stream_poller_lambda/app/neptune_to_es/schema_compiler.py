@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""
+Compiles Elastic Search index schema from Neptune bulk load CSV headers (Gremlin load data format).
+
+Column headers of bulk load files declare property datatypes Ex: TransactionAmt:Float, card1:Int. Compiled schema maps
+each property key to its Neptune datatype & is applied by es_helper.create_index, so that predicate mappings are
+present in index before first Stream record is replicated.
+
+Usage (from Lambda app directory, so that schema is packaged with Lambda image):
+    python neptune_to_es/schema_compiler.py <bulk load csv file>... > index_schema.json
+
+This module must not depend on Lambda configuration as it is run offline.
+"""
+
+import csv
+import json
+import re
+import sys
+from collections import OrderedDict
+
+# Key under which property datatypes are stored in compiled schema
+PREDICATES_STR = "predicates"
+
+# System columns Ex: ~id, ~label, ~from, ~to are not stored as predicates
+SYSTEM_COLUMN_PREFIX = "~"
+
+# Datatype used when column header doesn't declare one
+DEFAULT_DATATYPE = "string"
+
+# Datatypes supported in Gremlin load data format
+VALID_CSV_DATATYPES = {"bool", "boolean", "byte", "short", "int", "long", "float", "double", "string", "date"}
+
+# Numeric datatypes ordered from narrowest to widest. Used to resolve same property declared with different types.
+NUMERIC_DATATYPES = ["byte", "short", "int", "long", "float", "double"]
+
+# Column header format - name[:Type][(single|set)][[]]
+COLUMN_HEADER_PATTERN = re.compile(r"^(?P<name>.+?)(?::(?P<type>[A-Za-z]+)(?:\((?:single|set)\))?(?:\[\])?)?$",
+                                   re.IGNORECASE)
+
+
+def parse_column_header(column):
+
+    """
+    Parses a bulk load CSV column header into property key & Neptune datatype.
+
+    :param column: CSV column header Ex: TransactionAmt:Float, tags:String[], card1:Int(single)
+    :return: Tuple of property key & lower case datatype, None for system columns
+    """
+
+    column = column.strip()
+    if not column or column.startswith(SYSTEM_COLUMN_PREFIX):
+        return None
+
+    match = COLUMN_HEADER_PATTERN.match(column)
+    datatype = (match.group("type") or DEFAULT_DATATYPE).lower()
+    if datatype not in VALID_CSV_DATATYPES:
+        raise ValueError("Unsupported datatype in column header - {}".format(column))
+
+    return match.group("name"), datatype
+
+
+def read_csv_header(csv_path):
+
+    """
+    Reads column headers of a bulk load CSV file.
+
+    :param csv_path: Path to CSV file
+    :return: List of column headers
+    """
+
+    with open(csv_path, newline='', encoding='utf-8-sig') as csv_file:
+        return next(csv.reader(csv_file), [])
+
+
+def merge_datatypes(current_datatype, new_datatype):
+
+    """
+    Resolves datatype of a property declared in multiple CSV files. Numeric datatypes are widened, any other
+    mismatch falls back to string so that all values can be stored.
+
+    :param current_datatype: Datatype compiled so far
+    :param new_datatype: Datatype declared by another column header
+    :return: Resolved datatype
+    """
+
+    if current_datatype == new_datatype:
+        return current_datatype
+    if {current_datatype, new_datatype} == {"bool", "boolean"}:
+        return "bool"
+    if current_datatype in NUMERIC_DATATYPES and new_datatype in NUMERIC_DATATYPES:
+        return max(current_datatype, new_datatype, key=NUMERIC_DATATYPES.index)
+    return DEFAULT_DATATYPE
+
+
+def compile_schema(csv_paths):
+
+    """
+    Compiles index schema from headers of given bulk load CSV files.
+
+    :param csv_paths: List of paths to CSV files
+    :return: Dict of compiled schema Ex: {"predicates": {"TransactionAmt": "float"}}
+    """
+
+    predicates = OrderedDict()
+    for csv_path in csv_paths:
+        for column in read_csv_header(csv_path):
+            parsed_column = parse_column_header(column)
+            if not parsed_column:
+                continue
+            key, datatype = parsed_column
+            predicates[key] = merge_datatypes(predicates[key], datatype) if key in predicates else datatype
+
+    return {PREDICATES_STR: predicates}
+
+
+def main(argv):
+
+    """
+    Writes schema compiled from CSV files passed as arguments to standard output.
+
+    :param argv: Command line arguments
+    :return: Exit code
+    """
+
+    if not argv:
+        sys.stderr.write("Usage: python schema_compiler.py <bulk load csv file>...\n")
+        return 1
+
+    json.dump(compile_schema(argv), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import logging
+import collections
+
+from commons import *
+from config_provider import config_provider
+from neptune_to_es import es_helper
+from neptune_to_es.es_helper import ElasticSearchDocumentFields
+
+# Logger
+logger = logging.getLogger(__name__)
+logger.setLevel(config_provider.logging_level)
+
+
+class VertexState:
+
+    """
+    Model for Storing state of a vertex evaluated by pipeline stages.
+
+    This Class has four attributes:
+    vertex_id - Vertex id
+    labels - Set of vertex labels
+    properties - Dict of property key to list of values
+    adjacency - Dict of direction to Dict of edge label to list of neighbour vertex ids
+    """
+
+    def __init__(self, vertex_id, labels=None, properties=None, adjacency=None):
+        self.vertex_id = vertex_id
+        self.labels = labels or set()
+        self.properties = properties or {}
+        self.adjacency = adjacency or {}
+
+    def neighbour_ids(self, direction, label):
+        return self.adjacency.get(direction, {}).get(label, [])
+
+
+class VertexStateLoader:
+
+    """
+    Loads state of vertices from their documents, for pipeline stages evaluating vertices changed by Stream records
+    Ex: fraud scoring, feature vectors. Property values are read through handler, as document layout depends on it.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def __to_state__(self, vertex_id, source):
+
+        """
+        Builds vertex state from a vertex document.
+
+        :param vertex_id: Vertex id
+        :param source: Document source
+        :return: VertexState
+        """
+
+        adjacency = {direction: {label: list(summary.get("neighbours", [])) for label, summary in labels.items()}
+                     for direction, labels in source.get(ElasticSearchDocumentFields.ADJACENCY.value, {}).items()}
+        return VertexState(vertex_id, set(source.get(ElasticSearchDocumentFields.ENTITY_TYPE.value, [])),
+                           self.handler.get_document_properties(source), adjacency)
+
+    def fetch_states(self, es_client, vertex_ids, index=None):
+
+        """
+        Fetches vertex documents. Documents are read by id from write index, so that documents written by earlier
+        batches are seen. Documents not found there Ex: stored in routed indices, are searched through alias.
+
+        :param es_client: Elastic Search Client
+        :param vertex_ids: List of vertex ids
+        :param index: Index being built by reindex to read documents from instead of write index
+        :return: Dict of vertex id to VertexState for vertices with a document
+        """
+
+        if not vertex_ids:
+            return {}
+
+        routed = es_helper.EDGE_ROUTING == es_helper.FROM_VERTEX_ROUTING and \
+            es_helper.is_routed_by_from_vertex(es_client)
+        document_vertex_ids = {es_helper.generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"}): vertex_id
+                               for vertex_id in vertex_ids}
+        docs = []
+        for document_id, vertex_id in document_vertex_ids.items():
+            doc = {"_id": document_id}
+            if routed:
+                doc["routing"] = vertex_id
+            docs.append(doc)
+
+        sources = {doc["_id"]: doc["_source"] for doc in
+                   es_client.mget(index=index or es_helper.get_aliased_index(es_client), body={"docs": docs})["docs"]
+                   if doc.get("found")}
+        missing_ids = [document_id for document_id in document_vertex_ids if document_id not in sources]
+        if missing_ids:
+            response = es_client.search(index=es_helper.INDEX, body={
+                "query": {"ids": {"values": missing_ids}},
+                "size": len(missing_ids)
+            })
+            sources.update({hit["_id"]: hit["_source"] for hit in response["hits"]["hits"]})
+
+        return {document_vertex_ids[document_id]: self.__to_state__(document_vertex_ids[document_id], source)
+                for document_id, source in sources.items()}
+
+    def __apply_records__(self, states, records):
+
+        """
+        Applies changes of batch records on top of vertex states.
+
+        :param states: Dict of vertex id to VertexState
+        :param records: Stream records
+        """
+
+        for record in records:
+            record_data = record[DATA_STR]
+            adding = record[OPERATION_STR] == "ADD"
+            if record_data[TYPE_STR] == "e":
+                label = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR]
+                for vertex_id, direction, neighbour_id in [
+                        (record_data[FROM_VERTEX_STR], "out", record_data[TO_VERTEX_STR]),
+                        (record_data[TO_VERTEX_STR], "in", record_data[FROM_VERTEX_STR])]:
+                    if vertex_id not in states:
+                        continue
+                    neighbour_ids = states[vertex_id].adjacency.setdefault(direction, {}).setdefault(label, [])
+                    if adding and neighbour_id not in neighbour_ids:
+                        neighbour_ids.append(neighbour_id)
+                    elif not adding and neighbour_id in neighbour_ids:
+                        neighbour_ids.remove(neighbour_id)
+            elif record_data[TYPE_STR] == "vl":
+                labels = states[record_data[ID_STR]].labels
+                value = record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_STR]
+                labels.add(value) if adding else labels.discard(value)
+            elif record_data[TYPE_STR] == "vp":
+                values = states[record_data[ID_STR]].properties.setdefault(record_data[PROPERTY_KEY_STR], [])
+                value = self.handler.get_property_value(record_data)
+                if adding and value not in values:
+                    values.append(value)
+                elif not adding and value in values:
+                    values.remove(value)
+
+    def load_changed_states(self, es_client, records, index=None):
+
+        """
+        Loads state of vertices changed by Stream records i.e. vertices with label / property records & from vertices
+        of edge records. State is the vertex document before the records with the records applied on top.
+
+        :param es_client: Elastic Search Client
+        :param records: Filtered Stream records
+        :param index: Index being built by reindex to read documents from instead of write index
+        :return: OrderedDict of vertex id to VertexState, in Stream order. Removed vertices have no labels
+                 & properties.
+        """
+
+        vertex_ids = []
+        for record in records:
+            record_data = record[DATA_STR]
+            if record_data[TYPE_STR] in ["vl", "vp"]:
+                vertex_ids.append(record_data[ID_STR])
+            elif record_data[TYPE_STR] == "e":
+                vertex_ids.append(record_data[FROM_VERTEX_STR])
+        if not vertex_ids:
+            return collections.OrderedDict()
+
+        fetched_states = self.fetch_states(es_client, list(collections.OrderedDict.fromkeys(vertex_ids)), index)
+        states = collections.OrderedDict((vertex_id, fetched_states.get(vertex_id, VertexState(vertex_id)))
+                                         for vertex_id in vertex_ids)
+        self.__apply_records__(states, records)
+        return states
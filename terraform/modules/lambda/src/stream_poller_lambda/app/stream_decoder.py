@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import abc
+import six
+import re
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# orjson silently turns integers outside of the 64 bit range into floats, while stdlib json keeps them exact.
+# Integers of 19 or more digits between JSON delimiters Ex: ":" & ",", could be out of range, so those are checked
+# & responses containing one out of range are decoded with stdlib json. Digit runs in strings Ex: ids, values of
+# string properties, don't force the fallback.
+WIDE_NUMBER_PATTERN = re.compile(rb'(?:^|[:,\[])\s*(-?\d{19,})(?=\s*(?:[,\]}]|$))')
+
+# Range of integers orjson decodes exactly
+MIN_ORJSON_INTEGER = -2 ** 63
+MAX_ORJSON_INTEGER = 2 ** 64 - 1
+
+
+def has_wide_integer(content):
+
+    """
+    Checks if Stream response body contains an integer orjson can't decode exactly.
+
+    :param content: Stream response body as bytes
+    :return: True if an integer is out of 64 bit range
+    """
+
+    return any(not MIN_ORJSON_INTEGER <= int(match.group(1)) <= MAX_ORJSON_INTEGER
+               for match in WIDE_NUMBER_PATTERN.finditer(content))
+
+
+@six.add_metaclass(abc.ABCMeta)
+class StreamDecoder:
+
+    """
+    Abstract class for decoding Neptune Stream http responses.
+    Implementations must return the same objects as stdlib json would, especially for numeric values
+    like commitNum, opNum & property values.
+    """
+
+    @abc.abstractmethod
+    def decode(self, content):
+
+        """
+        Decodes raw Stream response body.
+
+        :param content: Stream response body as bytes
+        :return: Decoded Stream response
+        """
+        pass
+
+
+class JsonStreamDecoder(StreamDecoder):
+
+    """
+    Implementation of Stream Decoder using stdlib json module.
+    """
+
+    def decode(self, content):
+        return json.loads(content)
+
+
+class OrjsonStreamDecoder(StreamDecoder):
+
+    """
+    Implementation of Stream Decoder using orjson. Responses which orjson would decode differently from
+    stdlib json i.e. integers wider than 64 bit, NaN / Infinity literals or lone surrogates in strings
+    are decoded using stdlib json.
+    """
+
+    def __init__(self):
+        self.fallback_decoder = JsonStreamDecoder()
+
+    def decode(self, content):
+        if has_wide_integer(content):
+            return self.fallback_decoder.decode(content)
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return self.fallback_decoder.decode(content)
+
+
+def get_default_stream_decoder():
+
+    """
+    Returns accelerated Stream Decoder if orjson is installed else Stream Decoder using stdlib json.
+
+    :return: Stream Decoder instance
+    """
+
+    return OrjsonStreamDecoder() if orjson is not None else JsonStreamDecoder()
+
+
+# Global variable to access stream_decoder. By default accelerated decoder is used when available.
+# Stream Decoder can be changed by using set_stream_decoder Method
+stream_decoder = get_default_stream_decoder()
+
+
+def set_stream_decoder(decoder):
+
+    """
+    Sets global Stream Decoder Instance which can be used across the module.
+
+    :param decoder: Stream Decoder instance
+    """
+
+    global stream_decoder
+    stream_decoder = decoder
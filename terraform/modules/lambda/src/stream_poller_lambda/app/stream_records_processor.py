@@ -28,6 +28,8 @@ from commons import *
 
 import neptune_sigv4_signer
 from config_provider import config_provider
+from log_helper import Payload, log_event
+import stream_decoder
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -121,8 +123,8 @@ class StreamRecordsProcessor:
             headers = neptune_sigv4_signer.get_signed_header(urlparse(config_provider.neptune_stream_endpoint).netloc,
                                                              'GET', query_type, payload)
 
-        logger.debug("Querying Neptune Stream with endpoint - {}, payload - {}"
-                     .format(config_provider.neptune_stream_endpoint, str(payload)))
+        log_event(logger, logging.DEBUG, "stream_query", "Querying Neptune Stream",
+                  endpoint=config_provider.neptune_stream_endpoint, payload=Payload(payload))
         return self._fetch_and_validate_stream_records(payload, headers=headers,
                                                        starting_commit_num=starting_commit_num)
 
@@ -156,6 +158,19 @@ class StreamRecordsProcessor:
         # Calling Handler to further process Stream Records
         return stream_records_handler.handle_records(stream_log), stream_log
 
+    def run_maintenance(self, lease, lease_manager, execution_end_time):
+
+        """
+        Runs maintenance tasks of the configured Handler Ex: reindex, before Stream records are polled.
+        Maintenance state is persisted in lease table using lease manager.
+
+        :param lease: lease object from Dynamo DB Table
+        :param lease_manager: instance of ddb_helper.DDBLeaseManager
+        :param execution_end_time: Time in milliseconds by which maintenance should return
+        """
+
+        stream_records_handler.run_maintenance(lease, lease_manager, self.read_records, execution_end_time)
+
     def process_with_metrics(self, lease, lease_manager, metrics_publisher_client):
 
         """
@@ -197,9 +212,12 @@ class StreamRecordsProcessor:
                         .format(lease['checkpoint'], lease['checkpointSubSequenceNumber']))
             lease_manager.update_lease(lease)
             logger.info("Publishing Stream Records Processed Metrics data...")
+            # Dropped records are published per drop reason along with processed records
             metrics_publisher_client \
                 .publish_metrics([metrics_publisher_client
-                                 .generate_record_processed_metrics(result.records_processed)])
+                                 .generate_record_processed_metrics(result.records_processed)] +
+                                 [metrics_publisher_client.generate_records_dropped_metrics(reason, count)
+                                  for reason, count in result.records_dropped.items()])
             logger.info("Finished publishing data to Metrics")
 
         logger.info("Publishing Stream Lag Metrics data...")
@@ -280,8 +298,10 @@ class StreamRecordsProcessor:
         """
         with requests.get(config_provider.neptune_stream_endpoint, params=payload, headers=headers) as response:
             if response.status_code == 200:
-                # Successfully retrieved records from Stream
-                return response.json()
+                # Successfully retrieved records from Stream. Decoding raw content is cheaper than
+                # response.json() which guesses encoding & always uses stdlib json. Decoder is read through module,
+                # so that decoder set by set_stream_decoder is used.
+                return stream_decoder.stream_decoder.decode(response.content)
             elif response.status_code == 404:
                 # Either No records present or reached end of Stream Case
                 logger.info("No more Records...")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+
+"""
+Benchmark of es_helper.parse_date against dateutil parser, which it replaced for ISO-8601 dates.
+Run from stream_poller_lambda directory: python bench/bench_parse_date.py
+"""
+
+import os
+import runpy
+import timeit
+
+from dateutil.parser import parse
+
+# Environment & path App modules need at import time are set up the same way as for tests
+runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "conftest.py"))
+
+from neptune_to_es import es_helper  # noqa: E402
+
+# Distinct ISO-8601 values, so that memoisation of parse_date doesn't hide parsing cost
+ISO_DATES = ["2003-09-{:02d}T10:{:02d}:41.{:03d}Z".format(day % 28 + 1, day % 60, day % 1000) for day in range(5000)]
+NON_ISO_DATES = ["{}-{:02d}-{}".format(month, day, 1990 + year)
+                 for month in ["Jan", "Mar", "Sep", "Dec"] for day in range(1, 29) for year in range(40)]
+REPEATS = 5
+
+
+def __uncached_parse_date__(values):
+    es_helper.parse_date.cache_clear()
+    for value in values:
+        es_helper.parse_date(value)
+
+
+def __cached_parse_date__(values):
+    for value in values:
+        es_helper.parse_date(value)
+
+
+def __dateutil_parse__(values):
+    for value in values:
+        parse(value)
+
+
+def __report__(name, values, baseline):
+    for label, function in [("dateutil", __dateutil_parse__), ("parse_date", __uncached_parse_date__),
+                            ("parse_date cached", __cached_parse_date__)]:
+        seconds = min(timeit.repeat(lambda: function(values), number=1, repeat=REPEATS))
+        print("{:<10} {:<18} {:>8.2f} us/value {:>6.1f}x".format(
+            name, label, seconds / len(values) * 1e6, baseline[name] / seconds if name in baseline else 1.0))
+        baseline.setdefault(name, seconds)
+
+
+if __name__ == "__main__":
+    # Fast path must agree with dateutil before it is timed
+    assert all(es_helper.parse_date(value) == parse(value) for value in ISO_DATES)
+    baseline = {}
+    __report__("iso", ISO_DATES, baseline)
+    __report__("non-iso", NON_ISO_DATES, baseline)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import json
+import os
+import sys
+
+# App modules read configuration from environment at import time, so it is set before tests import them
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+for key, value in {
+    "AWS_REGION": "us-east-1",
+    "StreamRecordsBatchSize": "100",
+    "MaxPollingWaitTime": "10",
+    "MaxPollingInterval": "600",
+    "Application": "test",
+    "LeaseTable": "test-lease",
+    "NeptuneStreamEndpoint": "https://localhost:8182/gremlin/stream",
+    "StreamRecordsHandler": "neptune_to_es.neptune_gremlin_es_handler.ElasticSearchGremlinHandler",
+    "AdditionalParams": json.dumps({"ElasticSearchEndpoint": "https://localhost:443"})
+}.items():
+    os.environ.setdefault(key, value)
+
+# Directory of recorded Stream GetRecords responses & rule files used by tests
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
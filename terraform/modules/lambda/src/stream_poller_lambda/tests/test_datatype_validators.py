@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import math
+from decimal import Decimal
+
+import pytest
+
+from neptune_to_es.datatype_validators import coerce, coerce_batch, InvalidValue
+
+# Values covering vectorised & per element paths of coerce_batch Ex: outliers, wrong types, non finite numbers
+MIXED_VALUES = [1, "2", 3.5, "x", True, None, 2 ** 70, "1e3", float("inf"), float("nan"), Decimal("4"), "7.5",
+                -2 ** 63, 2 ** 63, "", " 12 "]
+
+
+def __normalise__(value):
+    # InvalidValue instances don't compare equal, only their type matters
+    return InvalidValue if isinstance(value, InvalidValue) else value
+
+
+@pytest.mark.parametrize("value, es_datatype, expected", [
+    ("12.5", "double", 12.5),
+    (7, "double", 7.0),
+    (True, "double", InvalidValue),
+    (float("nan"), "double", InvalidValue),
+    ("7", "long", 7),
+    (7.0, "long", 7),
+    (Decimal("3"), "long", 3),
+    ("7.5", "long", InvalidValue),
+    (Decimal("3.5"), "long", InvalidValue),
+    (2 ** 63, "long", InvalidValue),
+    (2 ** 53 + 1, "long", 2 ** 53 + 1),
+    ("9007199254740993", "long", 9007199254740993),
+    ("abc", "long", InvalidValue),
+    ("2003-09-25", "date", "2003-09-25T00:00:00.000"),
+    ("2003-09-25T10:49:41Z", "date", "2003-09-25T10:49:41.000+00:00"),
+    (1.5, "date", InvalidValue),
+    ("true", "boolean", True),
+    (False, "boolean", False),
+    ("yes", "boolean", InvalidValue),
+    ("45.1,-120.2", "geo_point", "45.1,-120.2"),
+    ("95,0", "geo_point", InvalidValue),
+    (5, "text", "5"),
+    (None, "keyword", InvalidValue)
+])
+def test_coerce(value, es_datatype, expected):
+    assert __normalise__(coerce(value, es_datatype)) == expected
+
+
+def test_coerce_epoch_dates():
+    assert coerce(1, "date", True) == "1970-01-01T00:00:00.001"
+    assert coerce(253402300799999, "date", True) == "9999-12-31T23:59:59.999"
+    assert isinstance(coerce("x", "date", True), InvalidValue)
+    # Gremlin dates can only be stored as dates
+    assert isinstance(coerce(5, "double", True), InvalidValue)
+
+
+@pytest.mark.parametrize("es_datatype", ["double", "long", "date", "boolean", "text"])
+def test_coerce_batch_matches_coerce(es_datatype):
+    expected = [__normalise__(coerce(value, es_datatype)) for value in MIXED_VALUES]
+    actual = [__normalise__(value) for value in coerce_batch(MIXED_VALUES, es_datatype)]
+    assert actual == expected
+
+
+def test_coerce_batch_matches_coerce_for_epoch_dates():
+    values = [0, 1064487581000, "1064487581000", -1, 1.5, "x", None, 10 ** 20, 1.0, 253402300799999,
+              "253402300799999", 253402300800000, -62135596800000, -62135510400000]
+    expected = [__normalise__(coerce(value, "date", True)) for value in values]
+    assert [__normalise__(value) for value in coerce_batch(values, "date", True)] == expected
+
+
+def test_coerce_batch_matches_coerce_for_longs_beyond_float_precision():
+    values = [2 ** 53 + 1, "9007199254740993", 2 ** 63 - 1, str(2 ** 63 - 1), -2 ** 63 + 1, 2.0 ** 60, "1e18"]
+    expected = [__normalise__(coerce(value, "long")) for value in values]
+    assert expected[:5] == [2 ** 53 + 1, 2 ** 53 + 1, 2 ** 63 - 1, 2 ** 63 - 1, -2 ** 63 + 1]
+    assert [__normalise__(value) for value in coerce_batch(values, "long")] == expected
+
+
+def test_coerce_batch_keeps_types():
+    coerced = coerce_batch([1, 2 ** 62, "3"], "long")
+    assert coerced == [1, 2 ** 62, 3]
+    assert all(type(value) == int for value in coerced)
+    assert all(type(value) == float and math.isfinite(value) for value in coerce_batch([1, "2.5"], "double"))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import datetime
+
+import pytest
+from dateutil.parser import parse
+
+from neptune_to_es import es_helper
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    es_helper.parse_date.cache_clear()
+    es_helper.invalidate_index_mapping()
+    yield
+
+
+@pytest.mark.parametrize("date_str", [
+    "2003-09-25",
+    "2003-09-25T10:49",
+    "2003-09-25T10:49:41",
+    "2003-09-25 10:49:41",
+    "2003-09-25T10:49:41.5",
+    "2003-09-25T10:49:41,123456789",
+    "2003-09-25T10:49:41.123Z",
+    "2003-09-25T10:49:41+05:30",
+    "2003-09-25T10:49:41-0800",
+    "2003-09-25T10:49+01"
+])
+def test_parse_date_iso_fast_path_matches_dateutil(date_str):
+    assert es_helper.ISO_DATE_PATTERN.match(date_str)
+    assert es_helper.parse_date(date_str) == parse(date_str)
+
+
+@pytest.mark.parametrize("date_str", ["Sep-25-2003", "25 September 2003 10:49", "2003/09/25"])
+def test_parse_date_falls_back_to_dateutil(date_str):
+    assert es_helper.parse_date(date_str) == parse(date_str)
+
+
+def test_parse_date_rejects_invalid_dates():
+    # Out of range fields match ISO pattern, but are left to dateutil which rejects them
+    with pytest.raises(ValueError):
+        es_helper.parse_date("2003-02-30")
+    with pytest.raises(ValueError):
+        es_helper.parse_date("not a date")
+
+
+def test_parse_date_memoises_results():
+    first = es_helper.parse_date("2003-09-25T10:49:41Z")
+    assert es_helper.parse_date("2003-09-25T10:49:41Z") is first
+    assert first.tzinfo == datetime.timezone.utc
+
+
+def test_add_local_mapping_keeps_mapped_fields():
+    cache = {es_helper.INDEX: {"mappings": {"properties": {"entity_id": {"type": "keyword"}}}}}
+
+    cache = es_helper.__add_local_mapping__(cache, "age", "long")
+    cache = es_helper.__add_local_mapping__(cache, "name", "string")
+
+    properties = cache[es_helper.INDEX]["mappings"]["properties"]
+    assert properties["entity_id"] == {"type": "keyword"}
+    assert es_helper.get_current_mapping_for_predicate("age", cache) == "long"
+    assert es_helper.get_current_mapping_for_predicate("name", cache) == "text"
+
+
+def test_add_local_mapping_to_empty_cache():
+    cache = es_helper.__add_local_mapping__(None, "age", "long")
+    assert es_helper.get_current_mapping_for_predicate("age", cache) == "long"
+
+
+def test_index_versions():
+    assert es_helper.get_versioned_index_name(2) == "amazon_neptune_v2"
+    assert es_helper.get_index_version("amazon_neptune_v2") == 2
+    # Index created before indices were versioned is only rebuilt on an IndexVersion bump
+    assert es_helper.get_index_version(es_helper.INDEX) == 1
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import os
+
+import pytest
+from rdflib import URIRef
+
+from commons import *
+from conftest import DATA_DIR
+from neptune_to_es import es_helper, filter_plan
+from neptune_to_es.filter_plan import DropReason, GremlinFilterPlan, ReplicationRules, ScopeRule, SparqlFilterPlan, \
+    DEFAULT_GRAPH, load_replication_rules
+
+RULES_FILE = os.path.join(DATA_DIR, "replication_rules.json")
+
+
+class StubIndices:
+
+    def exists_alias(self, name):
+        return False
+
+
+class StubElasticSearch:
+
+    """
+    Serves label documents by index, id & routing & counts multi get requests. Search isn't real time, so it doesn't
+    find documents.
+    """
+
+    def __init__(self, labels, index=es_helper.INDEX, routings=None):
+        self.indices = StubIndices()
+        self.documents = {}
+        self.mget_count = 0
+        self.add_documents(labels, index, routings)
+
+    def add_documents(self, labels, index=es_helper.INDEX, routings=None):
+        for (element_type, element_id), element_labels in labels.items():
+            document_id = es_helper.generate_es_document_id({ID_STR: element_id, TYPE_STR: element_type})
+            self.documents[(index, document_id)] = (element_labels, (routings or {}).get(element_id))
+
+    def mget(self, body, index=None):
+        self.mget_count += 1
+        docs = []
+        for doc in body["docs"]:
+            labels, routing = self.documents.get((doc.get("_index", index), doc["_id"]), (None, None))
+            docs.append({"_index": doc.get("_index", index), "_id": doc["_id"], "_source": {"entity_type": labels},
+                         "found": labels is not None and doc.get("routing") == routing})
+        return {"docs": docs}
+
+    def search(self, index, body):
+        return {"hits": {"hits": []}}
+
+
+@pytest.fixture(autouse=True)
+def clear_aliased_index():
+    es_helper.invalidate_index_mapping()
+    yield
+
+
+def __record__(record_type, element_id, value, key=None, datatype="String", operation="ADD", from_id=None):
+    record_data = {ID_STR: element_id, TYPE_STR: record_type, PROPERTY_VALUE_STR: {PROPERTY_VALUE_STR: value}}
+    if key:
+        record_data[PROPERTY_KEY_STR] = key
+        record_data[PROPERTY_VALUE_STR][PROPERTY_VALUE_TYPE_STR] = datatype
+    if record_type == "e":
+        record_data[FROM_VERTEX_STR], record_data[TO_VERTEX_STR] = "t1", "d1"
+    if from_id:
+        record_data[FROM_VERTEX_STR] = from_id
+    return {OPERATION_STR: operation, DATA_STR: record_data}
+
+
+def test_scope_rule():
+    rule = ScopeRule(include=["a", "b"], exclude=["b"])
+    assert rule.allows("a") and not rule.allows("b") and not rule.allows("c")
+    assert rule.allows_any(["c", "a"])
+    # Element with unknown labels is only in scope of rules without include list
+    assert not rule.allows_any([])
+    assert ScopeRule(exclude=["b"]).allows_any([])
+
+
+def test_load_replication_rules():
+    rules = load_replication_rules(RULES_FILE)
+    assert rules.uses_labels()
+    assert rules.vertex_labels.allows("transaction") and not rules.vertex_labels.allows("identity")
+    assert set(rules.properties) == {"*", "device"}
+    assert not load_replication_rules("").uses_labels()
+
+
+def test_gremlin_plan_without_rules_replicates_everything():
+    plan = GremlinFilterPlan(False, ReplicationRules())
+    assert plan.check(__record__("vl", "t1", "anything")[DATA_STR]) is None
+    assert plan.check(__record__("vp", "t1", 1, "amount", "Integer")[DATA_STR]) is None
+    assert plan.check(__record__("vp", "t1", 1, "amount", "Unknown")[DATA_STR]) == DropReason.INVALID_DATATYPE
+
+
+def test_gremlin_plan_drops_edges():
+    plan = GremlinFilterPlan(True, ReplicationRules())
+    assert plan.check(__record__("e", "e1", "relation_device")[DATA_STR]) == DropReason.EDGE_UPDATES
+    assert plan.check(__record__("ep", "e1", 1, "weight", "Integer")[DATA_STR]) == DropReason.EDGE_UPDATES
+    assert plan.check(__record__("vl", "t1", "transaction")[DATA_STR]) is None
+
+
+def test_gremlin_plan_checks_labels_of_batch_and_documents():
+    plan = GremlinFilterPlan(False, load_replication_rules(RULES_FILE))
+    es_client = StubElasticSearch({("vl", "i1"): ["identity"], ("vl", "d1"): ["device"]})
+    records = [__record__("vl", "t1", "transaction"), __record__("vp", "t1", 5, "amount", "Integer"),
+               __record__("vp", "t1", "x", "raw_payload"), __record__("vp", "i1", "x", "email"),
+               __record__("vp", "d1", "x", "deviceType"), __record__("vp", "d1", "x", "deviceInfo"),
+               __record__("e", "e1", "relation_identity")]
+
+    plan.resolve_labels(es_client, records)
+
+    assert [plan.check(record[DATA_STR]) for record in records] == [
+        None, None, DropReason.EXCLUDED_PROPERTY, DropReason.EXCLUDED_LABEL,
+        None, DropReason.EXCLUDED_PROPERTY, DropReason.EXCLUDED_LABEL]
+    assert es_client.mget_count == 1
+
+    # Labels are cached, so documents aren't read again
+    plan.resolve_labels(es_client, [__record__("vp", "i1", "y", "email")])
+    assert es_client.mget_count == 1
+
+
+def test_gremlin_plan_reads_labels_from_routed_indices():
+    plan = GremlinFilterPlan(False, load_replication_rules(RULES_FILE))
+    routed_index = es_helper.INDEX + "_label_transaction"
+    es_client = StubElasticSearch({("vl", "t1"): ["transaction"]}, routed_index)
+    records = [__record__("vp", "t1", 5, "amount", "Integer")]
+
+    plan.resolve_labels(es_client, records, [es_helper.INDEX, routed_index])
+
+    assert plan.check(records[0][DATA_STR]) is None
+
+
+def test_gremlin_plan_reads_edge_labels_with_from_vertex_routing(monkeypatch):
+    monkeypatch.setattr(es_helper, "EDGE_ROUTING", es_helper.FROM_VERTEX_ROUTING)
+    monkeypatch.setattr(es_helper, "is_routed_by_from_vertex", lambda es_client: True)
+    plan = GremlinFilterPlan(False, load_replication_rules(RULES_FILE))
+    es_client = StubElasticSearch({("e", "e1"): ["relation_device"], ("e", "e2"): ["relation_device"],
+                                   ("vl", "d1"): ["device"]}, routings={"e1": "t1", "e2": "t2", "d1": "d1"})
+    records = [__record__("ep", "e1", 1, "weight", "Integer", from_id="t1"),
+               __record__("ep", "e2", 1, "weight", "Integer"), __record__("vp", "d1", "x", "deviceType")]
+
+    # Routing of edges without from vertex id in records is taken from edges stored earlier
+    plan.resolve_labels(es_client, records,
+                        edge_routings={es_helper.generate_es_document_id({ID_STR: "e2", TYPE_STR: "e"}): "t2"})
+
+    assert [plan.check(record[DATA_STR]) for record in records] == [None, None, None]
+
+
+def test_gremlin_plan_does_not_cache_missing_labels():
+    plan = GremlinFilterPlan(False, load_replication_rules(RULES_FILE))
+    es_client = StubElasticSearch({})
+    records = [__record__("vp", "t1", 5, "amount", "Integer")]
+
+    plan.resolve_labels(es_client, records)
+    assert plan.check(records[0][DATA_STR]) == DropReason.EXCLUDED_LABEL
+
+    # Document written by an earlier batch is found by the next one
+    es_client.add_documents({("vl", "t1"): ["transaction"]})
+    plan.resolve_labels(es_client, records)
+    assert plan.check(records[0][DATA_STR]) is None
+    assert es_client.mget_count == 2
+
+
+def test_gremlin_plan_does_not_take_labels_from_removed_records():
+    plan = GremlinFilterPlan(False, load_replication_rules(RULES_FILE))
+    es_client = StubElasticSearch({("vl", "i1"): ["identity"]})
+    records = [__record__("vl", "i1", "transaction", operation="REMOVE"), __record__("vp", "i1", "x", "email")]
+
+    plan.resolve_labels(es_client, records)
+
+    assert [plan.check(record[DATA_STR]) for record in records] == [DropReason.EXCLUDED_LABEL] * 2
+    assert plan.label_cache[("vl", "i1")] == ("identity",)
+
+
+def test_gremlin_plan_memoises_decisions():
+    plan = GremlinFilterPlan(False, ReplicationRules())
+    record_data = __record__("vp", "t1", 1, "amount", "Integer")[DATA_STR]
+    plan.check(record_data)
+    plan.check(__record__("vp", "t2", 2, "amount", "Integer")[DATA_STR])
+    assert len(plan.decisions) == 1
+
+
+def test_sparql_plan_checks_statements():
+    plan = SparqlFilterPlan(load_replication_rules(RULES_FILE))
+    graph = URIRef("http://example.org/g")
+
+    def check(predicate, statement_graph=graph):
+        statement_elements = {PREDICATE: URIRef(predicate)}
+        if statement_graph:
+            statement_elements[GRAPH] = statement_graph
+        return plan.check_statement(statement_elements)
+
+    assert check("http://example.org/name") is None
+    assert check("http://example.org/comment") == DropReason.EXCLUDED_PREDICATE
+    assert check("http://example.org/name", URIRef("http://example.org/other")) == DropReason.EXCLUDED_GRAPH
+    # Statements without graph belong to default graph, which isn't included
+    assert check("http://example.org/name", None) == DropReason.EXCLUDED_GRAPH
+    assert plan.statement_decisions[("http://example.org/name", DEFAULT_GRAPH)] == DropReason.EXCLUDED_GRAPH
+
+
+def test_sparql_plan_bounds_memoised_decisions(monkeypatch):
+    monkeypatch.setattr(filter_plan, "FILTER_DECISION_CACHE_SIZE", 2)
+    plan = SparqlFilterPlan(load_replication_rules(RULES_FILE))
+    for graph in ["http://example.org/g", "http://example.org/h", "http://example.org/i"]:
+        plan.check_statement({PREDICATE: URIRef("http://example.org/name"), GRAPH: URIRef(graph)})
+    assert list(plan.statement_decisions) == [("http://example.org/name", "http://example.org/i")]
+
+
+def test_sparql_plan_keeps_rdf_type():
+    plan = SparqlFilterPlan(ReplicationRules(predicates=ScopeRule(include=["http://example.org/name"])))
+    assert plan.check_statement({PREDICATE: RDF_TYPE}) is None
+    assert plan.check_statement({PREDICATE: URIRef("http://example.org/age")}) == DropReason.EXCLUDED_PREDICATE
+    assert plan.check("http://example.org/age", "integer") is None
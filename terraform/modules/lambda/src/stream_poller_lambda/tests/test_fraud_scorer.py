@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from neptune_to_es.fraud_scorer import EvaluationContext, FraudScorer, compile_condition, load_fraud_rules, \
+    neighbour_edges
+from neptune_to_es.vertex_state import VertexState
+
+RULES_FILE = os.path.join(DATA_DIR, "fraud_rules.json")
+
+
+class StubStateLoader:
+
+    """
+    Serves vertex states & records vertex ids of each fetch.
+    """
+
+    def __init__(self, states):
+        self.states = states
+        self.fetches = []
+        self.indices = []
+
+    def fetch_states(self, es_client, vertex_ids, index=None):
+        self.fetches.append(list(vertex_ids))
+        self.indices.append(index)
+        return {vertex_id: self.states[vertex_id] for vertex_id in vertex_ids if vertex_id in self.states}
+
+
+def __transaction__(vertex_id, amount, devices=()):
+    return VertexState(vertex_id, {"transaction"}, {"TransactionAmt": [amount]},
+                       {"out": {"relation_device": list(devices)}})
+
+
+def __device__(vertex_id, transactions):
+    return VertexState(vertex_id, {"device"}, {}, {"in": {"relation_device": list(transactions)}})
+
+
+def __evaluate__(spec, state, neighbours=None):
+    neighbours = neighbours or {}
+    context = EvaluationContext(state, lambda ids: [neighbours[vertex_id] for vertex_id in ids
+                                                    if vertex_id in neighbours])
+    return compile_condition(spec)(context)
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ({"label": "transaction"}, True),
+    ({"label": "device"}, False),
+    ({"property": "TransactionAmt", "op": "gte", "value": 1000}, True),
+    ({"property": "TransactionAmt", "op": "lt", "value": 1000}, False),
+    ({"property": "TransactionAmt", "op": "in", "value": [1500, 2000]}, True),
+    # Values of incompatible types don't match instead of failing
+    ({"property": "TransactionAmt", "op": "gt", "value": "high"}, False),
+    ({"property": "Missing", "op": "eq", "value": 1}, False),
+    ({"degree": {"direction": "out", "label": "relation_device", "op": "eq", "value": 2}}, True),
+    ({"all": [{"label": "transaction"}, {"property": "TransactionAmt", "op": "gt", "value": 2000}]}, False),
+    ({"any": [{"label": "device"}, {"property": "TransactionAmt", "op": "gt", "value": 1000}]}, True),
+    ({"not": {"label": "transaction"}}, False)
+])
+def test_compile_condition(spec, expected):
+    assert __evaluate__(spec, __transaction__("t1", 1500, ["d1", "d2"])) is expected
+
+
+def test_compile_neighbour_condition():
+    spec = {"neighbour": {"direction": "out", "label": "relation_device",
+                          "condition": {"degree": {"direction": "in", "label": "relation_device", "op": "gt",
+                                                   "value": 2}}}}
+    neighbours = {"d1": __device__("d1", ["t1"]), "d2": __device__("d2", ["t1", "t2", "t3"])}
+    assert __evaluate__(spec, __transaction__("t1", 10, ["d1", "d2"]), neighbours)
+    assert not __evaluate__(spec, __transaction__("t1", 10, ["d1"]), neighbours)
+
+
+def test_compile_condition_rejects_invalid_spec():
+    with pytest.raises(ValueError):
+        compile_condition({"unknown": 1})
+    with pytest.raises(KeyError):
+        compile_condition({"property": "TransactionAmt", "op": "between", "value": 1})
+
+
+def test_neighbour_edges():
+    spec = {"all": [{"label": "transaction"},
+                    {"not": {"neighbour": {"direction": "in", "label": "uses", "condition": {
+                        "neighbour": {"label": "nested", "condition": {"label": "x"}}}}}},
+                    {"any": [{"neighbour": {"label": "relation_device", "condition": {"label": "device"}}}]}]}
+    # Edges of neighbours of neighbours aren't read from the evaluated vertex
+    assert neighbour_edges(spec) == {("in", "uses"), ("out", "relation_device")}
+
+
+def test_load_fraud_rules():
+    label, rules = load_fraud_rules(RULES_FILE)
+    assert label == "transaction"
+    assert [(rule.rule_id, rule.weight) for rule in rules] == [("high_amount", 30.0), ("shared_device", 50.0),
+                                                             ("no_card", 1.0)]
+    assert rules[1].neighbour_edges == {("out", "relation_device")}
+    assert load_fraud_rules("") == (None, [])
+
+
+def test_generate_actions_fetches_neighbours_once_per_batch():
+    loader = StubStateLoader({"d1": __device__("d1", ["t1"]), "d2": __device__("d2", ["t1", "t2", "t3"])})
+    scorer = FraudScorer(loader, RULES_FILE)
+    states = {"t1": __transaction__("t1", 1500, ["d1", "d2"]), "t2": __transaction__("t2", 10, ["d2"]),
+              "d3": __device__("d3", []), "t4": VertexState("t4")}
+
+    actions = scorer.generate_actions(None, states)
+
+    # Device & removed vertex aren't scored
+    assert [(action["script"]["params"]["score"], action["script"]["params"]["rules"]) for action in actions] == [
+        (81.0, ["high_amount", "shared_device", "no_card"]), (51.0, ["shared_device", "no_card"])]
+    assert loader.fetches == [["d1", "d2"]]
+
+    # Neighbours are cached across batches
+    scorer.generate_actions(None, {"t5": __transaction__("t5", 10, ["d2"])})
+    assert loader.fetches == [["d1", "d2"]]
+
+
+def test_generate_actions_reads_neighbours_from_index_being_reindexed():
+    loader = StubStateLoader({"d2": __device__("d2", ["t1", "t2", "t3"])})
+    scorer = FraudScorer(loader, RULES_FILE)
+
+    actions = scorer.generate_actions(None, {"t1": __transaction__("t1", 10, ["d2"])}, "amazon_neptune_v2")
+    assert actions[0]["script"]["params"]["rules"] == ["shared_device", "no_card"]
+
+    # Neighbours read from index being reindexed aren't cached for live replication
+    scorer.generate_actions(None, {"t2": __transaction__("t2", 10, ["d2"])})
+    assert loader.fetches == [["d2"], ["d2"]]
+    assert loader.indices == ["amazon_neptune_v2", None]
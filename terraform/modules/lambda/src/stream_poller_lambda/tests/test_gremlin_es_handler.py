@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+
+import pytest
+
+from commons import *
+from neptune_to_es import neptune_gremlin_es_handler, neptune_to_es_handler
+from neptune_to_es.es_helper import generate_es_document_id
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(neptune_gremlin_es_handler, "ADJACENCY_SUMMARIES", True)
+    # Handler is created without connecting to Elastic Search, generating actions only needs query builders
+    handler = object.__new__(neptune_gremlin_es_handler.ElasticSearchGremlinHandler)
+    handler.add_query_builder_map()
+    return handler
+
+
+def __record__(record_type, element_id, value, commit_num, key=LABEL_STR, from_id=None, to_id=None):
+    record_data = {ID_STR: element_id, TYPE_STR: record_type, PROPERTY_KEY_STR: key,
+                   PROPERTY_VALUE_STR: {PROPERTY_VALUE_STR: value, PROPERTY_VALUE_TYPE_STR: "String"}}
+    if from_id:
+        record_data[FROM_VERTEX_STR], record_data[TO_VERTEX_STR] = from_id, to_id
+    return {OPERATION_STR: "ADD", EVENT_ID_STR: {COMMIT_NUM_STR: commit_num, OP_NUM_STR: 1}, DATA_STR: record_data}
+
+
+def __summarise__(actions):
+    # Adjacency updates are listed as (vertex id, direction), other actions by their document id
+    vertex_ids = {generate_es_document_id({ID_STR: vertex_id, TYPE_STR: "vl"}): vertex_id for vertex_id in "abcd"}
+    return [(vertex_ids[action["_id"]], action["script"]["params"]["changes"][0]["direction"])
+            if "changes" in action.get("script", {}).get("params", {}) else action["_id"] for action in actions]
+
+
+def test_adjacency_of_edge_bundle_starting_with_edge_property(handler):
+    records = [__record__("ep", "e1", "x", 5, "weight"), __record__("e", "e1", "uses", 5, from_id="a", to_id="b")]
+
+    actions = list(handler.__generate_aggregated_es_actions__(records))
+
+    edge_id = generate_es_document_id({ID_STR: "e1", TYPE_STR: "e"})
+    assert __summarise__(actions) == [edge_id, edge_id, ("a", "out"), ("b", "in")]
+    assert actions[-1]["upsert"]["entity_id"] == "b"
+
+
+def test_adjacency_of_vertex_without_records_is_emitted_with_edge_bundle(handler):
+    records = [__record__("vl", "a", "transaction", 5), __record__("e", "e1", "uses", 6, from_id="a", to_id="b"),
+               __record__("vl", "c", "transaction", 7)]
+
+    actions = list(handler.__generate_aggregated_es_actions__(records))
+
+    vertex_id, edge_id = (generate_es_document_id({ID_STR: "a", TYPE_STR: "vl"}),
+                          generate_es_document_id({ID_STR: "e1", TYPE_STR: "e"}))
+    assert __summarise__(actions) == [vertex_id, ("a", "out"), edge_id, ("b", "in"),
+                                      generate_es_document_id({ID_STR: "c", TYPE_STR: "vl"})]
+
+
+def test_deleted_document_is_kept_as_tombstone_with_stream_position(handler):
+    record = __record__("vl", "a", "transaction", 5)
+    record[DATA_STR][EVENT_ID_STR] = record[EVENT_ID_STR]
+
+    action, = handler.__delete_query__([[record[DATA_STR]]])
+
+    # Replayed changes at or before the delete are turned into a noop by the tombstone
+    assert action["_op_type"] == "update"
+    assert action["script"]["source"] == neptune_to_es_handler.DELETE_DOCUMENT_SCRIPT
+    assert (action["script"]["params"]["commit_num"], action["script"]["params"]["op_num"]) == (5, 1)
+    assert action["upsert"] == {"stream_position": {"commit_num": 5, "op_num": 1}}
+    assert 'ctx.op = "delete"' not in neptune_to_es_handler.DROP_FIELD_SCRIPT
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+
+import pytest
+
+from commons import *
+from neptune_to_es import es_helper
+from neptune_to_es.index_router import ShardRouter
+
+ROUTED_INDEX = es_helper.INDEX + "_label_uses"
+
+
+class StubIndices:
+
+    def exists_alias(self, name):
+        return False
+
+
+class StubElasticSearch:
+
+    """
+    Serves edge documents by index, id & routing. Search isn't real time, so it isn't used.
+    """
+
+    def __init__(self, routings):
+        self.indices = StubIndices()
+        self.routings = {(index, es_helper.generate_es_document_id({ID_STR: edge_id, TYPE_STR: "e"})): routing
+                         for (index, edge_id), routing in routings.items()}
+        self.mget_docs = []
+
+    def mget(self, body, index=None):
+        self.mget_docs.extend(body["docs"])
+        docs = []
+        for doc in body["docs"]:
+            routing = self.routings.get((doc["_index"], doc["_id"]))
+            doc = {"_index": doc["_index"], "_id": doc["_id"], "found": routing is not None and
+                   (routing or None) == doc.get("routing")}
+            if routing:
+                doc["_routing"] = routing
+            docs.append(doc)
+        return {"docs": docs}
+
+
+@pytest.fixture(autouse=True)
+def routed_index(monkeypatch):
+    monkeypatch.setattr(es_helper, "is_routed_by_from_vertex", lambda es_client: True)
+
+
+def __record__(record_type, edge_id, from_id=None):
+    record_data = {ID_STR: edge_id, TYPE_STR: record_type}
+    if from_id:
+        record_data[FROM_VERTEX_STR], record_data[TO_VERTEX_STR] = from_id, "b"
+    return {OPERATION_STR: "ADD", DATA_STR: record_data}
+
+
+def __action__(edge_id, index=ROUTED_INDEX):
+    return {"_index": index, "_id": es_helper.generate_es_document_id({ID_STR: edge_id, TYPE_STR: "e"})}
+
+
+def __unexpected_query__(edge_ids):
+    raise AssertionError("Neptune queried for {}".format(edge_ids))
+
+
+def test_shard_router_looks_up_edges_in_index_of_actions():
+    es_client = StubElasticSearch({(ROUTED_INDEX, "e1"): ""})
+    router = ShardRouter(es_helper.FROM_VERTEX_ROUTING, __unexpected_query__)
+    actions = [__action__("e1")]
+
+    router.route_actions(es_client, [__record__("ep", "e1")], actions)
+
+    # Edge stored with default routing in routed index keeps it
+    assert "routing" not in actions[0]
+    assert {doc["_index"] for doc in es_client.mget_docs} == {ROUTED_INDEX}
+
+
+def test_shard_router_queries_from_vertex_of_edges_not_found_without_routing():
+    es_client = StubElasticSearch({(ROUTED_INDEX, "e1"): "a"})
+    router = ShardRouter(es_helper.FROM_VERTEX_ROUTING, lambda edge_ids: {"e1": ("a", "b")})
+    actions = [__action__("e1"), __action__("e2")]
+
+    router.route_actions(es_client, [__record__("ep", "e1"), __record__("ep", "e2")], actions)
+
+    # e2 isn't in Neptune anymore, so its routing isn't known
+    assert [action.get("routing") for action in actions] == ["a", None]
+    assert router.edge_routing_cache[actions[0]["_id"]] == "a"
+
+
+def test_shard_router_takes_from_vertex_of_edge_bundle_starting_with_edge_property():
+    es_client = StubElasticSearch({})
+    router = ShardRouter(es_helper.FROM_VERTEX_ROUTING, __unexpected_query__)
+    actions = [__action__("e1", es_helper.INDEX)]
+
+    router.route_actions(es_client, [__record__("ep", "e1"), __record__("e", "e1", "a")], actions)
+
+    assert actions[0]["routing"] == "a"
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import pytest
+from elasticsearch.exceptions import ConflictError
+
+from commons import *
+from neptune_to_es import ring_tracker
+from neptune_to_es.ring_tracker import RingTracker, UnionFind
+
+
+class MemoryRingStore:
+
+    """
+    RingStore keeping union-find nodes & recompute state in memory.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.state = {"leaseKey": "test_ring_recompute", "roots": [], "lastRecomputeTime": 0}
+
+    def get_nodes(self, vertex_ids):
+        return {vertex_id: dict(self.nodes[vertex_id]) for vertex_id in vertex_ids if vertex_id in self.nodes}
+
+    def put_nodes(self, nodes):
+        for vertex_id, node in nodes.items():
+            if node["parent"] is None:
+                self.nodes.pop(vertex_id, None)
+            else:
+                self.nodes[vertex_id] = dict(node)
+
+    def get_recompute_state(self):
+        return dict(self.state)
+
+    def put_recompute_state(self, state):
+        self.state = dict(state)
+
+
+class StubElasticSearch:
+
+    """
+    Records update by query requests. Fails with version conflicts given number of times.
+    """
+
+    def __init__(self, conflicts=0):
+        self.conflicts = conflicts
+        self.update_by_queries = []
+
+    def update_by_query(self, index, body):
+        self.update_by_queries.append(body)
+        if self.conflicts:
+            self.conflicts -= 1
+            raise ConflictError(409, "version_conflict_engine_exception", {})
+
+
+def __edge__(from_id, to_id, label="relation_device", operation="ADD"):
+    return {OPERATION_STR: operation, DATA_STR: {
+        ID_STR: from_id + "-" + to_id, TYPE_STR: "e", FROM_VERTEX_STR: from_id, TO_VERTEX_STR: to_id,
+        PROPERTY_VALUE_STR: {PROPERTY_VALUE_STR: label}}}
+
+
+def __rings__(actions):
+    return sorted((action["_id"], action["script"]["params"]["ring_id"], action["script"]["params"]["ring_size"])
+                  for action in actions)
+
+
+def __document_id__(vertex_id):
+    return ring_tracker.__vertex_document_id__(vertex_id)
+
+
+def test_union_find_merges_by_size_and_compresses_paths():
+    store = MemoryRingStore()
+    union_find = UnionFind(store)
+    union_find.load(["a", "b", "c", "d"])
+
+    assert union_find.union("a", "b") == ("a", "b")
+    # Smaller ring is absorbed by larger one, whichever vertex comes first
+    assert union_find.union("c", "a") == ("a", "c")
+    assert union_find.union("b", "c") is None
+    assert union_find.nodes["a"]["size"] == 3
+    union_find.save()
+
+    union_find = UnionFind(store)
+    union_find.load(["d"])
+    union_find.nodes["a"] = {"parent": "a", "size": 3}
+    union_find.nodes.update({"b": {"parent": "a", "size": 1}, "d": {"parent": "b", "size": 1}})
+    assert union_find.find("d") == "a"
+    assert union_find.nodes["d"]["parent"] == "a"
+    assert "d" in union_find.modified
+
+
+def test_union_find_loads_ancestors():
+    store = MemoryRingStore()
+    store.nodes = {"c": {"parent": "b", "size": 1}, "b": {"parent": "a", "size": 1}, "a": {"parent": "a", "size": 3}}
+    union_find = UnionFind(store)
+    union_find.load(["c", "x"])
+    assert union_find.find("c") == "a"
+    assert union_find.nodes["x"] == {"parent": "x", "size": 1}
+
+
+def test_process_records_tracks_rings():
+    store = MemoryRingStore()
+    tracker = RingTracker("relation_device, relation_identity", store)
+    es_client = StubElasticSearch()
+
+    actions = tracker.process_records(es_client, [__edge__("t1", "d1"), __edge__("t2", "d1"),
+                                                  __edge__("t3", "x", "other")])
+    # Ring id is root vertex, which is kept from the larger or else the first ring
+    assert __rings__(actions) == sorted((__document_id__(vertex_id), "t1", 3) for vertex_id in ["t1", "t2", "d1"])
+    assert es_client.update_by_queries == []
+
+    # Removed edges mark their ring for recomputation
+    tracker.process_records(es_client, [__edge__("t2", "d1", operation="REMOVE")])
+    assert store.state["roots"] == ["t1"]
+
+
+def test_process_records_updates_members_of_merged_rings():
+    store = MemoryRingStore()
+    tracker = RingTracker("relation_device", store)
+    es_client = StubElasticSearch(conflicts=1)
+    tracker.process_records(es_client, [__edge__("t1", "d1"), __edge__("t2", "d1")])
+    tracker.process_records(es_client, [__edge__("t3", "d2")])
+    # Documents written by id are assumed searchable, so merged rings are only updated by query
+    tracker.recent_writes.clear()
+
+    actions = tracker.process_records(es_client, [__edge__("t3", "d1")])
+
+    assert __rings__(actions) == sorted((__document_id__(vertex_id), "t1", 5) for vertex_id in ["t3", "d1"])
+    # Version conflict is retried instead of leaving documents in old ring
+    assert len(es_client.update_by_queries) == 2
+    assert es_client.update_by_queries[-1]["query"] == {"terms": {"ring_id": ["t1", "t3"]}}
+    assert es_client.update_by_queries[-1]["script"]["params"] == {"ring_id": "t1", "ring_size": 5}
+
+
+def test_process_records_updates_recent_writes_by_id():
+    store = MemoryRingStore()
+    tracker = RingTracker("relation_device", store)
+    es_client = StubElasticSearch()
+    tracker.process_records(es_client, [__edge__("t1", "d1")])
+
+    actions = tracker.process_records(es_client, [__edge__("t2", "d2"), __edge__("t2", "d1")])
+
+    # t1 was written by id in previous batch & may not be visible to update by query yet
+    assert __rings__(actions) == sorted((__document_id__(vertex_id), "t2", 4) for vertex_id in ["t1", "t2", "d1", "d2"])
+
+
+def test_update_ring_members_gives_up_after_attempts():
+    tracker = RingTracker("relation_device", MemoryRingStore())
+    es_client = StubElasticSearch(conflicts=ring_tracker.RING_UPDATE_ATTEMPTS)
+    with pytest.raises(ConflictError):
+        tracker.__update_ring_members__(es_client, ["a"], "b", 2)
+    assert len(es_client.update_by_queries) == ring_tracker.RING_UPDATE_ATTEMPTS
+
+
+def test_recompute_ring_pages_members(monkeypatch):
+    store = MemoryRingStore()
+    store.nodes = {vertex_id: {"parent": "a", "size": 4 if vertex_id == "a" else 1} for vertex_id in "abcd"}
+    edges = [("a", "b"), ("c", "d")]
+    terms_sizes = []
+
+    def scan(es_client, index, query, _source):
+        filters = query["query"].get("bool", {}).get("filter")
+        if not filters:
+            return [{"_source": {"entity_id": vertex_id}} for vertex_id in "abcd"]
+        members = filters[-1]["terms"]["from_id"]
+        terms_sizes.append(len(members))
+        return [{"_source": {"from_id": from_id, "to_id": to_id}} for from_id, to_id in edges if from_id in members]
+
+    monkeypatch.setattr(ring_tracker, "scan", scan)
+    monkeypatch.setattr(ring_tracker, "RING_TERMS_BATCH_SIZE", 3)
+    tracker = RingTracker("relation_device", store)
+
+    actions = tracker.__recompute_ring__(None, "a")
+
+    assert terms_sizes == [3, 1]
+    assert __rings__(actions) == sorted([(__document_id__("a"), "a", 2), (__document_id__("b"), "a", 2),
+                                         (__document_id__("c"), "c", 2), (__document_id__("d"), "c", 2)])
+    assert store.nodes["d"]["parent"] == "c"
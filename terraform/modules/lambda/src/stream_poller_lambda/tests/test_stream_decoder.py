@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright 2023 Amazon.com, Inc. or its affiliates. All Rights served.
+SPDX-License-Identifier: MIT-0
+ 
+Permission is hereby granted, free of charge, to any person taining a copy of this
+software and associated documentation files (the oftware"), to deal in the Software
+without restriction, including without limitation the rights  use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies  the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY ND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF RCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL E AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, ETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN NNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import glob
+import json
+import os
+
+import pytest
+
+import stream_decoder
+from conftest import DATA_DIR
+from config_provider import config_provider
+from handler import AbstractHandler
+
+orjson = pytest.importorskip("orjson")
+
+SAMPLES = sorted(glob.glob(os.path.join(DATA_DIR, "*_get_records.json")))
+
+
+def canonical(decoded):
+
+    """
+    Serialises decoded response, so that responses can be compared including numeric types & NaN values.
+    """
+
+    return json.dumps(decoded, sort_keys=True)
+
+
+def read_sample(sample):
+    with open(sample, "rb") as sample_file:
+        return sample_file.read()
+
+
+@pytest.mark.parametrize("sample", SAMPLES, ids=os.path.basename)
+def test_orjson_decoder_matches_stdlib_json(sample):
+    content = read_sample(sample)
+    assert canonical(stream_decoder.OrjsonStreamDecoder().decode(content)) == canonical(json.loads(content))
+
+
+def test_wide_integers_are_decoded_exactly():
+    decoded = stream_decoder.OrjsonStreamDecoder().decode(
+        read_sample(os.path.join(DATA_DIR, "wide_numbers_get_records.json")))
+
+    values = [record["data"]["value"]["value"] for record in decoded["records"]]
+    assert values == [12345678901234567890, -9223372036854775809]
+    assert all(type(value) is int for value in values)
+    assert decoded["lastEventId"]["commitNum"] == 9007199254740993
+
+
+class FailingDecoder(stream_decoder.StreamDecoder):
+
+    def decode(self, content):
+        raise AssertionError("Response was decoded by fallback decoder")
+
+
+def test_int64_boundary_is_decoded_by_orjson():
+    decoder = stream_decoder.OrjsonStreamDecoder()
+    decoder.fallback_decoder = FailingDecoder()
+
+    decoded = decoder.decode(read_sample(os.path.join(DATA_DIR, "gremlin_get_records.json")))
+
+    assert decoded["records"][3]["data"]["value"]["value"] == 9223372036854775807
+
+
+@pytest.mark.parametrize("content, wide", [
+    (b'{"value": 18446744073709551615}', False),
+    (b'{"value": -9223372036854775808}', False),
+    (b'{"value": 18446744073709551616}', True),
+    (b'{"values": [1,-9223372036854775809]}', True),
+    (b'{"value": 12345678901234567890.5}', False),
+    (b'{"id": "12345678901234567890123", "key": "a:12345678901234567890123x"}', False)
+])
+def test_only_integers_out_of_orjson_range_are_wide(content, wide):
+    assert stream_decoder.has_wide_integer(content) == wide
+
+
+class StubHandler(AbstractHandler):
+
+    """
+    Handler instantiated by stream_records_processor on import, instead of a handler connecting to Elastic Search.
+    """
+
+    def handle_records(self, stream_log):
+        return iter([])
+
+
+class RecordingDecoder(stream_decoder.StreamDecoder):
+
+    def decode(self, content):
+        return {"decoded": content}
+
+
+class StubResponse:
+
+    status_code = 200
+    content = b'{"records": []}'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def test_set_stream_decoder_is_used_by_processor(monkeypatch):
+    monkeypatch.setattr(type(config_provider), "stream_records_handler_name",
+                        property(lambda provider: __name__ + ".StubHandler"))
+    # Processor instantiates configured handler on import, so it is only imported after handler is stubbed
+    import stream_records_processor
+
+    monkeypatch.setattr(stream_records_processor.requests, "get", lambda *args, **kwargs: StubResponse())
+    monkeypatch.setattr(stream_decoder, "stream_decoder", stream_decoder.stream_decoder)
+    stream_decoder.set_stream_decoder(RecordingDecoder())
+
+    assert stream_records_processor.StreamRecordsProcessor._make_streams_http_call({}) == \
+        {"decoded": StubResponse.content}
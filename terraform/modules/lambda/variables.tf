@@ -39,17 +39,37 @@ variable "stream_poller_additional_params" {
   type        = map(string)
   description = "(Required) Additional parameters for stream poller lambda."
   default = {
-    "NumberOfShards"          = "5"
-    "NumberOfReplica"         = "1"
-    "IgnoreMissingDocument"   = "true"
-    "ReplicationScope"        = "all"
-    "GeoLocationFields"       = ""
-    "DatatypesToExclude"      = ""
-    "PropertiesToExclude"     = ""
-    "EnableNonStringIndexing" = "true"
+    "NumberOfShards"           = "5"
+    "NumberOfReplica"          = "1"
+    "IgnoreMissingDocument"    = "true"
+    "ReplicationScope"         = "all"
+    "GeoLocationFields"        = ""
+    "DatatypesToExclude"       = ""
+    "PropertiesToExclude"      = ""
+    "EnableNonStringIndexing"  = "true"
+    "PropertyIndexProfiles"    = ""
+    "IndexVersion"             = "1"
+    "ReindexRemoveLegacyIndex" = "false"
+    "IndexRoutingRules"        = ""
+    "EdgeRouting"              = "none"
+    "EdgeEndpointBackfill"     = "true"
+    "AdjacencySummaries"       = "false"
+    "RollingAggregates"        = ""
+    "RingEdgeLabels"           = ""
+    "AlertRulesFile"           = ""
+    "FraudRulesFile"           = ""
+    "FeatureVectorFile"        = ""
+    "FingerprintRulesFile"     = ""
+    "ReplicationRulesFile"     = ""
   }
 }
 
+variable "stream_records_handler" {
+  type        = string
+  description = "(Optional) Handler used by stream poller lambda. Use neptune_to_es.neptune_gremlin_es_flattened_handler.ElasticSearchFlattenedGremlinHandler to store properties as key/value entries with a fixed mapping."
+  default     = "neptune_to_es.neptune_gremlin_es_handler.ElasticSearchGremlinHandler"
+}
+
 variable "opensearch_endpoint" {
   type        = string
   description = "(Required) OpenSearch domain-specific endpoint used to submit index, search, and data upload requests."